@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .cache import get_user_state
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that builds the user from the claims of the access token instead of loading it on every request.
+    The active flag and roles come from the cached user state rather than the token, so inactive or deleted users are refused and changed roles apply before the token expires.
+    Only the id, email and role flags are loaded on the returned user. Any other field is fetched from the database when it is first read.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        state = get_user_state(user_id)
+        if state is None:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+        is_active, is_staff, is_superuser = state
+        if not is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+
+        loaded = {
+            "id": user_id,
+            "is_active": is_active,
+            "is_staff": is_staff,
+            "is_superuser": is_superuser,
+        }
+        # tokens issued before the email claim load it lazily
+        if "email" in validated_token:
+            loaded["email"] = validated_token["email"]
+
+        user_model = get_user_model()
+        # from_db expects the values in the order of the model's fields
+        field_names = [
+            field.attname
+            for field in user_model._meta.concrete_fields
+            if field.attname in loaded
+        ]
+        user = user_model.from_db(
+            DEFAULT_DB_ALIAS, field_names, [loaded[name] for name in field_names]
+        )
+        return user
@@ -0,0 +1,131 @@
+"""
+Redis copy of the refresh token blacklist, and compaction of the token tables.
+
+Blacklisted jtis are kept in a sorted set scored by the expiry of their token, so checking a token is a single ZSCORE and expired entries are dropped by score.
+The set is only trusted once a full load from the database has set the ready marker. Until then, e.g. after Redis lost its data, tokens are checked against the database as before.
+"""
+
+import logging
+
+from django.conf import settings
+from redis.exceptions import RedisError
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+from rest_framework_simplejwt.utils import aware_utcnow
+
+from cargotracker.UTILS.redis_utils import get_redis_connection
+
+
+logger = logging.getLogger(__name__)
+
+BLACKLIST_KEY = "auth:blacklist"
+READY_KEY = "auth:blacklist:ready"
+
+
+def blacklist_ready():
+    return bool(get_redis_connection().exists(READY_KEY))
+
+
+def is_blacklisted(jti):
+    """
+    Return whether the token with this jti is blacklisted, from Redis when its copy is complete.
+    """
+
+    try:
+        pipeline = get_redis_connection().pipeline()
+        pipeline.exists(READY_KEY)
+        pipeline.zscore(BLACKLIST_KEY, jti)
+        ready, score = pipeline.execute()
+        if ready:
+            return score is not None
+    except RedisError:
+        logger.exception("Could not read the token blacklist.")
+
+    return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+
+def add_to_blacklist(jti, expires_at):
+    """
+    Add a token that was just blacklisted in the database to the Redis copy.
+    """
+
+    try:
+        get_redis_connection().zadd(BLACKLIST_KEY, {jti: expires_at.timestamp()})
+    except RedisError:
+        logger.exception("Could not add a token to the blacklist.")
+        # the copy misses this token now, so stop trusting it until it is reloaded
+        try:
+            get_redis_connection().delete(READY_KEY)
+        except RedisError:
+            logger.exception("Could not reset the token blacklist.")
+
+
+def load_blacklist(chunk_size=None):
+    """
+    Copy every blacklisted token that has not expired yet to Redis, a chunk at a time, then mark the copy ready.
+    Tokens blacklisted meanwhile are added by `add_to_blacklist`, so nothing is missed.
+    Return the number of tokens copied.
+    """
+
+    chunk_size = chunk_size or settings.TOKEN_BLACKLIST["CHUNK_SIZE"]
+    connection = get_redis_connection()
+    tokens = (
+        BlacklistedToken.objects.filter(token__expires_at__gt=aware_utcnow())
+        .order_by("id")
+        .values_list("id", "token__jti", "token__expires_at")
+    )
+
+    loaded = 0
+    last_id = 0
+    while True:
+        chunk = list(tokens.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        connection.zadd(
+            BLACKLIST_KEY,
+            {jti: expires_at.timestamp() for _, jti, expires_at in chunk},
+        )
+        loaded += len(chunk)
+        last_id = chunk[-1][0]
+
+    connection.set(READY_KEY, 1)
+    return loaded
+
+
+def purge_expired_tokens(chunk_size=None):
+    """
+    Delete the outstanding tokens that have expired, along with their blacklist entries, a chunk at a time so that no transaction holds many locks for long.
+    Expired tokens are rejected for their expiry alone, so their blacklist entries are not needed anymore. Return the number of tokens deleted.
+    """
+
+    chunk_size = chunk_size or settings.TOKEN_BLACKLIST["CHUNK_SIZE"]
+    now = aware_utcnow()
+
+    deleted = 0
+    while True:
+        ids = list(
+            OutstandingToken.objects.filter(expires_at__lte=now)
+            .order_by("id")
+            .values_list("id", flat=True)[:chunk_size]
+        )
+        if not ids:
+            break
+        BlacklistedToken.objects.filter(token_id__in=ids).delete()
+        OutstandingToken.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+
+    try:
+        get_redis_connection().zremrangebyscore(BLACKLIST_KEY, "-inf", now.timestamp())
+    except RedisError:
+        logger.exception("Could not drop expired tokens from the blacklist.")
+    return deleted
+
+
+def reset_blacklist():
+    """
+    Drop the Redis copy. Tokens are checked against the database until it is loaded again.
+    """
+
+    get_redis_connection().delete(READY_KEY, BLACKLIST_KEY)
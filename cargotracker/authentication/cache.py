@@ -0,0 +1,95 @@
+"""
+Short-lived copies of each user's active flag and roles, kept in Redis.
+
+Authentication trusts the claims of access tokens instead of loading the user, and checks them against this state so that deactivated users and changed roles are noticed long before their tokens expire.
+A state is loaded from the database on a miss and dropped whenever its user is saved or deleted. Changes that bypass `save()` show up after at most `STATE_TTL` seconds.
+"""
+
+import logging
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from redis.exceptions import RedisError
+
+from cargotracker.UTILS.redis_utils import get_redis_connection
+
+
+logger = logging.getLogger(__name__)
+
+STATE_KEY = "auth:user:{user_id}"
+
+STATE_FIELDS = ("is_active", "is_staff", "is_superuser")
+
+# cached for users that do not exist (anymore), so a deleted user's tokens do not query every time
+MISSING = b"-"
+
+
+def encode_state(state):
+    if state is None:
+        return MISSING
+    return "".join("1" if flag else "0" for flag in state).encode()
+
+
+def decode_state(value):
+    if value == MISSING:
+        return None
+    return tuple(flag == "1" for flag in value.decode())
+
+
+def load_user_state(user_id):
+    """
+    Return the `(is_active, is_staff, is_superuser)` flags of a user from the database, or None if there is no such user.
+    """
+
+    return (
+        get_user_model()
+        .objects.filter(id=user_id)
+        .values_list(*STATE_FIELDS)
+        .first()
+    )
+
+
+def get_user_state(user_id):
+    """
+    Return the `(is_active, is_staff, is_superuser)` flags of a user, or None if there is no such user.
+    The database is only read on a cache miss, or when Redis cannot be reached.
+    """
+
+    key = STATE_KEY.format(user_id=user_id)
+    try:
+        value = get_redis_connection().get(key)
+    except RedisError:
+        logger.exception("Could not read the user state cache.")
+        return load_user_state(user_id)
+    if value is not None:
+        return decode_state(value)
+
+    state = load_user_state(user_id)
+    try:
+        get_redis_connection().set(
+            key, encode_state(state), ex=settings.CLAIMS_AUTH["STATE_TTL"]
+        )
+    except RedisError:
+        logger.exception("Could not write to the user state cache.")
+    return state
+
+
+def invalidate_user_state(user_id):
+    """
+    Drop the cached state of a user.
+    """
+
+    try:
+        get_redis_connection().delete(STATE_KEY.format(user_id=user_id))
+    except RedisError:
+        logger.exception("Could not invalidate the user state cache.")
+
+
+def invalidate_user_state_on_commit(user_id):
+    """
+    Invalidate right away and again once the current transaction commits, since the old state may be cached again in between.
+    """
+
+    invalidate_user_state(user_id)
+    transaction.on_commit(lambda: invalidate_user_state(user_id))
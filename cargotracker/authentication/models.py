@@ -1,9 +1,11 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import IntegrityError
 from django.conf import settings
 
 from cargotracker.UTILS.tasks import send_async_email
+from .cache import invalidate_user_state_on_commit
 
 
 class UserManager(BaseUserManager):
@@ -48,6 +50,7 @@ class UserManager(BaseUserManager):
         subject = "Account Created Succesfully."
         message = f"Hi. Your branch agent account was succesfully created. Your login credentials are: Email: {kwargs.get('email')} . Password: {kwargs.get('password')}."
 
+        # the message holds the password, so it is not stored in the notification outbox
         send_async_email(
             subject=subject, message=message, sender=sender, recepients=[agent_email,]
         )
@@ -70,10 +73,18 @@ class UserManager(BaseUserManager):
         Attempt to find the first user with the matching arguments.
         """
 
-        qs = User.objects.filter(**kwargs)
-        if qs.exists():
-            return qs.first()
-        return None
+        return User.objects.filter(**kwargs).first()
+
+    def get_emails_by_id(self, ids):
+        """
+        Resolve many user ids to their email addresses with a single query.
+        Return a dictionary of `{id: email}`. Unknown ids are left out.
+        """
+
+        ids = {user_id for user_id in ids if user_id is not None}
+        if not ids:
+            return {}
+        return dict(User.objects.filter(id__in=ids).values_list("id", "email"))
 
 
 class User(AbstractUser):
@@ -87,3 +98,15 @@ class User(AbstractUser):
     USERNAME_FIELD = "email"
 
     REQUIRED_FIELDS = []
+
+
+def user_changed_receiver(sender, instance, *args, **kwargs):
+    """
+    Authentication caches the active flag and roles of users, so drop them whenever a user changes.
+    """
+
+    invalidate_user_state_on_commit(instance.id)
+
+
+post_save.connect(user_changed_receiver, sender=User)
+post_delete.connect(user_changed_receiver, sender=User)
@@ -1,7 +1,12 @@
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework import serializers
 
 from .models import User
+from .tokens import CachedRefreshToken
 
 
 class UserLoginSerializer(TokenObtainPairSerializer):
@@ -12,15 +17,40 @@ class UserLoginSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
         """
-        Override this method to ensure that the email address is encoded within the JWT token.
+        Override this method to ensure that the email address and roles are encoded within the JWT token.
+        Authentication builds the user from these claims instead of loading it.
         """
         token = super().get_token(user)
 
         token["email"] = user.email
+        token["is_staff"] = user.is_staff
+        token["is_superuser"] = user.is_superuser
 
         return token
 
 
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh serializer that checks the refresh token against the Redis copy of the blacklist.
+    """
+
+    def validate(self, attrs):
+        refresh = CachedRefreshToken(attrs["refresh"])
+
+        data = {"access": str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+
+            refresh.set_jti()
+            refresh.set_exp()
+
+            data["refresh"] = str(refresh)
+
+        return data
+
 class UserRegistrationSerializer(serializers.ModelSerializer):
     """
     The serializer class that validates and saves user data before registration
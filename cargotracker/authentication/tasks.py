@@ -0,0 +1,23 @@
+from huey import crontab
+from huey.contrib.djhuey import db_periodic_task
+
+from .blacklist import blacklist_ready, load_blacklist, purge_expired_tokens
+
+
+@db_periodic_task(crontab(minute="0"))
+def purge_expired_tokens_task():
+    """
+    Delete expired outstanding and blacklisted tokens, so the token tables stop growing.
+    """
+
+    return purge_expired_tokens()
+
+
+@db_periodic_task(crontab(minute="*/5"))
+def load_token_blacklist():
+    """
+    Copy the blacklist to Redis when the copy is missing, e.g. after Redis lost its data.
+    """
+
+    if not blacklist_ready():
+        return load_blacklist()
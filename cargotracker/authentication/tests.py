@@ -1,3 +1,233 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.test import override_settings
+from django.urls import reverse
+from redis.exceptions import RedisError
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+from branches.registry import registry
+from cargotracker.UTILS.testing import TEST_PASSWORD, CargoTrackerTestCase
+from .blacklist import (
+    BLACKLIST_KEY,
+    load_blacklist,
+    purge_expired_tokens,
+)
+from .cache import STATE_KEY
+from .throttles import get_throttle_stats, take_token
+
+
+class ClaimsJWTAuthenticationTestCase(CargoTrackerTestCase):
+    """
+    Requests are authenticated from the claims of the access token and a cached copy of the user's state.
+    """
+
+    def setUp(self):
+        super().setUp()
+        # logging in looks up the agent's branch
+        registry.get_index()
+
+    def login(self, user):
+        response = self.client.post(
+            reverse("auth:login"),
+            {"email": user.email, "password": TEST_PASSWORD},
+            format="json",
+        )
+        token = response.data["data"]["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        return AccessToken(token)
+
+    def get_cargo_list(self):
+        return self.client.get(reverse("cargo:create-cargo"))
+
+    def test_tokens_carry_roles(self):
+        token = self.login(self.agent)
+
+        self.assertEqual(token["email"], self.agent.email)
+        self.assertTrue(token["is_staff"])
+        self.assertFalse(token["is_superuser"])
+        # branches can be reassigned before the token expires, so they are looked up instead
+        self.assertNotIn("branch_id", token)
+
+    def test_cached_state_saves_the_user_lookup(self):
+        self.login(self.agent)
+
+        with self.assertNumQueries(3):
+            # the user's state is loaded once
+            self.assertEqual(self.get_cargo_list().status_code, 200)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get_cargo_list().status_code, 200)
+        self.assertIsNotNone(self.redis.get(STATE_KEY.format(user_id=self.agent.id)))
+
+    def test_deactivated_users_are_refused(self):
+        self.login(self.sender)
+        self.get_cargo_list()
+
+        self.sender.is_active = False
+        self.sender.save()
+
+        response = self.get_cargo_list()
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data["code"], "user_inactive")
+
+    def test_role_changes_apply_before_the_token_expires(self):
+        self.login(self.agent)
+        self.get_cargo_list()
+
+        self.agent.is_staff = False
+        self.agent.save()
+
+        response = self.client.post(reverse("cargo:create-cargo"), {}, format="json")
+        self.assertEqual(response.status_code, 403)
+
+    def test_falls_back_to_the_database_without_redis(self):
+        self.login(self.sender)
+
+        with mock.patch.object(self.redis, "get", side_effect=RedisError):
+            with self.assertLogs("authentication.cache", "ERROR"):
+                self.assertEqual(self.get_cargo_list().status_code, 200)
+
+
+class TokenBlacklistTestCase(CargoTrackerTestCase):
+    """
+    Blacklisted refresh tokens are looked up in Redis, and expired tokens are purged.
+    """
+
+    def logout(self):
+        tokens = self.client.post(
+            reverse("auth:login"),
+            {"email": self.sender.email, "password": TEST_PASSWORD},
+            format="json",
+        ).data["data"]
+        self.client.post(
+            reverse("auth:logout"),
+            {"refresh": tokens["refresh"]},
+            HTTP_AUTHORIZATION=f"Bearer {tokens['access']}",
+        )
+        return tokens["refresh"]
+
+    def refresh(self, refresh):
+        return self.client.post(reverse("auth:refresh_token"), {"refresh": refresh})
+
+    def expired_token(self, blacklisted=False):
+        token = RefreshToken.for_user(self.sender)
+        OutstandingToken.objects.filter(jti=token["jti"]).update(
+            expires_at=aware_utcnow() - timedelta(minutes=1)
+        )
+        if blacklisted:
+            BlacklistedToken.objects.create(
+                token=OutstandingToken.objects.get(jti=token["jti"])
+            )
+        return token["jti"]
+
+    def test_refresh_checks_the_blacklist_in_redis(self):
+        load_blacklist()
+        refresh = self.logout()
+
+        with self.assertNumQueries(0):
+            response = self.refresh(refresh)
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.redis.zcard(BLACKLIST_KEY), 1)
+
+    @override_settings(QUERY_BUDGET={**settings.QUERY_BUDGET, "MODE": "log"})
+    def test_refresh_uses_the_database_until_the_blacklist_is_loaded(self):
+        refresh = self.logout()
+        self.redis.flushall()
+
+        # the database lookup puts the request over its budget
+        with self.assertLogs("cargotracker.UTILS.middleware", "WARNING"):
+            self.assertEqual(self.refresh(refresh).status_code, 401)
+
+        self.assertEqual(load_blacklist(), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.refresh(refresh).status_code, 401)
+
+    @override_settings(TOKEN_BLACKLIST={"CHUNK_SIZE": 2})
+    def test_expired_tokens_are_purged_in_chunks(self):
+        expired = [self.expired_token(blacklisted=index % 2 == 0) for index in range(5)]
+        self.redis.zadd(BLACKLIST_KEY, {expired[0]: 0})
+        active = RefreshToken.for_user(self.sender)
+
+        self.assertEqual(purge_expired_tokens(), 5)
+
+        self.assertEqual(
+            list(OutstandingToken.objects.values_list("jti", flat=True)), [active["jti"]]
+        )
+        self.assertFalse(BlacklistedToken.objects.exists())
+        self.assertEqual(self.redis.zcard(BLACKLIST_KEY), 0)
+
+
+THROTTLED_REST_FRAMEWORK = {
+    **settings.REST_FRAMEWORK,
+    "DEFAULT_THROTTLE_RATES": {
+        **settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"],
+        "login_ip": "3/min",
+        "login_email": "2/min",
+    },
+}
+
+
+@override_settings(REST_FRAMEWORK=THROTTLED_REST_FRAMEWORK)
+class LoginThrottleTestCase(CargoTrackerTestCase):
+    """
+    Logins are throttled per client IP and per email before any password is hashed.
+    """
+
+    def login(self, email, ip="10.0.0.1", password="wrongpassword"):
+        return self.client.post(
+            reverse("auth:login"),
+            {"email": email, "password": password},
+            format="json",
+            HTTP_X_FORWARDED_FOR=ip,
+        )
+
+    def test_rejections_skip_password_hashing(self):
+        for _ in range(2):
+            self.login(self.sender.email)
+
+        with mock.patch("rest_framework_simplejwt.serializers.authenticate") as authenticate:
+            with self.assertNumQueries(0):
+                response = self.login(self.sender.email, password=TEST_PASSWORD)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+        authenticate.assert_not_called()
+        self.assertEqual(get_throttle_stats(), {"login_email": 1})
+
+    def test_each_client_ip_has_its_own_bucket(self):
+        for index in range(3):
+            self.login(f"nobody{index}@example.com")
+
+        self.assertEqual(self.login("nobody@example.com").status_code, 429)
+        response = self.login(self.sender.email, ip="10.0.0.2", password=TEST_PASSWORD)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_throttle_stats(), {"login_ip": 1})
+
+    def test_guesses_from_many_ips_are_throttled_per_email(self):
+        for index in range(2):
+            self.login(self.sender.email, ip=f"10.0.1.{index}")
+
+        response = self.login(self.sender.email, ip="10.0.1.99")
+
+        self.assertEqual(response.status_code, 429)
+
+    def test_buckets_refill_over_time(self):
+        self.assertEqual(take_token("bucket", 2, 1, now=100), (True, None))
+        self.assertEqual(take_token("bucket", 2, 1, now=100), (True, None))
+        self.assertEqual(take_token("bucket", 2, 1, now=100.5), (False, 0.5))
+        self.assertEqual(take_token("bucket", 2, 1, now=101), (True, None))
+
+    def test_logins_are_let_through_without_redis(self):
+        with mock.patch.object(self.redis, "pipeline", side_effect=RedisError):
+            with self.assertLogs("authentication.throttles", "ERROR"):
+                for _ in range(4):
+                    response = self.login(self.sender.email, password=TEST_PASSWORD)
+
+        self.assertEqual(response.status_code, 200)
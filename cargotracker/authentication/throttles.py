@@ -0,0 +1,157 @@
+"""
+Token bucket throttles that keep password hashing from being flooded.
+
+DRF checks throttles before the view runs, so a rejected login or registration costs a couple of Redis round trips instead of a PBKDF2 hash.
+Every scope takes a DRF rate like `20/min` from `DEFAULT_THROTTLE_RATES`: a bucket holds up to 20 tokens and refills at 20 a minute, so clients can burst up to the limit and then keep the average rate.
+"""
+
+import logging
+import time
+
+from redis import WatchError
+from redis.exceptions import RedisError
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from cargotracker.UTILS.redis_utils import get_redis_connection
+
+
+logger = logging.getLogger(__name__)
+
+BUCKET_KEY = "throttle:{scope}:{ident}"
+THROTTLED_KEY = "throttle:throttled"
+
+
+def take_token(key, capacity, refill_rate, now=None):
+    """
+    Take a token from the bucket at `key`, refilled at `refill_rate` tokens per second up to `capacity`.
+    Return whether there was one, and how many seconds until the next one otherwise.
+    The bucket is read and written under WATCH, so concurrent requests cannot spend the same token. Rejections do not write anything.
+    """
+
+    now = time.time() if now is None else now
+    with get_redis_connection().pipeline() as pipeline:
+        while True:
+            try:
+                pipeline.watch(key)
+                tokens, updated_at = pipeline.hmget(key, "tokens", "updated_at")
+                if tokens is None:
+                    tokens = capacity
+                else:
+                    elapsed = max(now - float(updated_at), 0)
+                    tokens = min(capacity, float(tokens) + elapsed * refill_rate)
+
+                if tokens < 1:
+                    pipeline.unwatch()
+                    return False, (1 - tokens) / refill_rate
+
+                pipeline.multi()
+                pipeline.hmset(key, {"tokens": tokens - 1, "updated_at": now})
+                # an idle bucket is full again by then, so it can be dropped
+                pipeline.expire(key, int(capacity / refill_rate) + 1)
+                pipeline.execute()
+                return True, None
+            except WatchError:
+                continue
+
+
+def record_throttled(scope):
+    try:
+        get_redis_connection().hincrby(THROTTLED_KEY, scope, 1)
+    except RedisError:
+        logger.exception("Could not count a throttled request.")
+
+
+def get_throttle_stats():
+    """
+    Return the number of requests throttled so far in each scope.
+    """
+
+    return {
+        scope.decode(): int(count)
+        for scope, count in get_redis_connection().hgetall(THROTTLED_KEY).items()
+    }
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Throttle requests with a token bucket per scope and identity, kept in Redis.
+    Requests are let through when Redis cannot be reached, since refusing every login would be worse.
+    """
+
+    def get_rate(self):
+        # read at every request rather than at import, so the rates follow the settings
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def get_ident_key(self, request):
+        """
+        Return the identity to throttle this request by, or None to let it through.
+        """
+
+        raise NotImplementedError
+
+    def get_cache_key(self, request, view):
+        ident = self.get_ident_key(request)
+        if ident is None:
+            return None
+        return BUCKET_KEY.format(scope=self.scope, ident=ident)
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+
+        try:
+            allowed, self.retry_after = take_token(
+                key, self.num_requests, self.num_requests / self.duration
+            )
+        except RedisError:
+            logger.exception("Could not check the %s throttle.", self.scope)
+            return True
+
+        if not allowed:
+            record_throttled(self.scope)
+        return allowed
+
+    def wait(self):
+        return self.retry_after
+
+
+class IPThrottle(TokenBucketThrottle):
+    """
+    Throttle by client IP address, as forwarded by `NUM_PROXIES` proxies.
+    """
+
+    def get_ident_key(self, request):
+        return self.get_ident(request)
+
+
+class EmailThrottle(TokenBucketThrottle):
+    """
+    Throttle by the email address a request is about, whichever client sends it.
+    """
+
+    def get_ident_key(self, request):
+        email = request.data.get("email") if hasattr(request.data, "get") else None
+        if not isinstance(email, str) or not email.strip():
+            return None
+        return email.strip().lower()
+
+
+class LoginIPThrottle(IPThrottle):
+    scope = "login_ip"
+
+
+class LoginEmailThrottle(EmailThrottle):
+    scope = "login_email"
+
+
+class RegisterIPThrottle(IPThrottle):
+    scope = "register_ip"
+
+
+class RegisterEmailThrottle(EmailThrottle):
+    scope = "register_email"
@@ -0,0 +1,23 @@
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .blacklist import add_to_blacklist, is_blacklisted
+
+
+class CachedRefreshToken(RefreshToken):
+    """
+    Refresh token that is checked against the Redis copy of the blacklist instead of the database.
+    """
+
+    def check_blacklist(self):
+        if is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError("Token is blacklisted")
+
+    def blacklist(self):
+        result = super().blacklist()
+        add_to_blacklist(
+            self.payload[api_settings.JTI_CLAIM], datetime_from_epoch(self.payload["exp"])
+        )
+        return result
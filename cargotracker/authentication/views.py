@@ -1,6 +1,5 @@
 from django.shortcuts import render, reverse
-from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
 from rest_framework import status
 from rest_framework.response import Response
@@ -8,12 +7,20 @@ from rest_framework.decorators import api_view
 from rest_framework.generics import CreateAPIView
 
 from .serializers import (
+    CachedTokenRefreshSerializer,
     UserLoginSerializer,
     AgentRegistrationSerializer,
     UserRegistrationSerializer,
 )
 from cargotracker.UTILS.auth_utils import get_authentication_tokens_from_request
 from authentication.permissions import IsSuperUser
+from .throttles import (
+    LoginEmailThrottle,
+    LoginIPThrottle,
+    RegisterEmailThrottle,
+    RegisterIPThrottle,
+)
+from .tokens import CachedRefreshToken
 
 
 class UserLoginView(TokenObtainPairView):
@@ -22,6 +29,7 @@ class UserLoginView(TokenObtainPairView):
     """
 
     serializer_class = UserLoginSerializer
+    throttle_classes = [LoginIPThrottle, LoginEmailThrottle]
 
     def post(self, request, *args, **kwargs):
         # This only contains token information and no useful information to user
@@ -36,6 +44,14 @@ class UserLoginView(TokenObtainPairView):
         return Response(payload, status=status.HTTP_200_OK)
 
 
+class CachedTokenRefreshView(TokenRefreshView):
+    """
+    Refresh access tokens without looking up the blacklist in the database.
+    """
+
+    serializer_class = CachedTokenRefreshSerializer
+
+
 @api_view(["POST"])
 def logout_view(request):
     """
@@ -44,7 +60,7 @@ def logout_view(request):
 
     try:
         auth_tokens = get_authentication_tokens_from_request(request)
-        refresh_token_instance = RefreshToken(auth_tokens.get("refresh"))
+        refresh_token_instance = CachedRefreshToken(auth_tokens.get("refresh"))
         refresh_token_instance.blacklist()
 
         next_url = request.query_params.get("next") if request.query_params else ""
@@ -70,6 +86,7 @@ class UserRegisterAPIView(CreateAPIView):
     """
 
     serializer_class = UserRegistrationSerializer
+    throttle_classes = [RegisterIPThrottle, RegisterEmailThrottle]
 
     def create(self, request, *args, **kwargs):
         """
@@ -1,6 +1,8 @@
 from django.contrib import admin
 
-from .models import Branch
+from .models import Branch, BranchOrderSummary, Lane
 
 # Register your models here.
 admin.site.register(Branch)
+admin.site.register(Lane)
+admin.site.register(BranchOrderSummary)
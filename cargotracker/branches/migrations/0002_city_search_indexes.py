@@ -0,0 +1,39 @@
+# Generated by Django 2.2.7 on 2026-10-18 13:40
+
+from django.db import migrations
+
+
+def create_search_indexes(apps, schema_editor):
+    """
+    Index lower(city) for trigram similarity and for prefix matches. Only Postgres has them, other databases search the branch registry.
+    """
+
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS branches_branch_city_trgm "
+        "ON branches_branch USING gin (lower(city) gin_trgm_ops)"
+    )
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS branches_branch_city_prefix "
+        "ON branches_branch (lower(city) text_pattern_ops)"
+    )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS branches_branch_city_trgm")
+    schema_editor.execute("DROP INDEX IF EXISTS branches_branch_city_prefix")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.7 on 2026-10-18 14:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0002_city_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Lane',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transit_time', models.DurationField()),
+                ('cost', models.DecimalField(decimal_places=3, default=0, max_digits=9)),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbound_lanes', to='branches.Branch')),
+                ('origin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbound_lanes', to='branches.Branch')),
+            ],
+            options={
+                'unique_together': {('origin', 'destination')},
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 2.2.7 on 2026-10-18 17:40
+
+from decimal import Decimal
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_order_summaries(apps, schema_editor):
+    """
+    Count the existing orders at their booking stations and destinations, so the counters start out right.
+    """
+
+    Order = apps.get_model("orders", "Order")
+    BranchOrderSummary = apps.get_model("branches", "BranchOrderSummary")
+    counts = {}
+    for field in ("cargo__booking_station_id", "cargo__destination_id"):
+        rows = (
+            Order.objects.filter(cargo__isnull=False)
+            .values_list(field, "status")
+            .annotate(orders=models.Count("id"), weight=models.Sum("cargo__weight"))
+            .order_by()
+        )
+        for branch_id, status, orders, weight in rows:
+            count, total = counts.get((branch_id, status), (0, 0))
+            # sqlite sums decimals as floats
+            weight = Decimal(weight or 0).quantize(Decimal("0.01"))
+            counts[(branch_id, status)] = (count + orders, total + weight)
+
+    BranchOrderSummary.objects.bulk_create(
+        [
+            BranchOrderSummary(branch_id=branch_id, status=status, orders=orders, weight=weight)
+            for (branch_id, status), (orders, weight) in counts.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0003_lane'),
+        ('orders', '0007_order_created_at_lane_transit_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BranchOrderSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=1)),
+                ('orders', models.IntegerField(default=0)),
+                ('weight', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_summaries', to='branches.Branch')),
+            ],
+            options={
+                'unique_together': {('branch', 'status')},
+            },
+        ),
+        migrations.RunPython(fill_order_summaries, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,16 @@
-from django.db import models, IntegrityError
+from decimal import Decimal
+
+from django.apps import apps
+from django.db import connection, models, transaction, IntegrityError
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models.functions import Lower
+from django.db.models.signals import post_delete, post_save
+
+from .registry import invalidate_branches, normalize_query, registry
+from .routing import invalidate_routes
+
+Q = models.Q
 
 
 class BranchManager(models.Manager):
@@ -12,10 +23,16 @@ class BranchManager(models.Manager):
         Get the agent's branch. If the agent does not have a branch, return None.
         """
 
-        qs = Branch.objects.filter(branch_agent=agent)
-        if qs.exists():
-            return qs.first()
-        return None
+        if agent is None:
+            return None
+        return registry.get_by_agent(agent.id)
+
+    def get_main_branch(self):
+        """
+        Return the main branch, or None if there is none yet.
+        """
+
+        return registry.get_main_branch()
 
     def create_branch(self, city=None, main_branch=False, branch_agent=None):
         """
@@ -36,7 +53,7 @@ class BranchManager(models.Manager):
         if not city:
             raise TypeError("Branches must have a city")
 
-        if main_branch and self.model.objects.filter(main_branch=True).exists():
+        if main_branch and self.get_main_branch():
             raise TypeError("There can only be one main branch.")
 
         try:
@@ -54,7 +71,35 @@ class BranchManager(models.Manager):
         """
         if not city:
             return None
-        return self.model.objects.get_queryset().filter(city__icontains=city)
+        return self.search_by_city(city)
+
+    def search_by_city(self, query, limit=10):
+        """
+        Return up to `limit` branches whose city starts with the query, best matches first.
+        On Postgres, cities that merely resemble the query are found too, through the trigram and prefix indexes on `lower(city)`.
+        Other databases search the prefix trie of the branch registry instead.
+        """
+
+        query = normalize_query(query)
+        if not query:
+            return []
+        if connection.vendor != "postgresql":
+            return registry.search(query, limit)
+
+        prefix_match = models.Case(
+            models.When(city_lower__startswith=query, then=models.Value(1)),
+            default=models.Value(0),
+            output_field=models.IntegerField(),
+        )
+        return list(
+            self.model.objects.annotate(city_lower=Lower("city"))
+            .filter(Q(city_lower__startswith=query) | Q(city_lower__trigram_similar=query))
+            .annotate(
+                prefix_match=prefix_match,
+                similarity=TrigramSimilarity("city_lower", query),
+            )
+            .order_by("-prefix_match", "-similarity", "city")[:limit]
+        )
 
     def search_by_city_exact(self, city):
         """
@@ -62,10 +107,7 @@ class BranchManager(models.Manager):
         """
         if not city:
             return None
-        qs = self.model.objects.get_queryset().filter(city=city)
-        if not qs.exists():
-            return None
-        return qs.first()
+        return registry.get_by_city(city)
 
 
 class Branch(models.Model):
@@ -87,3 +129,183 @@ class Branch(models.Model):
         """
 
         return f"{self.city}"
+
+
+def branch_changed_receiver(sender, instance, *args, **kwargs):
+    """
+    Every worker keeps the branches in memory, so have them reload.
+    """
+
+    invalidate_branches()
+
+
+post_save.connect(branch_changed_receiver, sender=Branch)
+post_delete.connect(branch_changed_receiver, sender=Branch)
+
+
+class Lane(models.Model):
+    """
+    A direct connection parcels travel on from one branch to another. Lanes are one way.
+    """
+
+    origin = models.ForeignKey(
+        Branch, on_delete=models.CASCADE, related_name="outbound_lanes"
+    )
+    destination = models.ForeignKey(
+        Branch, on_delete=models.CASCADE, related_name="inbound_lanes"
+    )
+    transit_time = models.DurationField()
+    cost = models.DecimalField(max_digits=9, decimal_places=3, default=0)
+
+    class Meta:
+        unique_together = [("origin", "destination")]
+
+    def __str__(self):
+        return f"{self.origin} -> {self.destination}"
+
+
+def lane_changed_receiver(sender, instance, *args, **kwargs):
+    """
+    Routes are computed from the lanes, so have every worker recompute them.
+    """
+
+    invalidate_routes()
+
+
+post_save.connect(lane_changed_receiver, sender=Lane)
+post_delete.connect(lane_changed_receiver, sender=Lane)
+
+
+class BranchOrderSummaryManager(models.Manager):
+    """
+    Manager for the order counters of the branches.
+    """
+
+    def apply(self, changes):
+        """
+        Add `(branch_id, status, orders, weight)` changes to the counters, in the transaction that changed the orders.
+        Counters are only ever moved with F() expressions, so concurrent changes add up instead of overwriting each other.
+        Changes of the same size share one UPDATE.
+        """
+
+        totals = {}
+        for branch_id, status, orders, weight in changes:
+            count, total = totals.get((branch_id, status), (0, 0))
+            totals[(branch_id, status)] = (count + orders, total + weight)
+        totals = {key: values for key, values in totals.items() if any(values)}
+        if not totals:
+            return
+
+        # the first order of a branch and status creates its row
+        self.bulk_create(
+            [self.model(branch_id=branch_id, status=status) for branch_id, status in totals],
+            ignore_conflicts=True,
+        )
+
+        keys_by_change = {}
+        for key, values in totals.items():
+            keys_by_change.setdefault(values, []).append(key)
+        for (orders, weight), keys in keys_by_change.items():
+            matching = Q()
+            for branch_id, status in keys:
+                matching |= Q(branch_id=branch_id, status=status)
+            self.filter(matching).update(
+                orders=models.F("orders") + orders, weight=models.F("weight") + weight
+            )
+
+    def count_orders(self):
+        """
+        Return `{(branch_id, status): (orders, weight)}` counted from the orders themselves, with one grouped query per branch role.
+        """
+
+        order_model = apps.get_model("orders", "Order")
+        counts = {}
+        for field in ("cargo__booking_station_id", "cargo__destination_id"):
+            rows = (
+                order_model.objects.filter(cargo__isnull=False)
+                .values_list(field, "status")
+                .annotate(orders=models.Count("id"), weight=models.Sum("cargo__weight"))
+                .order_by()
+            )
+            for branch_id, status, orders, weight in rows:
+                count, total = counts.get((branch_id, status), (0, 0))
+                # sqlite sums decimals as floats
+                weight = Decimal(weight or 0).quantize(Decimal("0.01"))
+                counts[(branch_id, status)] = (count + orders, total + weight)
+        return counts
+
+    def reconcile(self, dry_run=False):
+        """
+        Compare the counters with counts of the orders, and replace them all with the counts unless `dry_run`.
+        Return `{(branch_id, status): (counted, stored)}` of the counters that had drifted.
+        The counters are locked meanwhile, so orders changed at the same time are added on top of the counts.
+        """
+
+        with transaction.atomic():
+            stored = {
+                (branch_id, status): (orders, weight)
+                for branch_id, status, orders, weight in self.select_for_update().values_list(
+                    "branch_id", "status", "orders", "weight"
+                )
+            }
+            counted = self.count_orders()
+            drift = {}
+            for key in counted.keys() | stored.keys():
+                values = counted.get(key, (0, 0)), stored.get(key, (0, 0))
+                if values[0] != values[1]:
+                    drift[key] = values
+
+            if drift and not dry_run:
+                self.all().delete()
+                self.bulk_create(
+                    [
+                        self.model(branch_id=branch_id, status=status, orders=orders, weight=weight)
+                        for (branch_id, status), (orders, weight) in counted.items()
+                    ]
+                )
+        return drift
+
+    def for_branch(self, branch_id):
+        """
+        Return `{status: (orders, weight)}` of a branch.
+        """
+
+        return {
+            status: (orders, weight)
+            for status, orders, weight in self.filter(branch_id=branch_id).values_list(
+                "status", "orders", "weight"
+            )
+        }
+
+
+class BranchOrderSummary(models.Model):
+    """
+    The number and total weight of the orders of each status that are booked at or headed to a branch.
+    """
+
+    branch = models.ForeignKey(
+        Branch, on_delete=models.CASCADE, related_name="order_summaries"
+    )
+    status = models.CharField(max_length=1)
+    orders = models.IntegerField(default=0)
+    weight = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    objects = BranchOrderSummaryManager()
+
+    class Meta:
+        unique_together = [("branch", "status")]
+
+    def __str__(self):
+        return f"{self.branch} {self.status}: {self.orders} orders, {self.weight}"
+
+
+def order_summary_changes(booking_station_id, destination_id, status, weight, orders=1):
+    """
+    Return the counter changes of adding `orders` orders of a cargo, or of removing them when negative.
+    An order counts towards both its booking station and its destination.
+    """
+
+    return [
+        (booking_station_id, status, orders, weight * orders),
+        (destination_id, status, orders, weight * orders),
+    ]
@@ -0,0 +1,238 @@
+"""
+Process-local registry of branches.
+
+Branches hardly ever change, so every worker keeps all of them in memory and looks them up by city, by agent or as the main branch without a query.
+Saving or deleting a branch bumps a version key in Redis. Workers compare their version with it at most every `CHECK_INTERVAL` seconds and reload when it moved.
+Cities can also be searched by prefix from a trie, for databases without trigram indexes.
+"""
+
+import logging
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from redis.exceptions import RedisError
+
+from cargotracker.UTILS.redis_utils import get_redis_connection
+
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "branches:version"
+
+FIELDS = ("id", "city", "branch_agent_id", "main_branch")
+
+# most results any city search returns
+MAX_SEARCH_RESULTS = 50
+
+
+def normalize_query(query):
+    """
+    Lowercase a city search and collapse its whitespace.
+    """
+
+    return " ".join(str(query or "").lower().split())
+
+
+def common_prefix_length(first, second):
+    length = 0
+    for first_char, second_char in zip(first, second):
+        if first_char != second_char:
+            break
+        length += 1
+    return length
+
+
+# key of the matches in each trie node, which is never a character of a city
+MATCHES = ""
+
+
+class CityTrie:
+    """
+    Prefix trie over every city, and over every later word of it, so "west" finds "Nairobi West".
+    Each node keeps the best ranked rows below it, so a search only walks the query.
+    Rows are ranked by whether the whole city matched rather than one of its later words, then by length, so exact matches come first.
+    """
+
+    def __init__(self, rows, limit=MAX_SEARCH_RESULTS):
+        self.root = {MATCHES: []}
+
+        entries = []
+        for row in rows:
+            city = normalize_query(row[1])
+            words = city.split(" ")
+            for position in range(len(words)):
+                rank = (position > 0, len(city), city)
+                entries.append((rank, " ".join(words[position:]), row))
+
+        # inserting the best ranked rows first keeps every node's matches in order
+        inserted = {}
+        for _, key, row in sorted(entries, key=lambda entry: entry[0]):
+            # the nodes along a prefix shared with a key inserted before already hold this row
+            shared = 0
+            if row[0] in inserted:
+                shared = max(
+                    common_prefix_length(key, other) for other in inserted[row[0]]
+                )
+                inserted[row[0]].append(key)
+            else:
+                inserted[row[0]] = [key]
+
+            node = self.root
+            for depth, char in enumerate(key, 1):
+                child = node.get(char)
+                if child is None:
+                    child = node[char] = {MATCHES: []}
+                node = child
+                matches = node[MATCHES]
+                if depth > shared and len(matches) < limit:
+                    matches.append(row)
+
+    def search(self, query, limit):
+        node = self.root
+        for char in normalize_query(query):
+            node = node.get(char)
+            if node is None:
+                return []
+        return node[MATCHES][:limit]
+
+
+class BranchIndex:
+    """
+    Branch rows keyed by id, by city and by agent id, plus the main branch row.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.by_id = {row[0]: row for row in rows}
+        self.by_city = {row[1]: row for row in rows}
+        self.by_agent = {row[2]: row for row in rows}
+        self.main_branch = next((row for row in rows if row[3]), None)
+        self.trie = None
+
+    def search(self, query, limit):
+        # built on the first search, since most workers never search
+        if self.trie is None:
+            self.trie = CityTrie(self.rows)
+        return self.trie.search(query, limit)
+
+
+class BranchRegistry:
+    """
+    All branches of this process, loaded lazily.
+    Lookups return fresh Branch instances, so nothing a caller caches on them is shared with other requests.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+        self.version = None
+        self.checked_at = 0.0
+
+    def current_version(self):
+        """
+        Return the shared version, or None when Redis cannot be reached.
+        """
+
+        try:
+            return int(get_redis_connection().get(VERSION_KEY) or 0)
+        except RedisError:
+            logger.exception("Could not read the branch registry version.")
+            return None
+
+    def get_index(self):
+        """
+        Return the current index, reloading it first if it is missing or stale.
+        """
+
+        # branches changed by the current transaction are not cached, since it may still roll back
+        if waiting_for_commit(bump_version):
+            return self.load()
+
+        now = time.monotonic()
+        index = self.index
+        interval = settings.BRANCH_REGISTRY["CHECK_INTERVAL"]
+        if index is not None and now - self.checked_at < interval:
+            return index
+
+        with self.lock:
+            # read the version before the rows, so a change in between is caught by the next check
+            version = self.current_version()
+            if self.index is None or version is None or version != self.version:
+                self.index = self.load()
+                self.version = version
+            self.checked_at = now
+            return self.index
+
+    def load(self):
+        branch_model = apps.get_model("branches", "Branch")
+        return BranchIndex(list(branch_model.objects.order_by("id").values_list(*FIELDS)))
+
+    def invalidate(self):
+        """
+        Drop the branches of this process. They are reloaded on the next lookup.
+        """
+
+        self.index = None
+
+    def build(self, row):
+        if row is None:
+            return None
+        branch_model = apps.get_model("branches", "Branch")
+        return branch_model.from_db(DEFAULT_DB_ALIAS, FIELDS, row)
+
+    def get_by_id(self, branch_id):
+        return self.build(self.get_index().by_id.get(branch_id))
+
+    def get_by_city(self, city):
+        return self.build(self.get_index().by_city.get(city))
+
+    def get_by_agent(self, agent_id):
+        return self.build(self.get_index().by_agent.get(agent_id))
+
+    def get_main_branch(self):
+        return self.build(self.get_index().main_branch)
+
+    def all(self):
+        return [self.build(row) for row in self.get_index().rows]
+
+    def search(self, query, limit):
+        return [self.build(row) for row in self.get_index().search(query, limit)]
+
+
+registry = BranchRegistry()
+
+
+def waiting_for_commit(func):
+    """
+    Return whether `func` is waiting for the current transaction to commit. Django drops it when the transaction, or the savepoint it was registered in, rolls back.
+    """
+
+    connection = transaction.get_connection()
+    return connection.in_atomic_block and any(
+        callback is func for _, callback in connection.run_on_commit
+    )
+
+
+def bump_version():
+    """
+    Invalidate the branches of this process and tell the other workers to reload theirs.
+    """
+
+    registry.invalidate()
+    try:
+        get_redis_connection().incr(VERSION_KEY)
+    except RedisError:
+        logger.exception("Could not bump the branch registry version.")
+
+
+def invalidate_branches():
+    """
+    Reload the branches in this process right away, and everywhere once the current transaction commits.
+    Until then this transaction reads its own branches without caching them, so a rollback leaves nothing behind.
+    """
+
+    registry.invalidate()
+    transaction.on_commit(bump_version)
@@ -0,0 +1,362 @@
+"""
+Routes through the network of lanes between branches.
+
+Routes are the fastest way from one branch to another over the lanes, and the cheapest of those.
+The fastest routes towards a destination form a tree, so a single row holding the next branch towards it from every other branch is enough to follow any route there, leg by leg.
+A periodic task precomputes the rows of every destination and packs them into a Redis hash, at two bytes per branch. Workers keep the lanes and the rows they used recently in memory, and compute a missing row themselves with one Dijkstra search.
+Changing a lane bumps a version key in Redis, which workers check at most every `CHECK_INTERVAL` seconds like the branch registry.
+"""
+
+import heapq
+import logging
+import threading
+import time
+from array import array
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from redis.exceptions import RedisError
+
+from cargotracker.UTILS.redis_utils import get_redis_connection
+from .registry import waiting_for_commit
+
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "routing:version"
+TABLE_KEY = "routing:table:{version}"
+# version of the last table that was stored whole
+BUILT_KEY = "routing:built"
+
+# lane weights compare transit seconds first, then cost in thousandths
+COST_SCALE = 10 ** 15
+
+# rows stored per round trip when building the table
+BUILD_CHUNK_SIZE = 500
+
+
+class StaleRoutes(Exception):
+    """
+    A row does not match the lanes it is followed with.
+    """
+
+
+class Route(namedtuple("Route", ["stops", "offsets", "cost"])):
+    """
+    The branch ids from the origin to the destination, the transit time from the origin to each of them, and the total cost of the lanes.
+    """
+
+    __slots__ = ()
+
+    @property
+    def legs(self):
+        return list(zip(self.stops, self.stops[1:]))
+
+    @property
+    def transit_time(self):
+        return self.offsets[-1]
+
+    def time_to(self, branch_id):
+        """
+        Return the transit time from the origin to a branch on the route, or None if the route does not go through it.
+        """
+
+        if branch_id not in self.stops:
+            return None
+        return self.offsets[self.stops.index(branch_id)]
+
+
+class LaneGraph:
+    """
+    The lanes of one version of the network.
+    Branches with lanes are numbered by their position in `ids`, and rows hold these positions.
+    """
+
+    def __init__(self, lanes, version=None):
+        """
+        :args:
+        lanes - `(origin_id, destination_id, transit_time, cost)` rows
+        version - the network version the lanes were read at, or None when Redis cannot be reached
+        """
+
+        self.version = version
+        self.ids = sorted({lane[0] for lane in lanes} | {lane[1] for lane in lanes})
+        self.positions = {branch_id: position for position, branch_id in enumerate(self.ids)}
+        self.lanes = {
+            (origin, destination): (transit_time, cost)
+            for origin, destination, transit_time, cost in lanes
+        }
+
+        # searches run from the destination, along the lanes into each branch
+        self.inbound = [[] for _ in self.ids]
+        for origin, destination, transit_time, cost in lanes:
+            weight = int(transit_time.total_seconds()) * COST_SCALE + int(
+                Decimal(cost).scaleb(3)
+            )
+            self.inbound[self.positions[destination]].append(
+                (self.positions[origin], weight)
+            )
+
+        # the largest value of the row type marks branches without a route
+        self.typecode = "H" if len(self.ids) < 2 ** 16 - 1 else "I"
+        self.no_route = 2 ** (8 * array(self.typecode).itemsize) - 1
+        self.rows = OrderedDict()
+
+    def next_hops(self, destination):
+        """
+        Return the row of the branch at position `destination`: the position of the next branch towards it from every branch.
+        """
+
+        hops = array(self.typecode, [self.no_route]) * len(self.ids)
+        hops[destination] = destination
+        distances = [None] * len(self.ids)
+        distances[destination] = 0
+
+        heap = [(0, destination)]
+        inbound = self.inbound
+        while heap:
+            distance, position = heapq.heappop(heap)
+            if distance > distances[position]:
+                continue
+            for origin, weight in inbound[position]:
+                candidate = distance + weight
+                known = distances[origin]
+                if known is None or candidate < known:
+                    distances[origin] = candidate
+                    hops[origin] = position
+                    heapq.heappush(heap, (candidate, origin))
+        return hops
+
+    def follow(self, hops, origin_id, destination_id):
+        """
+        Follow a row from `origin_id` to the destination it belongs to, and return the Route, or None if there is none.
+        """
+
+        position = self.positions[origin_id]
+        destination = self.positions[destination_id]
+        stops = [origin_id]
+        offsets = [timedelta(0)]
+        cost = Decimal("0.000")
+        while position != destination:
+            position = hops[position]
+            if position == self.no_route:
+                return None
+            if position >= len(self.ids) or len(stops) > len(self.ids):
+                raise StaleRoutes()
+
+            lane = self.lanes.get((stops[-1], self.ids[position]))
+            if lane is None:
+                raise StaleRoutes()
+            stops.append(self.ids[position])
+            offsets.append(offsets[-1] + lane[0])
+            cost += lane[1]
+
+        return Route(tuple(stops), tuple(offsets), cost)
+
+
+def load_graph(version):
+    lane_model = apps.get_model("branches", "Lane")
+    return LaneGraph(
+        list(
+            lane_model.objects.order_by("id").values_list(
+                "origin_id", "destination_id", "transit_time", "cost"
+            )
+        ),
+        version,
+    )
+
+
+class Router:
+    """
+    Route lookups of this process. The lanes are loaded lazily, and rows are read from Redis or computed on first use.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.graph = None
+        self.checked_at = 0.0
+
+    def current_version(self):
+        """
+        Return the shared version, or None when Redis cannot be reached.
+        """
+
+        try:
+            return int(get_redis_connection().get(VERSION_KEY) or 0)
+        except RedisError:
+            logger.exception("Could not read the routing version.")
+            return None
+
+    def get_graph(self):
+        """
+        Return the current lanes, reloading them first if they are missing or stale.
+        """
+
+        # lanes changed by the current transaction are not cached, and their routes not read from the shared table
+        if waiting_for_commit(bump_version):
+            return load_graph(None)
+
+        now = time.monotonic()
+        graph = self.graph
+        interval = settings.ROUTING["CHECK_INTERVAL"]
+        if graph is not None and now - self.checked_at < interval:
+            return graph
+
+        with self.lock:
+            # read the version before the lanes, so a change in between is caught by the next check
+            version = self.current_version()
+            if self.graph is None or version is None or version != self.graph.version:
+                self.graph = load_graph(version)
+            self.checked_at = now
+            return self.graph
+
+    def invalidate(self):
+        """
+        Drop the lanes and rows of this process. They are reloaded on the next lookup.
+        """
+
+        self.graph = None
+
+    def read_row(self, graph, destination_id):
+        """
+        Return the stored row of a destination, or None if Redis does not have it.
+        """
+
+        if graph.version is None:
+            return None
+        try:
+            packed = get_redis_connection().hget(
+                TABLE_KEY.format(version=graph.version), destination_id
+            )
+        except RedisError:
+            logger.exception("Could not read a routing table row.")
+            return None
+
+        if packed is None:
+            return None
+        hops = array(graph.typecode)
+        hops.frombytes(packed)
+        return hops if len(hops) == len(graph.ids) else None
+
+    def write_row(self, graph, destination_id, hops):
+        if graph.version is None:
+            return
+        key = TABLE_KEY.format(version=graph.version)
+        try:
+            pipeline = get_redis_connection().pipeline()
+            pipeline.hset(key, destination_id, hops.tobytes())
+            pipeline.expire(key, settings.ROUTING["TABLE_TTL"])
+            pipeline.execute()
+        except RedisError:
+            logger.exception("Could not store a routing table row.")
+
+    def get_row(self, graph, destination_id, refresh=False):
+        """
+        Return the row of a destination from memory, from Redis or computed, in that order. `refresh` computes it again.
+        """
+
+        with self.lock:
+            hops = None if refresh else graph.rows.get(destination_id)
+            if hops is not None:
+                graph.rows.move_to_end(destination_id)
+                return hops
+
+        hops = None if refresh else self.read_row(graph, destination_id)
+        if hops is None:
+            hops = graph.next_hops(graph.positions[destination_id])
+            self.write_row(graph, destination_id, hops)
+
+        with self.lock:
+            graph.rows[destination_id] = hops
+            while len(graph.rows) > settings.ROUTING["CACHED_ROWS"]:
+                graph.rows.popitem(last=False)
+        return hops
+
+    def route(self, origin_id, destination_id):
+        """
+        Return the Route from one branch to another, or None if no lanes connect them.
+        """
+
+        if origin_id == destination_id:
+            return Route((origin_id,), (timedelta(0),), Decimal("0.000"))
+
+        graph = self.get_graph()
+        if origin_id not in graph.positions or destination_id not in graph.positions:
+            return None
+
+        try:
+            return graph.follow(
+                self.get_row(graph, destination_id), origin_id, destination_id
+            )
+        except StaleRoutes:
+            # stored while the lanes were changing, so compute it from the lanes of this process
+            return graph.follow(
+                self.get_row(graph, destination_id, refresh=True),
+                origin_id,
+                destination_id,
+            )
+
+
+router = Router()
+
+
+def build_routing_table(version=None):
+    """
+    Compute the rows of every destination at the current version and store them in Redis, `BUILD_CHUNK_SIZE` at a time, then drop the table of the previous build.
+    Return the number of rows stored.
+    """
+
+    connection = get_redis_connection()
+    version = int(connection.get(VERSION_KEY) or 0) if version is None else version
+    graph = load_graph(version)
+    key = TABLE_KEY.format(version=version)
+
+    rows = {}
+    for position, destination_id in enumerate(graph.ids):
+        rows[destination_id] = graph.next_hops(position).tobytes()
+        if len(rows) == BUILD_CHUNK_SIZE:
+            connection.hmset(key, rows)
+            rows = {}
+    if rows:
+        connection.hmset(key, rows)
+    connection.expire(key, settings.ROUTING["TABLE_TTL"])
+
+    previous = connection.getset(BUILT_KEY, version)
+    if previous is not None and int(previous) != version:
+        connection.delete(TABLE_KEY.format(version=int(previous)))
+    return len(graph.ids)
+
+
+def routing_table_built():
+    """
+    Return whether the table of the current version was stored whole.
+    """
+
+    connection = get_redis_connection()
+    return connection.get(BUILT_KEY) == (connection.get(VERSION_KEY) or b"0")
+
+
+def bump_version():
+    """
+    Invalidate the routes of this process and tell the other workers to reload theirs.
+    """
+
+    router.invalidate()
+    try:
+        get_redis_connection().incr(VERSION_KEY)
+    except RedisError:
+        logger.exception("Could not bump the routing version.")
+
+
+def invalidate_routes():
+    """
+    Reload the lanes in this process right away, and everywhere once the current transaction commits.
+    Until then this transaction reads its own lanes without caching them, so a rollback leaves nothing behind.
+    """
+
+    router.invalidate()
+    transaction.on_commit(bump_version)
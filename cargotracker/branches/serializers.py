@@ -1,7 +1,8 @@
 from rest_framework import serializers
 from django.conf import settings
+from django.db import transaction
 
-from cargotracker.UTILS.tasks import send_async_email
+from notifications.models import Notification
 from .models import Branch
 from cargotracker.UTILS.validators import validate_that_email_belongs_to_active_agent
 
@@ -29,20 +30,31 @@ class BranchSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         try:
-            response = Branch.objects.create_branch(**validated_data)
-
-            branch_agent = validated_data.get("branch_agent")
-            subject = "Branch Assigned."
-            message = f"Hello {branch_agent.username}, CargoTracker just opened a new branch in {response.city} and you have been assigned as the branch manager there. You can log in and process all orders passing through your branch."
-            send_async_email(
-                subject=subject,
-                message=message,
-                sender=settings.ADMIN_EMAIL,
-                recepients=[branch_agent.email,],
-            )
+            with transaction.atomic():
+                response = Branch.objects.create_branch(**validated_data)
+
+                branch_agent = validated_data.get("branch_agent")
+                subject = "Branch Assigned."
+                message = f"Hello {branch_agent.username}, CargoTracker just opened a new branch in {response.city} and you have been assigned as the branch manager there. You can log in and process all orders passing through your branch."
+                Notification.objects.enqueue(
+                    subject=subject,
+                    message=message,
+                    sender=settings.ADMIN_EMAIL,
+                    recepients=[branch_agent.email,],
+                )
             return response
 
         except TypeError as e:
             raise serializers.ValidationError(
                 {"errors": {"detail": e.args[0], "code": "invalid"}}
             ) from e
+
+
+class BranchSearchSerializer(serializers.ModelSerializer):
+    """
+    The fields a city picker needs from each search result.
+    """
+
+    class Meta:
+        model = Branch
+        fields = ["id", "city", "main_branch"]
@@ -0,0 +1,16 @@
+from huey import crontab
+from huey.contrib.djhuey import db_periodic_task, lock_task
+
+from .routing import build_routing_table, routing_table_built
+
+
+@db_periodic_task(crontab(minute="*"))
+@lock_task("build-routing-table")
+def build_routing_table_task():
+    """
+    Precompute the routes between all branches whenever the lanes changed, or Redis lost them.
+    Until then, workers compute the routes they need themselves.
+    """
+
+    if not routing_table_built():
+        return build_routing_table()
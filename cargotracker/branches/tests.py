@@ -1,3 +1,356 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from django.core.management import call_command
+
+from cargotracker.UTILS.testing import CargoTrackerTestCase, create_branch, create_cargo
+from orders.models import Order
+from .models import Branch, BranchOrderSummary, Lane
+from .registry import VERSION_KEY, bump_version, registry
+from .routing import LaneGraph, router, routing_table_built
+from .tasks import build_routing_table_task
+
+
+class BranchRegistryTestCase(CargoTrackerTestCase):
+    """
+    Branch lookups are served from memory and reloaded when any worker changes a branch.
+    """
+
+    def test_lookups_do_not_query_once_loaded(self):
+        registry.get_index()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                Branch.objects.search_by_city_exact("Mombasa"), self.branch
+            )
+            self.assertEqual(
+                Branch.objects.get_agent_branch(agent=self.agent), self.main_branch
+            )
+            self.assertEqual(Branch.objects.get_main_branch(), self.main_branch)
+            self.assertIsNone(Branch.objects.search_by_city_exact("Atlantis"))
+
+    def test_saving_a_branch_reloads_this_worker(self):
+        registry.get_index()
+
+        create_branch("Eldoret")
+
+        self.assertEqual(Branch.objects.search_by_city_exact("Eldoret").city, "Eldoret")
+
+    @override_settings(BRANCH_REGISTRY={"CHECK_INTERVAL": 0})
+    def test_a_bumped_version_reloads_other_workers(self):
+        registry.get_index()
+        # a change made by another worker, which only shows up as a new version
+        Branch.objects.filter(id=self.branch.id).update(city="Malindi")
+        self.assertIsNotNone(Branch.objects.search_by_city_exact("Mombasa"))
+
+        self.redis.incr(VERSION_KEY)
+
+        self.assertIsNone(Branch.objects.search_by_city_exact("Mombasa"))
+        self.assertEqual(Branch.objects.search_by_city_exact("Malindi"), self.branch)
+
+    def test_rolled_back_branches_are_not_cached(self):
+        registry.get_index()
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            create_branch("Eldoret")
+            # the transaction sees its own branch
+            self.assertEqual(Branch.objects.search_by_city_exact("Eldoret").city, "Eldoret")
+            raise RuntimeError()
+
+        self.assertIsNone(Branch.objects.search_by_city_exact("Eldoret"))
+        self.assertIsNone(self.redis.get(VERSION_KEY))
+        with self.assertNumQueries(0):
+            Branch.objects.search_by_city_exact("Mombasa")
+
+    def test_bumping_the_version_invalidates_this_worker(self):
+        registry.get_index()
+
+        bump_version()
+
+        self.assertEqual(int(self.redis.get(VERSION_KEY)), 1)
+        self.assertIsNone(registry.index)
+
+    def test_booking_cargo_resolves_branches_from_memory(self):
+        registry.get_index()
+        self.client.force_authenticate(self.agent)
+        data = {
+            "title": "Parcel",
+            "weight": "10.00",
+            "sender": self.sender.email,
+            "recepient": self.recepient.email,
+            "destination": self.branch.city,
+            "booking_station": self.main_branch.city,
+        }
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("cargo:create-cargo"), data, format="json"
+            )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(
+            any('FROM "branches_branch"' in query["sql"] for query in queries)
+        )
+
+
+class BranchSearchTestCase(CargoTrackerTestCase):
+    """
+    Cities are autocompleted from the prefix trie of the branch registry outside Postgres.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        create_branch("Nairobi West")
+        create_branch("Naivasha")
+
+    def search(self, **params):
+        return self.client.get(reverse("branches:search-branches"), params)
+
+    def test_whole_cities_rank_before_later_words(self):
+        cities = [branch.city for branch in Branch.objects.search_by_city(" NAI ")]
+
+        self.assertEqual(cities, ["Nairobi", "Naivasha", "Nairobi West"])
+        self.assertEqual(
+            [branch.city for branch in Branch.objects.search_by_city("west")],
+            ["Nairobi West"],
+        )
+        self.assertEqual(Branch.objects.search_by_city("nairobi w")[0].city, "Nairobi West")
+        self.assertEqual(Branch.objects.search_by_city("atlantis"), [])
+
+    def test_search_does_not_query_once_loaded(self):
+        registry.get_index()
+
+        with self.assertNumQueries(0):
+            response = self.search(q="mom")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["data"],
+            [{"id": self.branch.id, "city": "Mombasa", "main_branch": False}],
+        )
+
+    def test_new_branches_are_searchable(self):
+        Branch.objects.search_by_city("mom")
+
+        create_branch("Momela")
+
+        self.assertEqual(
+            [branch.city for branch in Branch.objects.search_by_city("mom")],
+            ["Momela", "Mombasa"],
+        )
+
+    def test_query_and_limit_are_validated(self):
+        self.assertEqual(self.search(q="nai", limit=2).data["data"][1]["city"], "Naivasha")
+        self.assertEqual(self.search(q=" ").status_code, 400)
+        self.assertEqual(self.search(q="nai", limit=0).status_code, 400)
+        self.assertEqual(self.search(q="nai", limit="all").status_code, 400)
+
+
+class RoutingTestCase(CargoTrackerTestCase):
+    """
+    Routes are the fastest over the lanes, then the cheapest, and are precomputed into Redis for every worker.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.nakuru = create_branch("Nakuru")
+        for origin, destination, hours, cost in [
+            (cls.branch, cls.main_branch, 6, 10),
+            (cls.main_branch, cls.other_branch, 5, 8),
+            (cls.branch, cls.other_branch, 14, 5),
+        ]:
+            Lane.objects.create(
+                origin=origin,
+                destination=destination,
+                transit_time=timedelta(hours=hours),
+                cost=cost,
+            )
+
+    def test_fastest_route_is_taken(self):
+        route = router.route(self.branch.id, self.other_branch.id)
+
+        self.assertEqual(
+            route.legs,
+            [(self.branch.id, self.main_branch.id), (self.main_branch.id, self.other_branch.id)],
+        )
+        self.assertEqual(route.transit_time, timedelta(hours=11))
+        self.assertEqual(route.time_to(self.main_branch.id), timedelta(hours=6))
+        self.assertIsNone(route.time_to(self.nakuru.id))
+        self.assertEqual(route.cost, Decimal("18.000"))
+        # lanes are one way
+        self.assertIsNone(router.route(self.other_branch.id, self.branch.id))
+        self.assertIsNone(router.route(self.nakuru.id, self.branch.id))
+
+    def test_cheapest_of_the_fastest_routes_is_taken(self):
+        Lane.objects.create(
+            origin=self.branch, destination=self.nakuru, transit_time=timedelta(hours=3), cost=1
+        )
+        Lane.objects.create(
+            origin=self.nakuru,
+            destination=self.other_branch,
+            transit_time=timedelta(hours=8),
+            cost=1,
+        )
+
+        route = router.route(self.branch.id, self.other_branch.id)
+
+        self.assertEqual(route.stops, (self.branch.id, self.nakuru.id, self.other_branch.id))
+        self.assertEqual(route.cost, Decimal("2.000"))
+
+    def test_changed_lanes_reroute(self):
+        router.route(self.branch.id, self.other_branch.id)
+
+        Lane.objects.filter(destination=self.main_branch).delete()
+
+        route = router.route(self.branch.id, self.other_branch.id)
+        self.assertEqual(route.stops, (self.branch.id, self.other_branch.id))
+        self.assertEqual(route.transit_time, timedelta(hours=14))
+
+    def test_rolled_back_lanes_are_not_cached(self):
+        router.route(self.branch.id, self.other_branch.id)
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Lane.objects.create(
+                origin=self.other_branch,
+                destination=self.branch,
+                transit_time=timedelta(hours=1),
+                cost=1,
+            )
+            self.assertIsNotNone(router.route(self.other_branch.id, self.branch.id))
+            raise RuntimeError()
+
+        self.assertIsNone(router.route(self.other_branch.id, self.branch.id))
+
+    def test_precomputed_routes_are_read_from_redis(self):
+        self.assertFalse(routing_table_built())
+        build_routing_table_task()
+        self.assertTrue(routing_table_built())
+
+        with mock.patch.object(LaneGraph, "next_hops") as next_hops:
+            with self.assertNumQueries(1):
+                route = router.route(self.branch.id, self.other_branch.id)
+                router.route(self.main_branch.id, self.other_branch.id)
+
+        next_hops.assert_not_called()
+        self.assertEqual(route.transit_time, timedelta(hours=11))
+
+    def test_stale_rows_are_computed_again(self):
+        build_routing_table_task()
+        # a row stored by a worker that saw other lanes
+        graph = router.get_graph()
+        row = graph.next_hops(graph.positions[self.other_branch.id])
+        row[graph.positions[self.branch.id]] = graph.positions[self.branch.id]
+        router.write_row(graph, self.other_branch.id, row)
+        router.invalidate()
+
+        route = router.route(self.branch.id, self.other_branch.id)
+
+        self.assertEqual(route.transit_time, timedelta(hours=11))
+
+
+class BranchOrderSummaryTestCase(CargoTrackerTestCase):
+    """
+    Each order is counted at its booking station and at its destination, as it is booked, moves along and is deleted.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.cargo = create_cargo(
+            self.sender, self.recepient, self.main_branch, self.branch, weight=Decimal("12.50")
+        )
+        self.order, _ = Order.objects.get_or_create_order(
+            cargo=self.cargo, price_per_unit_weight=2.5
+        )
+
+    def assertCounters(self, branch, expected):
+        counters = BranchOrderSummary.objects.for_branch(branch.id)
+        self.assertEqual(
+            {status: value for status, value in counters.items() if value[0]}, expected
+        )
+
+    def test_new_orders_are_counted_at_both_stations(self):
+        self.assertCounters(self.main_branch, {"P": (1, Decimal("12.50"))})
+        self.assertCounters(self.branch, {"P": (1, Decimal("12.50"))})
+        self.assertCounters(self.other_branch, {})
+
+    def test_status_changes_move_the_order(self):
+        self.order.status = "T"
+        self.order.save()
+
+        self.assertCounters(self.main_branch, {"T": (1, Decimal("12.50"))})
+        self.assertCounters(self.branch, {"T": (1, Decimal("12.50"))})
+
+    def test_cargo_changes_move_the_order(self):
+        self.cargo.destination = self.other_branch
+        self.cargo.weight = Decimal("20.00")
+        self.cargo.save()
+
+        self.assertCounters(self.main_branch, {"P": (1, Decimal("20.00"))})
+        self.assertCounters(self.branch, {})
+        self.assertCounters(self.other_branch, {"P": (1, Decimal("20.00"))})
+
+    def test_deleted_orders_are_not_counted(self):
+        self.order.delete()
+
+        self.assertCounters(self.main_branch, {})
+        self.assertCounters(self.branch, {})
+
+    def test_orders_of_deleted_cargo_are_not_counted(self):
+        self.cargo.delete()
+
+        self.assertCounters(self.main_branch, {})
+        self.assertCounters(self.branch, {})
+        self.assertEqual(BranchOrderSummary.objects.reconcile(dry_run=True), {})
+
+        # the order is left without cargo, and deleting it changes nothing
+        Order.objects.get(id=self.order.id).delete()
+
+        self.assertCounters(self.main_branch, {})
+        self.assertEqual(BranchOrderSummary.objects.reconcile(dry_run=True), {})
+
+    def test_reconcile_rebuilds_drifted_counters(self):
+        BranchOrderSummary.objects.filter(branch=self.branch).update(orders=7)
+
+        self.assertEqual(
+            BranchOrderSummary.objects.reconcile(dry_run=True),
+            {(self.branch.id, "P"): ((1, Decimal("12.50")), (7, Decimal("12.50")))},
+        )
+        self.assertCounters(self.branch, {"P": (7, Decimal("12.50"))})
+
+        call_command("reconcile_branch_summaries", stdout=mock.Mock())
+
+        self.assertCounters(self.branch, {"P": (1, Decimal("12.50"))})
+        self.assertEqual(BranchOrderSummary.objects.reconcile(), {})
+
+    def test_summary_endpoint(self):
+        url = reverse("branches:branch-summary", kwargs={"id": self.main_branch.id})
+
+        self.client.force_authenticate(self.agent)
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()["data"]
+        self.assertEqual(data["branch"], "Nairobi")
+        self.assertEqual(data["orders"], 1)
+        self.assertEqual(data["weight"], "12.50")
+        self.assertEqual(data["statuses"]["pending"], {"orders": 1, "weight": "12.50"})
+        self.assertEqual(data["statuses"]["delivered"], {"orders": 0, "weight": "0.00"})
+
+    def test_summary_endpoint_is_limited_to_the_branch_agent(self):
+        url = reverse("branches:branch-summary", kwargs={"id": self.branch.id})
+
+        self.client.force_authenticate(self.agent)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        missing = reverse("branches:branch-summary", kwargs={"id": 9999})
+        self.assertEqual(self.client.get(missing).status_code, 404)
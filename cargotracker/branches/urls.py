@@ -1,7 +1,9 @@
 from django.urls import path
 
-from .views import ListCreateBranchAPIView
+from .views import BranchSearchAPIView, BranchSummaryAPIView, ListCreateBranchAPIView
 
 urlpatterns = [
+    path("search/", BranchSearchAPIView.as_view(), name="search-branches"),
+    path("<int:id>/summary/", BranchSummaryAPIView.as_view(), name="branch-summary"),
     path("", ListCreateBranchAPIView.as_view(), name="create-branch"),
 ]
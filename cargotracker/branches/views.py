@@ -1,11 +1,16 @@
+from decimal import Decimal
+
 from django.shortcuts import render
-from rest_framework.generics import ListCreateAPIView
+from rest_framework.generics import GenericAPIView, ListCreateAPIView
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 
 from authentication.permissions import IsSuperUserOrReadOnly
-from .serializers import BranchSerializer
-from .models import Branch
+from orders.models import Order
+from .serializers import BranchSearchSerializer, BranchSerializer
+from .models import Branch, BranchOrderSummary
+from .registry import MAX_SEARCH_RESULTS, registry
 
 
 class ListCreateBranchAPIView(ListCreateAPIView):
@@ -15,7 +20,7 @@ class ListCreateBranchAPIView(ListCreateAPIView):
 
     permission_classes = [IsSuperUserOrReadOnly]
     serializer_class = BranchSerializer
-    queryset = Branch.objects.all()
+    queryset = Branch.objects.select_related("branch_agent")
 
     def create(self, request, *args, **kwargs):
         """
@@ -28,3 +33,72 @@ class ListCreateBranchAPIView(ListCreateAPIView):
         payload["data"]["message"] = "Successfuly created the branch!"
 
         return Response(payload, status=status.HTTP_201_CREATED)
+
+
+class BranchSearchAPIView(GenericAPIView):
+    """
+    Autocomplete cities for branch pickers, e.g. `?q=nai&limit=5`. Cities starting with the query come first.
+    """
+
+    permission_classes = [IsSuperUserOrReadOnly]
+    serializer_class = BranchSearchSerializer
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get("q", "")
+        if not query.strip():
+            return Response(
+                {"errors": {"q": "Provide part of a city to search for."}},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            limit = int(request.query_params.get("limit", 10))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= MAX_SEARCH_RESULTS:
+            message = f"The limit must be a number from 1 to {MAX_SEARCH_RESULTS}."
+            return Response(
+                {"errors": {"limit": message}}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        branches = Branch.objects.search_by_city(query, limit=limit)
+        return Response({"data": self.get_serializer(branches, many=True).data})
+
+
+class BranchSummaryAPIView(GenericAPIView):
+    """
+    Count the orders of each status booked at or headed to a branch, with their total weight. Agents can see the summary of their own branch.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        """
+        Read the counters of the branch, one row per status.
+        """
+
+        branch = registry.get_by_id(kwargs.get("id"))
+        if branch is None:
+            return Response(
+                {"errors": {"branch": "We could not find that branch."}},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        if not (request.user.is_superuser or branch.branch_agent_id == request.user.id):
+            return Response(
+                {"errors": {"detail": "You can only see the summary of your branch."}},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        counters = BranchOrderSummary.objects.for_branch(branch.id)
+        statuses = {}
+        for code, name in Order.STATUS_CHOICES:
+            orders, weight = counters.get(code, (0, Decimal("0.00")))
+            statuses[name] = {"orders": orders, "weight": str(weight)}
+
+        payload = {
+            "branch": branch.city,
+            "statuses": statuses,
+            "orders": sum(orders for orders, _ in counters.values()),
+            "weight": str(sum((weight for _, weight in counters.values()), Decimal("0.00"))),
+        }
+        return Response({"data": payload})
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Cargo
+from .models import Cargo, ScanEvent
 
 
 admin.site.register(Cargo)
+admin.site.register(ScanEvent)
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.7 on 2026-10-18 12:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cargo', '0002_remove_cargo_tracking_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cargo',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
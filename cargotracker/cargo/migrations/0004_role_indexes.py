@@ -0,0 +1,29 @@
+# Generated by Django 2.2.7 on 2026-10-18 13:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cargo', '0003_cargo_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cargo',
+            index=models.Index(fields=['sender', 'id'], name='cargo_cargo_sender__58ab7b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cargo',
+            index=models.Index(fields=['recepient', 'id'], name='cargo_cargo_recepie_f74490_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cargo',
+            index=models.Index(fields=['booking_agent', 'id'], name='cargo_cargo_booking_ad1110_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cargo',
+            index=models.Index(fields=['clearing_agent', 'id'], name='cargo_cargo_clearin_f4d738_idx'),
+        ),
+    ]
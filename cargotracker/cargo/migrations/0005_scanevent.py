@@ -0,0 +1,33 @@
+# Generated by Django 2.2.7 on 2026-10-18 16:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0003_lane'),
+        ('cargo', '0004_role_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('I', 'arrived'), ('O', 'departed'), ('D', 'delivered')], max_length=1)),
+                ('scanned_at', models.DateTimeField()),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scans', to='branches.Branch')),
+                ('cargo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scans', to='cargo.Cargo')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='scanevent',
+            index=models.Index(fields=['cargo', 'scanned_at'], name='cargo_scane_cargo_i_c9df47_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scanevent',
+            index=models.Index(fields=['branch', 'scanned_at'], name='cargo_scane_branch__b4ac33_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 2.2.7 on 2026-10-18 18:05
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def delete_duplicate_scans(apps, schema_editor):
+    """
+    Retried batches were recorded again until now. Keep the first copy of every scan before the unique index is created.
+    """
+
+    ScanEvent = apps.get_model("cargo", "ScanEvent")
+    fields = ("cargo_id", "branch_id", "event_type", "scanned_at")
+    duplicates = (
+        ScanEvent.objects.values(*fields)
+        .annotate(first_id=Min("id"), occurrences=Count("id"))
+        .filter(occurrences__gt=1)
+        .order_by()
+    )
+    for row in duplicates:
+        ScanEvent.objects.filter(**{field: row[field] for field in fields}).exclude(
+            id=row["first_id"]
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0004_branchordersummary'),
+        ('cargo', '0005_scanevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_scans, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='scanevent',
+            unique_together={('cargo', 'branch', 'event_type', 'scanned_at')},
+        ),
+    ]
@@ -1,11 +1,22 @@
-from django.db import models
+import io
+from datetime import timedelta
+
+from django.apps import apps
+from django.db import connection, models, transaction
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.functions import Substr
 from django.db.models.signals import post_save
 from django.shortcuts import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
-from branches.models import Branch
+from branches.models import Branch, BranchOrderSummary, order_summary_changes
 from cargotracker.UTILS import validate_required_kwargs_are_not_empty
-from cargotracker.UTILS.tasks import send_async_email
+from notifications.models import Notification
+from orders.cache import invalidate_order_detail_on_commit, invalidate_order_details
+from orders.events import event_for_order, order_event, publish_order_events_on_commit
 
 
 User = settings.AUTH_USER_MODEL
@@ -18,12 +29,37 @@ class CargoQuerySet(models.QuerySet):
     Queryset for reusable queries of the Cargo object.
     """
 
+    # (column, lookup) pairs making up each row of a bulk export
+    export_columns = (
+        ("id", "id"),
+        ("title", "title"),
+        ("sender", "sender__email"),
+        ("recepient", "recepient__email"),
+        ("booking_agent", "booking_agent__email"),
+        ("clearing_agent", "clearing_agent__email"),
+        ("booking_station", "booking_station__city"),
+        ("destination", "destination__city"),
+        ("current_location", "current_location"),
+        ("weight", "weight"),
+    )
+
+    def ids_involving(self, user, *fields):
+        """
+        Ids of the Cargo where any of `fields` is the user, as a UNION of one query per field.
+        Each of those can be answered from its own `(field, id)` index, where OR-ing the fields in one query ends up in a bitmap-OR or a sequential scan.
+        """
+
+        queries = [
+            self.model.objects.filter(**{field: user}).values("id") for field in fields
+        ]
+        return queries[0].union(*queries[1:])
+
     def all_cargo_for_user(self, user=None):
         """
         Return all the Cargo involving a user, whether they sent it or received it.
         """
 
-        return self.filter(Q(sender=user) | Q(recepient=user))
+        return self.filter(id__in=self.ids_involving(user, "sender", "recepient"))
 
     def cargo_sent_by_user(self, sender=None):
 
@@ -41,11 +77,38 @@ class CargoQuerySet(models.QuerySet):
         """
         All cargo either booked or cleared by the provided agent.
         """
-        return self.filter(Q(booking_agent=agent) | Q(clearing_agent=agent))
+        return self.filter(
+            id__in=self.ids_involving(agent, "booking_agent", "clearing_agent")
+        )
+
+    def with_related(self):
+        """
+        Join the relations that are displayed whenever Cargo is serialized.
+        """
+        return self.select_related("recepient", "destination", "booking_station")
+
+    def with_parties(self):
+        """
+        Join every user and branch involved with the Cargo.
+        """
+        return self.select_related(
+            "sender",
+            "recepient",
+            "booking_agent",
+            "clearing_agent",
+            "destination",
+            "booking_station__branch_agent",
+        )
+
+    def for_export(self):
+        """
+        Flat rows for bulk exports. Relations are joined in the same query and no model instances are built.
+        """
+        lookups = [lookup for _, lookup in self.export_columns]
+        return self.order_by("id").values_list(*lookups)
 
     def cargo_by_tracking_id(self, tracking_id=None):
-        qs = self.filter(tracking_id=str(tracking_id))
-        return qs.first() if qs.exists() else None
+        return self.filter(tracking_id=str(tracking_id)).first()
 
 
 class CargoManager(models.Manager):
@@ -83,24 +146,93 @@ class CargoManager(models.Manager):
         if kwargs.get("sender").id == kwargs.get("recepient").id:
             raise TypeError("Users cannot send themselves parcels.")
 
-        if (
-            kwargs.get("booking_agent").email
-            != kwargs.get("booking_station").branch_agent.email
-        ):
+        if kwargs.get("booking_agent").id != kwargs.get("booking_station").branch_agent_id:
             raise TypeError("You can only book cargo for your station.")
 
-        cargo = self.model.objects.create(**kwargs)
-        cargo.save()
+        with transaction.atomic():
+            cargo = self.model.objects.create(**kwargs)
+            cargo.save()
         return cargo
 
+    def bulk_book_cargo(self, rows, booking_agent=None):
+        """
+        Book many Cargo at once for the provided agent.
+        Every party is resolved with one query for the users and from the branch registry, and all valid rows are inserted with a single `bulk_create`.
+        :args:
+        rows - list of dictionaries with the `title`, `weight`, `sender` and `recepient` emails, and `destination` city of each cargo. A `booking_station` city is optional and defaults to the agent's branch.
+        booking_agent - agent that handled booking
+        :return: list with either the booked Cargo or a dictionary of errors for every row
+        """
+
+        emails = {row.get(key) for row in rows for key in ("sender", "recepient")}
+        users = {
+            user.email: user
+            for user in get_user_model().objects.filter(email__in=emails)
+        }
+
+        cities = {row.get(key) for row in rows for key in ("destination", "booking_station")}
+        branches_by_city = {
+            city: Branch.objects.search_by_city_exact(city) for city in cities
+        }
+        agent_branch = Branch.objects.get_agent_branch(agent=booking_agent)
+
+        results = []
+        for row in rows:
+            errors = {}
+            sender = users.get(row.get("sender"))
+            recepient = users.get(row.get("recepient"))
+            destination = branches_by_city.get(row.get("destination"))
+            booking_station = (
+                branches_by_city.get(row.get("booking_station"))
+                if row.get("booking_station")
+                else agent_branch
+            )
+
+            if not sender:
+                errors["sender"] = "We don't have a registered user by that email address"
+            if not recepient:
+                errors["recepient"] = "There is no user registered with that email."
+            if not destination:
+                errors["destination"] = "We don't have a branch in that city."
+            if not booking_station:
+                errors["booking_station"] = "We don't have a branch in that city."
+
+            if sender and recepient and sender.id == recepient.id:
+                errors["recepient"] = "Users cannot send themselves parcels."
+            if booking_station and booking_station.branch_agent_id != booking_agent.id:
+                errors["booking_station"] = "You can only book cargo for your station."
+            if destination and destination == booking_station:
+                errors["destination"] = "You cannot send a parcel to the same origin."
+
+            if errors:
+                results.append(errors)
+                continue
+
+            results.append(
+                self.model(
+                    title=row.get("title"),
+                    weight=row.get("weight"),
+                    sender=sender,
+                    recepient=recepient,
+                    destination=destination,
+                    clearing_agent_id=destination.branch_agent_id,
+                    booking_station=booking_station,
+                    booking_agent=booking_agent,
+                )
+            )
+
+        booked = [result for result in results if isinstance(result, self.model)]
+        with transaction.atomic():
+            self.model.objects.bulk_create(booked)
+            notify_agents_of_bulk_booking(booked)
+        return results
+
     def get_cargo(self, **kwargs):
         """
         Return the first cargo that matches the specified params.
         """
 
-        qs = Cargo.objects.filter(**kwargs)
-
-        return qs.first() if qs.exists() else False
+        return Cargo.objects.filter(**kwargs).first() or False
 
 
 class Cargo(models.Model):
@@ -135,9 +267,19 @@ class Cargo(models.Model):
     )
     current_location = models.CharField(max_length=50, default="pending")
     weight = models.DecimalField(max_digits=5, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
 
     objects = CargoManager()
 
+    class Meta:
+        # serve the per-party branches of the role querysets in id order
+        indexes = [
+            models.Index(fields=["sender", "id"]),
+            models.Index(fields=["recepient", "id"]),
+            models.Index(fields=["booking_agent", "id"]),
+            models.Index(fields=["clearing_agent", "id"]),
+        ]
+
     def __str__(self):
         """
         Return a helpful string representation.
@@ -150,6 +292,52 @@ class Cargo(models.Model):
         """
         return reverse("cargo:cargo-detail", args=[self.id])
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember the stations and weight as loaded, so that saving can tell when the order counters of the branches change.
+        """
+
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_counted = instance._counted_fields()
+        return instance
+
+    def _counted_fields(self):
+        return (
+            self.__dict__.get("booking_station_id"),
+            self.__dict__.get("destination_id"),
+            self.__dict__.get("weight"),
+        )
+
+    def save(self, *args, **kwargs):
+        """
+        Moving the cargo to other stations, or changing its weight, moves its order between the counters of the branches in the same transaction.
+        """
+
+        previous = getattr(self, "_loaded_counted", None)
+        if self._state.adding or previous is None or previous == self._counted_fields():
+            super().save(*args, **kwargs)
+        else:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                self._move_order_counts(previous)
+        self._loaded_counted = self._counted_fields()
+
+    def _move_order_counts(self, previous):
+        try:
+            status = self.order.status
+        except ObjectDoesNotExist:
+            return
+        booking_station_id, destination_id, weight = previous
+        BranchOrderSummary.objects.apply(
+            order_summary_changes(
+                booking_station_id, destination_id, status, weight, orders=-1
+            )
+            + order_summary_changes(
+                self.booking_station_id, self.destination_id, status, self.weight
+            )
+        )
+
 
 def post_save_cargo_created_receiver(sender, instance, created, *args, **kwargs):
     """
@@ -165,12 +353,367 @@ def post_save_cargo_created_receiver(sender, instance, created, *args, **kwargs)
         message = f"Hello. A new order was made at the CargoTracker branch in {instance.booking_station.city}. As the admin of the branch, please proceed and record the order for it to be sent to its destination."
         recepient = agent.email
 
-        send_async_email(
+        Notification.objects.enqueue(
             subject=subject,
             message=message,
             sender=instance.sender.email,
             recepients=[recepient,],
         )
+    else:
+        # cached order details show this cargo, so they are stale now
+        try:
+            order = instance.order
+        except ObjectDoesNotExist:
+            return
+        invalidate_order_detail_on_commit(order.tracking_id)
+        publish_order_events_on_commit([event_for_order(order)])
+
+
+def notify_agents_of_bulk_booking(cargo_list):
+    """
+    `bulk_create` does not send `post_save`, so send each agent one summary of the cargo booked at their branch instead.
+    """
+
+    notifications = []
+    booked_by_station = {}
+    for cargo in cargo_list:
+        booked_by_station.setdefault(cargo.booking_station, []).append(cargo)
+    agent_emails = get_user_model().objects.get_emails_by_id(
+        {station.branch_agent_id for station in booked_by_station}
+    )
+
+    for station, booked in booked_by_station.items():
+        parcels = "; ".join(
+            f"{cargo.title} from {cargo.sender.email} to {cargo.destination.city}"
+            for cargo in booked
+        )
+        subject = "Book new orders."
+        message = f"Hello. {len(booked)} new parcels were booked at the CargoTracker branch in {station.city}: {parcels}. As the admin of the branch, please proceed and record the orders for them to be sent to their destinations."
+
+        notifications.append(
+            (subject, message, settings.ADMIN_EMAIL, [agent_emails[station.branch_agent_id]])
+        )
+
+    Notification.objects.enqueue_many(notifications)
 
 
 post_save.connect(post_save_cargo_created_receiver, sender=Cargo)
+
+
+# how far ahead of the server clock a scanner's clock may be
+SCAN_CLOCK_SKEW = timedelta(minutes=5)
+
+
+def parse_scan_time(value):
+    """
+    Return the aware datetime of a scan, or None if it is not a valid date and time.
+    """
+
+    if not isinstance(value, str):
+        return None
+    try:
+        scanned_at = parse_datetime(value)
+    except ValueError:
+        return None
+    if scanned_at is not None and timezone.is_naive(scanned_at):
+        scanned_at = timezone.make_aware(scanned_at)
+    return scanned_at
+
+
+class ScanEventManager(models.Manager):
+    """
+    Manager for the log of scans. Scans are only ever appended.
+    """
+
+    def ingest(self, rows, agent):
+        """
+        Validate scanner events set-wise, append the valid ones and bring their Cargo and Orders up to date, all in one transaction.
+        Agents scan at their own branch, superusers name the `branch` city of every scan.
+        :args:
+        rows - dictionaries with the `cargo` id, `event` name, `scanned_at` time and optionally the `branch` city of each scan
+        agent - user sending the scans
+        :return: the number of new scans recorded, and a list with the `row` index and `errors` of every rejected row
+        """
+
+        agent_branch = None
+        if not agent.is_superuser:
+            agent_branch = Branch.objects.get_agent_branch(agent=agent)
+            if agent_branch is None:
+                raise TypeError("You don't have a branch to scan cargo at.")
+
+        cargo_ids = {
+            row.get("cargo")
+            for row in rows
+            if isinstance(row.get("cargo"), int) and not isinstance(row.get("cargo"), bool)
+        }
+        known_cargo = set(
+            Cargo.objects.filter(id__in=cargo_ids).values_list("id", flat=True)
+        )
+        event_types = {name: code for code, name in self.model.EVENT_CHOICES}
+        latest = timezone.now() + SCAN_CLOCK_SKEW
+        branch_ids = {}
+
+        events = {}
+        failed = []
+        for index, row in enumerate(rows):
+            errors = {}
+            cargo_id = row.get("cargo")
+            if cargo_id not in known_cargo or isinstance(cargo_id, bool):
+                errors["cargo"] = "There is no cargo with that id."
+
+            event_type = event_types.get(row.get("event"))
+            if event_type is None:
+                errors["event"] = f"The event must be one of {', '.join(event_types)}."
+
+            scanned_at = parse_scan_time(row.get("scanned_at"))
+            if scanned_at is None:
+                errors["scanned_at"] = "Provide the date and time of the scan, e.g. 2020-01-01T10:00:00Z."
+            elif scanned_at > latest:
+                errors["scanned_at"] = "Scans cannot happen in the future."
+
+            city = row.get("branch")
+            if agent_branch is not None:
+                branch_id = agent_branch.id
+                if city and city != agent_branch.city:
+                    errors["branch"] = "You can only scan cargo at your branch."
+            else:
+                if city not in branch_ids:
+                    branch = Branch.objects.search_by_city_exact(city) if city else None
+                    branch_ids[city] = getattr(branch, "id", None)
+                branch_id = branch_ids[city]
+                if branch_id is None:
+                    errors["branch"] = "We don't have a branch in that city."
+
+            if errors:
+                failed.append({"row": index, "errors": errors})
+                continue
+            # scanners retry, so repeated scans are recorded once, within a batch and across batches
+            events[(cargo_id, branch_id, event_type, scanned_at)] = None
+
+        with transaction.atomic():
+            events = self.append(list(events))
+            self.advance_cargo(events)
+        return len(events), failed
+
+    def append(self, events):
+        """
+        Insert `(cargo_id, branch_id, event_type, scanned_at)` tuples that were not recorded before, and return them.
+        Postgres COPYs them to a staging table and inserts them from there, skipping conflicts. Elsewhere the recorded ones are read first and the rest are inserted with one prepared INSERT.
+        Scans are never read back as instances, so they skip the model layer.
+        """
+
+        if not events:
+            return []
+        table = self.model._meta.db_table
+        columns = ("cargo_id", "branch_id", "event_type", "scanned_at")
+        quote = connection.ops.quote_name
+        column_list = ", ".join(map(quote, columns))
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    f"CREATE TEMPORARY TABLE scan_staging ON COMMIT DROP AS "
+                    f"SELECT {column_list} FROM {quote(table)} WITH NO DATA"
+                )
+                data = io.StringIO(
+                    "".join(
+                        f"{cargo_id}\t{branch_id}\t{event_type}\t{scanned_at.isoformat()}\n"
+                        for cargo_id, branch_id, event_type, scanned_at in events
+                    )
+                )
+                cursor.copy_from(data, "scan_staging", columns=columns)
+                cursor.execute(
+                    f"INSERT INTO {quote(table)} ({column_list}) "
+                    f"SELECT {column_list} FROM scan_staging "
+                    f"ON CONFLICT ({column_list}) DO NOTHING "
+                    f"RETURNING {column_list}"
+                )
+                return [tuple(row) for row in cursor.fetchall()]
+
+            times = [scanned_at for _, _, _, scanned_at in events]
+            recorded = set(
+                self.filter(
+                    cargo_id__in={cargo_id for cargo_id, _, _, _ in events},
+                    scanned_at__range=(min(times), max(times)),
+                ).values_list(*columns)
+            )
+            events = [event for event in events if event not in recorded]
+            adapt = connection.ops.adapt_datetimefield_value
+            cursor.executemany(
+                f"INSERT INTO {quote(table)} ({column_list}) VALUES (%s, %s, %s, %s)",
+                [
+                    (
+                        cargo_id,
+                        branch_id,
+                        event_type,
+                        adapt(scanned_at),
+                    )
+                    for cargo_id, branch_id, event_type, scanned_at in events
+                ],
+            )
+        return events
+
+    def advance_cargo(self, events):
+        """
+        Move the Cargo and Orders of new scans along with set-based UPDATEs:
+        every Cargo is located at the branch of its latest scan, pending Orders go in transit, Orders scanned at the main branch are past it, and Orders scanned as delivered are delivered at their first delivery scan.
+        The order counters of the branches move with them.
+        """
+
+        if not events:
+            return
+        order_model = apps.get_model("orders", "Order")
+        stats_model = apps.get_model("orders", "LaneTransitStats")
+        now = timezone.now()
+        cargo_ids = {cargo_id for cargo_id, _, _, _ in events}
+
+        latest_scan = self.filter(cargo=models.OuterRef("pk")).order_by("-scanned_at", "-id")
+        location_length = Cargo._meta.get_field("current_location").max_length
+        Cargo.objects.filter(id__in=cargo_ids).update(
+            current_location=Substr(
+                models.Subquery(latest_scan.values("branch__city")[:1]), 1, location_length
+            ),
+            updated_at=now,
+        )
+
+        main_branch = Branch.objects.get_main_branch()
+        at_main_branch = set()
+        delivered_at = {}
+        for cargo_id, branch_id, event_type, scanned_at in events:
+            if main_branch is not None and branch_id == main_branch.id:
+                at_main_branch.add(cargo_id)
+            if event_type == "D" and (
+                cargo_id not in delivered_at or scanned_at < delivered_at[cargo_id]
+            ):
+                delivered_at[cargo_id] = scanned_at
+
+        # read once and locked, so the updates below only touch the orders that change
+        orders = list(
+            order_model.objects.select_for_update(of=("self",))
+            .filter(cargo_id__in=cargo_ids)
+            .values(
+                "id",
+                "cargo_id",
+                "status",
+                "past_main_branch",
+                "actual_delivery_time",
+                "created_at",
+                "tracking_id",
+                "cargo__booking_station_id",
+                "cargo__destination_id",
+                "cargo__current_location",
+                "cargo__booking_agent_id",
+                "cargo__clearing_agent_id",
+                "cargo__weight",
+            )
+        )
+        previous_statuses = [order["status"] for order in orders]
+        delivering = [
+            order
+            for order in orders
+            if order["cargo_id"] in delivered_at and order["status"] != "D"
+        ]
+        if delivering:
+            first_delivery = self.filter(
+                cargo=models.OuterRef("cargo_id"), event_type="D"
+            ).order_by("scanned_at")
+            order_model.objects.filter(id__in=[order["id"] for order in delivering]).update(
+                status="D",
+                actual_delivery_time=models.Subquery(
+                    first_delivery.values("scanned_at")[:1]
+                ),
+                updated_at=now,
+            )
+            stats_model.objects.record_many(
+                (
+                    order["cargo__booking_station_id"],
+                    order["cargo__destination_id"],
+                    delivered_at[order["cargo_id"]] - order["created_at"],
+                )
+                for order in delivering
+                if order["created_at"] is not None
+                and delivered_at[order["cargo_id"]] > order["created_at"]
+            )
+            for order in delivering:
+                order["status"] = "D"
+                order["actual_delivery_time"] = delivered_at[order["cargo_id"]]
+
+        pending = [order for order in orders if order["status"] == "P"]
+        if pending:
+            order_model.objects.filter(id__in=[order["id"] for order in pending]).update(
+                status="T", updated_at=now
+            )
+            for order in pending:
+                order["status"] = "T"
+        passing = [
+            order
+            for order in orders
+            if order["cargo_id"] in at_main_branch and not order["past_main_branch"]
+        ]
+        if passing:
+            order_model.objects.filter(id__in=[order["id"] for order in passing]).update(
+                past_main_branch=True, updated_at=now
+            )
+            for order in passing:
+                order["past_main_branch"] = True
+
+        summary_changes = []
+        for order, previous_status in zip(orders, previous_statuses):
+            if order["status"] != previous_status:
+                lane = order["cargo__booking_station_id"], order["cargo__destination_id"]
+                summary_changes += order_summary_changes(
+                    *lane, previous_status, order["cargo__weight"], orders=-1
+                )
+                summary_changes += order_summary_changes(
+                    *lane, order["status"], order["cargo__weight"]
+                )
+        BranchOrderSummary.objects.apply(summary_changes)
+
+        # cached order details show their cargo
+        tracking_ids = [order["tracking_id"] for order in orders]
+        invalidate_order_details(tracking_ids)
+        transaction.on_commit(lambda: invalidate_order_details(tracking_ids))
+        publish_order_events_on_commit(
+            [
+                order_event(
+                    order["tracking_id"],
+                    order["status"],
+                    order["past_main_branch"],
+                    order["actual_delivery_time"],
+                    order["cargo__current_location"],
+                    order["cargo__booking_agent_id"],
+                    order["cargo__clearing_agent_id"],
+                )
+                for order in orders
+            ]
+        )
+
+
+class ScanEvent(models.Model):
+    """
+    A scan of Cargo at a branch, as reported by the scanner.
+    """
+
+    EVENT_CHOICES = [
+        ("I", "arrived"),
+        ("O", "departed"),
+        ("D", "delivered"),
+    ]
+
+    cargo = models.ForeignKey(Cargo, on_delete=models.CASCADE, related_name="scans")
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name="scans")
+    event_type = models.CharField(max_length=1, choices=EVENT_CHOICES)
+    scanned_at = models.DateTimeField()
+
+    objects = ScanEventManager()
+
+    class Meta:
+        # a scan sent again is the same scan
+        unique_together = ("cargo", "branch", "event_type", "scanned_at")
+        # the history of a cargo, and the traffic of a branch, in time order
+        indexes = [
+            models.Index(fields=["cargo", "scanned_at"]),
+            models.Index(fields=["branch", "scanned_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.cargo_id} {self.get_event_type_display()} at {self.branch} on {self.scanned_at}"
@@ -12,23 +12,26 @@ class CargoJSONRenderer(JSONRenderer):
 
     charset = "utf-8"
 
-    def format_cargo_detail_view_response(self, data):
+    user_fields = ("sender", "booking_agent", "clearing_agent")
+
+    def get_user_emails(self, cargo_list):
         """
-        Return appropriate responses for the Cargo detail views.
+        Resolve every user referenced by the provided Cargo data to an email in one query.
         """
 
-        clearing_agent_id = data.get("clearing_agent")
-        clearing_agent = User.objects.get_user(id=clearing_agent_id)
+        ids = (cargo.get(field) for cargo in cargo_list for field in self.user_fields)
+        return User.objects.get_emails_by_id(ids)
 
-        booking_agent_id = data.get("booking_agent")
-        booking_agent = User.objects.get_user(id=booking_agent_id)
+    def format_cargo_detail_view_response(self, data, emails=None):
+        """
+        Return appropriate responses for the Cargo detail views.
+        """
 
-        sender_id = data.get("sender")
-        sender = User.objects.get_user(id=sender_id)
+        if emails is None:
+            emails = self.get_user_emails([data])
 
-        data['booking_agent'] = booking_agent.email
-        data['sender'] = sender.email
-        data['clearing_agent'] = clearing_agent.email
+        for field in self.user_fields:
+            data[field] = emails.get(data.get(field))
 
         return data
 
@@ -37,19 +40,25 @@ class CargoJSONRenderer(JSONRenderer):
         Whenever we have more than one Cargo to return, ensure it is properly formated.
         """
 
-        for cargo in return_list:
-            self.format_cargo_detail_view_response(cargo)
-        
-        return return_list
-
-
+        emails = self.get_user_emails(return_list)
 
+        for cargo in return_list:
+            self.format_cargo_detail_view_response(cargo, emails=emails)
 
+        return return_list
 
     def render(self, data, media_type=None, renderer_context=None):
+        response = renderer_context.get("response") if renderer_context else None
+        if response is not None and response.exception:
+            return super().render(data)
+
         if isinstance(data, dict):
+            if isinstance(data.get("data"), list):
+                # paginated lists carry their cursors next to the data
+                payload = self.format_cargo_list_view(data.get("data"))
+                return json.dumps({**data, "data": payload})
             if "error" in str(data).lower():
-                    return super().render(data)
+                return super().render(data)
             if data.get("data"):
                 payload = self.format_cargo_detail_view_response(data.get("data"))
                 return json.dumps({"data": payload})
@@ -61,5 +70,4 @@ class CargoJSONRenderer(JSONRenderer):
             payload = self.format_cargo_list_view(data)
             return json.dumps({"data": payload})
 
-
         return json.dumps(data)
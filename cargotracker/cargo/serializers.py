@@ -1,7 +1,8 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import get_user_model
 
-from .models import Cargo
+from .models import Cargo, ScanEvent
 from branches.models import Branch
 from cargotracker.UTILS.validators import validate_branch_exists_in_city
 
@@ -68,3 +69,77 @@ class CargoSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 {"detail": e.args[0], "code": "invalid"}
             ) from e
+
+
+class BulkCargoItemSerializer(serializers.Serializer):
+    """
+    Check the fields of a single row of a bulk booking. The parties are looked up for all rows at once afterwards.
+    """
+
+    title = serializers.CharField(max_length=100)
+    weight = serializers.DecimalField(max_digits=5, decimal_places=2)
+    sender = serializers.EmailField()
+    recepient = serializers.EmailField()
+    destination = serializers.CharField()
+    booking_station = serializers.CharField(required=False)
+
+
+class BulkCargoSerializer(serializers.Serializer):
+    """
+    Handle booking many Cargo with one request.
+    """
+
+    cargo = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=settings.BULK_BOOKING_MAX_ROWS,
+    )
+
+    def create(self, validated_data):
+        """
+        Book every valid row and return the outcome of each one, in order.
+        """
+
+        rows = [BulkCargoItemSerializer(data=row) for row in validated_data["cargo"]]
+        valid_rows = [row.validated_data for row in rows if row.is_valid()]
+
+        booked = iter(
+            Cargo.objects.bulk_book_cargo(
+                valid_rows, booking_agent=self.context["request"].user
+            )
+        )
+
+        results = []
+        for index, row in enumerate(rows):
+            outcome = next(booked) if not row.errors else row.errors
+            if isinstance(outcome, Cargo):
+                results.append(
+                    {"row": index, "status": "created", "cargo": CargoSerializer(outcome).data}
+                )
+            else:
+                results.append({"row": index, "status": "failed", "errors": outcome})
+        return results
+
+
+class ScanEventBatchSerializer(serializers.Serializer):
+    """
+    Handle a batch of scanner events. The rows are validated together by the manager.
+    """
+
+    events = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=settings.SCAN_INGEST_MAX_EVENTS,
+    )
+
+    def create(self, validated_data):
+        """
+        Record every valid scan and return the number recorded with the rows that failed.
+        """
+
+        try:
+            return ScanEvent.objects.ingest(
+                validated_data["events"], agent=self.context["request"].user
+            )
+        except TypeError as e:
+            raise serializers.ValidationError({"errors": {"detail": e.args[0]}}) from e
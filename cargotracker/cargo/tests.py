@@ -1,3 +1,386 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
 
-# Create your tests here.
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from cargotracker.UTILS.testing import CargoTrackerTestCase, create_cargo, create_user
+from branches.registry import registry
+from notifications.models import Notification
+from orders.models import LaneTransitStats, Order
+from .models import Cargo, ScanEvent
+from .renderers import CargoJSONRenderer
+from .serializers import CargoSerializer
+
+
+class CargoTestCase(CargoTrackerTestCase):
+    """
+    Provide twenty Cargo booked at the main branch.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for index in range(20):
+            create_cargo(
+                create_user(f"sender{index}@example.com"),
+                cls.recepient,
+                cls.main_branch,
+                cls.branch,
+                title=f"Parcel {index}",
+            )
+
+
+class CargoJSONRendererTestCase(CargoTestCase):
+    """
+    The renderer should resolve users for a whole page of Cargo at once.
+    """
+
+    def test_list_render_uses_a_single_query(self):
+        data = CargoSerializer(Cargo.objects.filter().with_related(), many=True).data
+
+        with self.assertNumQueries(1):
+            CargoJSONRenderer().format_cargo_list_view(data)
+
+        self.assertEqual(data[0]["booking_agent"], self.agent.email)
+        self.assertEqual(data[0]["clearing_agent"], self.branch.branch_agent.email)
+        self.assertEqual(data[0]["sender"], "sender0@example.com")
+
+    def test_list_endpoint_query_count_does_not_grow_with_rows(self):
+        self.client.force_authenticate(self.admin)
+
+        # the ETag versions, the page and the users' emails
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("cargo:create-cargo"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["data"]), 20)
+
+
+class CargoPaginationTestCase(CargoTestCase):
+    """
+    Cargo lists are paginated with cursors over the primary key.
+    """
+
+    def test_cursors_walk_every_cargo_once_without_counting(self):
+        self.client.force_authenticate(self.admin)
+        url = reverse("cargo:create-cargo") + "?page_size=6"
+        seen = []
+
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                payload = self.client.get(url).json()
+                seen.extend(cargo["id"] for cargo in payload["data"])
+                url = payload["next"]
+
+        self.assertEqual(seen, sorted(Cargo.objects.values_list("id", flat=True), reverse=True))
+        self.assertFalse(any("COUNT(" in query["sql"] for query in queries))
+
+    def test_previous_cursor_returns_the_earlier_page(self):
+        self.client.force_authenticate(self.admin)
+        first = self.client.get(reverse("cargo:create-cargo") + "?page_size=6").json()
+        second = self.client.get(first["next"]).json()
+
+        previous = self.client.get(second["previous"]).json()
+
+        self.assertIsNone(first["previous"])
+        self.assertEqual(previous["data"], first["data"])
+
+
+class CargoRoleQuerySetTestCase(CargoTestCase):
+    """
+    "My cargo" lists are built from a UNION over the party columns and still paginate by id.
+    """
+
+    def test_agents_see_booked_and_cleared_cargo(self):
+        cleared = create_cargo(
+            self.sender, self.recepient, self.other_branch, self.main_branch
+        )
+        create_cargo(self.sender, self.recepient, self.branch, self.other_branch)
+
+        queryset = Cargo.objects.filter().cargo_handled_by_agent(agent=self.agent)
+
+        self.assertIn("UNION", str(queryset.query))
+        self.assertEqual(
+            set(queryset.values_list("id", flat=True)),
+            set(
+                Cargo.objects.filter(booking_station=self.main_branch).values_list(
+                    "id", flat=True
+                )
+            )
+            | {cleared.id},
+        )
+
+    def test_user_pages_walk_their_cargo_in_order(self):
+        create_cargo(self.recepient, self.sender, self.main_branch, self.branch)
+        create_cargo(
+            self.sender, create_user("other@example.com"), self.main_branch, self.branch
+        )
+        self.client.force_authenticate(self.recepient)
+        url = reverse("cargo:create-cargo") + "?page_size=7"
+        seen = []
+
+        while url:
+            payload = self.client.get(url).json()
+            seen.extend(cargo["id"] for cargo in payload["data"])
+            url = payload["next"]
+
+        expected = Cargo.objects.filter(
+            Q(sender=self.recepient) | Q(recepient=self.recepient)
+        ).values_list("id", flat=True)
+        self.assertEqual(len(seen), 21)
+        self.assertEqual(seen, sorted(expected, reverse=True))
+
+
+class CargoExportTestCase(CargoTestCase):
+    """
+    Admins can stream every Cargo as NDJSON or CSV.
+    """
+
+    def test_ndjson_export_streams_one_document_per_cargo(self):
+        self.client.force_authenticate(self.admin)
+
+        response = self.client.get(reverse("cargo:export-cargo"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(len(rows), 20)
+        self.assertEqual(rows[0]["sender"], "sender0@example.com")
+        self.assertEqual(rows[0]["destination"], self.branch.city)
+
+    def test_csv_export_has_a_header(self):
+        self.client.force_authenticate(self.admin)
+
+        response = self.client.get(reverse("cargo:export-cargo") + "?output=csv")
+
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertTrue(lines[0].startswith("id,title,sender,recepient"))
+        self.assertEqual(len(lines), 21)
+
+    def test_agents_cannot_export(self):
+        self.client.force_authenticate(self.agent)
+
+        response = self.client.get(reverse("cargo:export-cargo"))
+
+        self.assertEqual(response.status_code, 403)
+
+
+class CargoConditionalGetTestCase(CargoTestCase):
+    """
+    Cargo endpoints send ETags and answer 304 when nothing changed.
+    """
+
+    def test_unchanged_cargo_is_not_sent_again(self):
+        cargo = Cargo.objects.first()
+        url = reverse("cargo:cargo-detail", args=[cargo.id])
+        self.client.force_authenticate(self.admin)
+        etag = self.client.get(url)["ETag"]
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_saving_the_cargo_changes_its_etag(self):
+        cargo = Cargo.objects.first()
+        url = reverse("cargo:cargo-detail", args=[cargo.id])
+        self.client.force_authenticate(self.admin)
+        etag = self.client.get(url)["ETag"]
+
+        cargo.current_location = "Nairobi"
+        cargo.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_list_pages_are_revalidated(self):
+        url = reverse("cargo:create-cargo") + "?page_size=5"
+        self.client.force_authenticate(self.admin)
+        etag = self.client.get(url)["ETag"]
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        create_cargo(self.sender, self.recepient, self.main_branch, self.branch)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class BulkCargoBookingTestCase(CargoTrackerTestCase):
+    """
+    Agents can book many Cargo with a single request.
+    """
+
+    def book(self, rows):
+        self.client.force_authenticate(self.agent)
+        return self.client.post(
+            reverse("cargo:bulk-create-cargo"), {"cargo": rows}, format="json"
+        )
+
+    def row(self, **kwargs):
+        row = {
+            "title": "Parcel",
+            "weight": "12.50",
+            "sender": self.sender.email,
+            "recepient": self.recepient.email,
+            "destination": self.branch.city,
+        }
+        row.update(kwargs)
+        return row
+
+    def test_rows_are_validated_and_inserted_in_bulk(self):
+        rows = [self.row(title=f"Parcel {index}") for index in range(30)]
+        registry.get_index()
+
+        # users, the insert, the agents' emails, their notification and the savepoint
+        with self.assertNumQueries(6):
+            response = self.book(rows)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["data"]["created"], 30)
+        self.assertEqual(Cargo.objects.filter(booking_agent=self.agent).count(), 30)
+        notification = Notification.objects.get(subject="Book new orders.")
+        self.assertEqual(notification.recepients, self.agent.email)
+
+    def test_every_row_reports_its_own_errors(self):
+        response = self.book(
+            [
+                self.row(),
+                self.row(recepient="nobody@example.com"),
+                self.row(destination=self.main_branch.city),
+                self.row(booking_station=self.branch.city),
+                self.row(weight="not a weight"),
+            ]
+        )
+
+        results = response.json()["data"]["results"]
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result["status"] for result in results], ["created"] + ["failed"] * 4)
+        self.assertIn("recepient", results[1]["errors"])
+        self.assertIn("destination", results[2]["errors"])
+        self.assertIn("booking_station", results[3]["errors"])
+        self.assertIn("weight", results[4]["errors"])
+        self.assertEqual(Cargo.objects.count(), 1)
+
+    def test_regular_users_cannot_book_in_bulk(self):
+        self.client.force_authenticate(self.sender)
+
+        response = self.client.post(
+            reverse("cargo:bulk-create-cargo"), {"cargo": [self.row()]}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 403)
+
+
+class ScanEventIngestTestCase(CargoTrackerTestCase):
+    """
+    Scanners upload their events in batches, which move the Cargo and their Orders along.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.cargo = create_cargo(self.sender, self.recepient, self.main_branch, self.branch)
+        self.order, _ = Order.objects.get_or_create_order(
+            cargo=self.cargo, price_per_unit_weight=2.5
+        )
+        self.now = timezone.now()
+        Order.objects.filter(id=self.order.id).update(created_at=self.now - timedelta(hours=1))
+
+    def scan(self, event, minutes=0, cargo=None, **kwargs):
+        row = {
+            "cargo": (cargo or self.cargo).id,
+            "event": event,
+            "scanned_at": (self.now + timedelta(minutes=minutes)).isoformat(),
+        }
+        row.update(kwargs)
+        return row
+
+    def ingest(self, events, user=None):
+        self.client.force_authenticate(user or self.agent)
+        return self.client.post(reverse("cargo:ingest-scans"), {"events": events}, format="json")
+
+    def test_scans_move_cargo_and_orders_along(self):
+        response = self.ingest([self.scan("arrived", -10), self.scan("departed", -5)])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["data"]["recorded"], 2)
+        self.cargo.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.cargo.current_location, self.main_branch.city)
+        self.assertEqual(self.order.status, "T")
+        self.assertTrue(self.order.past_main_branch)
+
+        city = self.branch.city
+        response = self.ingest(
+            [self.scan("arrived", -2, branch=city), self.scan("delivered", -1, branch=city)],
+            user=self.admin,
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.cargo.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.cargo.current_location, self.branch.city)
+        self.assertEqual(self.order.status, "D")
+        self.assertEqual(self.order.actual_delivery_time, self.now - timedelta(minutes=1))
+        lane = LaneTransitStats.objects.get(scope=f"lane:{self.main_branch.id}:{self.branch.id}")
+        self.assertEqual(lane.count, 1)
+        self.assertAlmostEqual(lane.mean, 59 * 60)
+
+    def test_rows_are_validated_together(self):
+        registry.get_index()
+        events = [self.scan("arrived", -index) for index in range(200)]
+
+        # cargo ids, the recorded scans, the insert, cargo, the orders, their two updates, the branch counters and the savepoint
+        with self.assertNumQueries(12):
+            response = self.ingest(
+                events
+                + [
+                    self.scan("arrived", -1),
+                    self.scan("lost"),
+                    self.scan("arrived", 60),
+                    dict(self.scan("arrived"), cargo=0),
+                    self.scan("arrived", branch=self.branch.city),
+                ]
+            )
+
+        failed = response.json()["data"]["failed"]
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["data"]["recorded"], 200)
+        self.assertEqual(ScanEvent.objects.count(), 200)
+        self.assertEqual([row["row"] for row in failed], [201, 202, 203, 204])
+        self.assertIn("event", failed[0]["errors"])
+        self.assertIn("scanned_at", failed[1]["errors"])
+        self.assertIn("cargo", failed[2]["errors"])
+        self.assertIn("branch", failed[3]["errors"])
+
+    def test_batches_sent_again_are_recorded_once(self):
+        events = [self.scan("arrived", -10), self.scan("departed", -5)]
+        self.ingest(events)
+        self.cargo.refresh_from_db()
+        updated_at = self.cargo.updated_at
+
+        response = self.ingest(events + [self.scan("arrived", -1, branch=self.branch.city)])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["data"]["recorded"], 0)
+        self.assertEqual(len(response.json()["data"]["failed"]), 1)
+        self.assertEqual(ScanEvent.objects.count(), 2)
+        # nothing new happened to the cargo
+        self.cargo.refresh_from_db()
+        self.assertEqual(self.cargo.updated_at, updated_at)
+
+    def test_a_batch_without_valid_scans_is_rejected(self):
+        response = self.ingest([self.scan("arrived", scanned_at="yesterday")])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ScanEvent.objects.count(), 0)
+
+    def test_regular_users_cannot_upload_scans(self):
+        response = self.ingest([self.scan("arrived")], user=self.sender)
+
+        self.assertEqual(response.status_code, 403)
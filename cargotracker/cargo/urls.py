@@ -1,9 +1,18 @@
 from django.urls import path
 
-from .views import CargoListCreateAPIView, CargoRetrieveUpdateAPIView
+from .views import (
+    CargoListCreateAPIView,
+    CargoRetrieveUpdateAPIView,
+    CargoExportAPIView,
+    BulkCargoCreateAPIView,
+    ScanEventIngestAPIView,
+)
 
 
 urlpatterns = [
     path("", CargoListCreateAPIView.as_view(), name="create-cargo"),
+    path("bulk/", BulkCargoCreateAPIView.as_view(), name="bulk-create-cargo"),
+    path("export/", CargoExportAPIView.as_view(), name="export-cargo"),
+    path("scans/", ScanEventIngestAPIView.as_view(), name="ingest-scans"),
     path("<id>/", CargoRetrieveUpdateAPIView.as_view(), name="cargo-detail"),
 ]
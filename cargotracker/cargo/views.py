@@ -1,19 +1,29 @@
 from django.shortcuts import render
-from rest_framework.generics import ListCreateAPIView, RetrieveUpdateAPIView
+from rest_framework.generics import (
+    CreateAPIView,
+    ListCreateAPIView,
+    RetrieveUpdateAPIView,
+)
 from rest_framework.response import Response
 from rest_framework import status
 
 
 from authentication.models import User
 
-from .serializers import CargoSerializer
+from .serializers import CargoSerializer, BulkCargoSerializer, ScanEventBatchSerializer
 from .models import Cargo
 from .renderers import CargoJSONRenderer
-from authentication.permissions import IsStaffOrIsAuthenticatedReadOnly
+from authentication.permissions import (
+    IsStaffOrIsAuthenticatedReadOnly,
+    IsStaffOrReadOnly,
+)
 from branches.models import Branch
+from cargotracker.UTILS.pagination import DataCursorPagination
+from cargotracker.UTILS.exports import ExportAPIView
+from cargotracker.UTILS.conditional import ConditionalGetMixin
 
 
-class CargoListCreateAPIView(ListCreateAPIView):
+class CargoListCreateAPIView(ConditionalGetMixin, ListCreateAPIView):
     """
     Handle the creation of cargo and also listing of multiple cargo.
     """
@@ -21,6 +31,7 @@ class CargoListCreateAPIView(ListCreateAPIView):
     permission_classes = [IsStaffOrIsAuthenticatedReadOnly]
     serializer_class = CargoSerializer
     renderer_classes = (CargoJSONRenderer,)
+    pagination_class = DataCursorPagination
 
     def get_queryset(self):
         """
@@ -28,11 +39,12 @@ class CargoListCreateAPIView(ListCreateAPIView):
         """
 
         user = self.request.user
+        queryset = Cargo.objects.filter().with_related()
         if user.is_superuser:
-            return Cargo.objects.all()
+            return queryset
         elif user.is_staff:
-            return Cargo.objects.filter().cargo_handled_by_agent(agent=user)
-        return Cargo.objects.filter().all_cargo_for_user(user=user)
+            return queryset.cargo_handled_by_agent(agent=user)
+        return queryset.all_cargo_for_user(user=user)
 
     def create(self, request, *args, **kwargs):
         """
@@ -57,12 +69,10 @@ class CargoListCreateAPIView(ListCreateAPIView):
                 },
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        clearing_agent = destination.branch_agent
-
         # we would rather get this from the user making the current request
         booking_agent = request.user
         data["booking_agent"] = booking_agent.id
-        data["clearing_agent"] = clearing_agent.id
+        data["clearing_agent"] = destination.branch_agent_id
 
         data["sender"] = sender.id
 
@@ -77,7 +87,7 @@ class CargoListCreateAPIView(ListCreateAPIView):
         return Response({"data": response}, status=status.HTTP_201_CREATED)
 
 
-class CargoRetrieveUpdateAPIView(RetrieveUpdateAPIView):
+class CargoRetrieveUpdateAPIView(ConditionalGetMixin, RetrieveUpdateAPIView):
     """
     Endpionts for displaying single Cargo and also updating it.
     """
@@ -92,11 +102,12 @@ class CargoRetrieveUpdateAPIView(RetrieveUpdateAPIView):
         We will need a different queryset depending on the user who is making the request
         """
         user = self.request.user
+        queryset = Cargo.objects.filter().with_related()
         if user.is_superuser:
-            return Cargo.objects.all()
+            return queryset
         elif user.is_staff:
-            return Cargo.objects.filter().cargo_handled_by_agent(agent=user)
-        return Cargo.objects.filter().all_cargo_for_user(user=user)
+            return queryset.cargo_handled_by_agent(agent=user)
+        return queryset.all_cargo_for_user(user=user)
 
     def patch(self, request, *args, **kwargs):
         """
@@ -118,7 +129,7 @@ class CargoRetrieveUpdateAPIView(RetrieveUpdateAPIView):
 
             # If the destination changes, ensure also that the clearing_agent changes
 
-            data['clearing_agent'] = destination.branch_agent.id
+            data['clearing_agent'] = destination.branch_agent_id
             data['destination'] = destination.city
 
         else:  
@@ -135,3 +146,79 @@ class CargoRetrieveUpdateAPIView(RetrieveUpdateAPIView):
         payload['message'] = 'Succesfully perfomed necessary updates.'
 
         return Response(payload, status=status.HTTP_200_OK)
+
+
+class BulkCargoCreateAPIView(CreateAPIView):
+    """
+    Allow agents to book many Cargo at once, e.g. from a manifest.
+    """
+
+    permission_classes = [IsStaffOrReadOnly]
+    serializer_class = BulkCargoSerializer
+
+    def create(self, request, *args, **kwargs):
+        """
+        Book every valid row and report on each of them.
+        """
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        results = serializer.create(serializer.validated_data)
+        created = sum(1 for result in results if result["status"] == "created")
+
+        payload = {
+            "data": {
+                "results": results,
+                "created": created,
+                "failed": len(results) - created,
+                "message": f"Succesfully created {created} of {len(results)} cargo.",
+            }
+        }
+        response_status = (
+            status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+        )
+        return Response(payload, status=response_status)
+
+
+class ScanEventIngestAPIView(CreateAPIView):
+    """
+    Allow agents to upload the scans of their scanners in batches.
+    """
+
+    permission_classes = [IsStaffOrReadOnly]
+    serializer_class = ScanEventBatchSerializer
+
+    def create(self, request, *args, **kwargs):
+        """
+        Record every valid scan and report the rows that failed.
+        """
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        recorded, failed = serializer.create(serializer.validated_data)
+
+        payload = {
+            "data": {
+                "recorded": recorded,
+                "failed": failed,
+                "message": f"Succesfully recorded {recorded} scans.",
+            }
+        }
+        # scans sent again are valid, even though they are not recorded twice
+        response_status = (
+            status.HTTP_201_CREATED
+            if len(failed) < len(serializer.validated_data["events"])
+            else status.HTTP_400_BAD_REQUEST
+        )
+        return Response(payload, status=response_status)
+
+
+class CargoExportAPIView(ExportAPIView):
+    """
+    Stream every Cargo for bulk exports.
+    """
+
+    queryset = Cargo.objects.all()
+    export_name = "cargo"
@@ -0,0 +1,73 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.utils.cache import get_conditional_response, quote_etag
+
+
+def make_etag(*parts):
+    """
+    Return a strong ETag for the provided version markers.
+    """
+
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode())
+    return quote_etag(digest.hexdigest())
+
+
+class ConditionalGetMixin:
+    """
+    Send strong ETags with GET responses and answer 304 without serializing or rendering anything when the client already has the current version.
+    The ETag is built from the `etag_fields` version columns of the requested object, or of every object on the requested page for lists.
+    """
+
+    etag_fields = ("updated_at",)
+
+    def get_detail_etag(self, lookup_value):
+        """
+        Fetch only the version markers of the requested object.
+        """
+
+        try:
+            version = (
+                self.get_queryset()
+                .filter(**{self.lookup_field: lookup_value})
+                .values_list(*self.etag_fields)
+                .first()
+            )
+        except (ValueError, ValidationError):
+            return None
+        return make_etag(lookup_value, *version) if version else None
+
+    def get_list_etag(self):
+        """
+        Fetch only the ids and version markers of the objects on the requested page.
+        """
+
+        queryset = self.filter_queryset(self.get_queryset()).values(
+            "id", *self.etag_fields
+        )
+        page = self.paginate_queryset(queryset)
+        rows = queryset if page is None else page
+        parts = [tuple(row.values()) for row in rows]
+        if page is not None:
+            parts += [self.paginator.has_next, self.paginator.has_previous]
+        return make_etag(*parts)
+
+    def get_etag(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg in kwargs:
+            return self.get_detail_etag(kwargs[lookup_url_kwarg])
+        return self.get_list_etag()
+
+    def get(self, request, *args, **kwargs):
+        etag = self.etag = self.get_etag(request, *args, **kwargs)
+
+        if etag:
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                not_modified["ETag"] = etag
+                return not_modified
+
+        response = super().get(request, *args, **kwargs)
+        if etag and response.status_code == 200:
+            response["ETag"] = etag
+        return response
@@ -0,0 +1,16 @@
+import uuid
+
+
+class TrackingIDConverter:
+    """
+    Match tracking ids spelt in any case, with or without hyphens, and hand the view a canonical UUID.
+    Anything else does not match the URL at all, so malformed ids are answered with a 404 before the database is touched.
+    """
+
+    regex = "[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}"
+
+    def to_python(self, value):
+        return uuid.UUID(value)
+
+    def to_url(self, value):
+        return str(value)
@@ -0,0 +1,299 @@
+"""
+Server-Sent Events fed by Redis pub/sub.
+
+Every worker process holds one pattern subscription and hands its messages to the streams it serves, so an idle client costs a queue rather than a Redis connection.
+Pub/sub forgets a message once it is delivered, so every event is also appended to a short history of its channel. Clients that reconnect with the `Last-Event-ID` of the last event they saw get the ones they missed from there.
+Events are published as ready-made SSE frames, so fanning one out to thousands of streams does not encode it again.
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.http import StreamingHttpResponse
+from redis.exceptions import RedisError
+from rest_framework.renderers import BaseRenderer
+
+from cargotracker.UTILS.redis_utils import get_redis_connection
+
+
+logger = logging.getLogger(__name__)
+
+ID_KEY = "events:id"
+CHANNEL_PREFIX = "events:"
+HISTORY_KEY = "events:history:{channel}"
+
+# how long clients wait before reconnecting, in milliseconds
+RETRY_MS = 3000
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Let views be negotiated by `EventSource` clients, which only accept `text/event-stream`. Errors are still rendered as JSON.
+    """
+
+    media_type = "text/event-stream"
+    format = "event-stream"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder)
+
+
+def format_event(event_id, name, data):
+    """
+    Return the SSE frame of an event.
+    """
+
+    return f"id: {event_id}\nevent: {name}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+def frame_id(frame):
+    """
+    Return the id of an SSE frame made by `format_event`.
+    """
+
+    return int(frame[len("id: ") : frame.index("\n")])
+
+
+def publish_many(events):
+    """
+    Publish `(channels, name, data)` events with one round trip for their ids and one for their frames.
+    Return the frames, or an empty list when Redis cannot be reached.
+    """
+
+    if not events:
+        return []
+    history_length = settings.EVENT_STREAM["HISTORY_LENGTH"]
+    history_ttl = settings.EVENT_STREAM["HISTORY_TTL"]
+    try:
+        redis = get_redis_connection()
+        first_id = redis.incrby(ID_KEY, len(events)) - len(events) + 1
+
+        frames = []
+        pipeline = redis.pipeline(transaction=False)
+        for event_id, (channels, name, data) in enumerate(events, first_id):
+            frame = format_event(event_id, name, data)
+            frames.append(frame)
+            for channel in channels:
+                key = HISTORY_KEY.format(channel=channel)
+                pipeline.rpush(key, frame)
+                pipeline.ltrim(key, -history_length, -1)
+                pipeline.expire(key, history_ttl)
+                pipeline.publish(CHANNEL_PREFIX + channel, frame)
+        pipeline.execute()
+        return frames
+    except RedisError:
+        logger.exception("Could not publish events.")
+        return []
+
+
+def publish(channels, name, data):
+    """
+    Publish one event to a few channels.
+    """
+
+    return publish_many([(channels, name, data)])
+
+
+def read_history(channels, after):
+    """
+    Return the frames of the channels with ids after `after`, oldest first.
+    """
+
+    try:
+        pipeline = get_redis_connection().pipeline(transaction=False)
+        for channel in channels:
+            pipeline.lrange(HISTORY_KEY.format(channel=channel), 0, -1)
+        histories = pipeline.execute()
+    except RedisError:
+        logger.exception("Could not read the event history.")
+        return []
+
+    frames = {}
+    for history in histories:
+        for frame in history:
+            frame = frame.decode()
+            event_id = frame_id(frame)
+            if event_id > after:
+                frames[event_id] = frame
+    return [frames[event_id] for event_id in sorted(frames)]
+
+
+class Listener(queue.Queue):
+    """
+    The frames waiting to be sent to one stream. A listener that fell too far behind is closed, and its client resumes from the history.
+    """
+
+    closed = False
+
+
+class Broadcaster:
+    """
+    The pattern subscription of this process, read by a background thread that hands every frame to the listeners of its channel.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.listeners = {}
+        self.thread = None
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(
+                target=self.run, name="event-broadcaster", daemon=True
+            )
+            self.thread.start()
+
+    def subscribe(self, channels):
+        """
+        Return a new Listener for the frames published to the channels.
+        """
+
+        listener = Listener(maxsize=settings.EVENT_STREAM["QUEUE_SIZE"])
+        with self.lock:
+            for channel in channels:
+                self.listeners.setdefault(channel, set()).add(listener)
+            self.start()
+        return listener
+
+    def unsubscribe(self, listener):
+        with self.lock:
+            for channel in list(self.listeners):
+                self.listeners[channel].discard(listener)
+                if not self.listeners[channel]:
+                    del self.listeners[channel]
+
+    def close(self, listener):
+        listener.closed = True
+        self.unsubscribe(listener)
+
+    def dispatch(self, channel, frame):
+        with self.lock:
+            listeners = list(self.listeners.get(channel, ()))
+        for listener in listeners:
+            try:
+                listener.put_nowait(frame)
+            except queue.Full:
+                self.close(listener)
+
+    def run(self):
+        while True:
+            try:
+                pubsub = get_redis_connection().pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        channel = message["channel"].decode()[len(CHANNEL_PREFIX) :]
+                        self.dispatch(channel, message["data"].decode())
+            except RedisError:
+                logger.exception("Lost the event subscription.")
+                # events published in the meantime are only in the history, so send everyone there
+                with self.lock:
+                    listeners = {
+                        listener
+                        for channel_listeners in self.listeners.values()
+                        for listener in channel_listeners
+                    }
+                for listener in listeners:
+                    self.close(listener)
+                time.sleep(1)
+
+
+broadcaster = Broadcaster()
+
+
+class RecentIds:
+    """
+    The ids of the last `size` frames a stream sent. Ids are taken before their frames are published, so frames can arrive out of order and only ids sent already are skipped.
+    """
+
+    def __init__(self, size):
+        self.ids = set()
+        self.order = deque()
+        self.size = size
+
+    def __contains__(self, event_id):
+        return event_id in self.ids
+
+    def add(self, event_id):
+        if len(self.order) == self.size:
+            self.ids.discard(self.order.popleft())
+        self.order.append(event_id)
+        self.ids.add(event_id)
+
+
+def stream_events(channels, last_event_id=None):
+    """
+    Yield the frames of the channels, after replaying the ones since `last_event_id`, with a comment every `HEARTBEAT` seconds to keep idle connections open.
+    The stream ends after `MAX_DURATION` seconds or when it falls behind, and clients reconnect from their last event.
+    """
+
+    # the stream holds on to its worker for hours, but never needs the database
+    if not connection.in_atomic_block:
+        connection.close()
+
+    heartbeat = settings.EVENT_STREAM["HEARTBEAT"]
+    deadline = time.monotonic() + settings.EVENT_STREAM["MAX_DURATION"]
+    # subscribe before reading the history, so no event falls in between
+    listener = broadcaster.subscribe(channels)
+    # the replay, which live frames overlap, and the frames published to several of the channels
+    sent = RecentIds(
+        settings.EVENT_STREAM["HISTORY_LENGTH"] * len(channels)
+        + settings.EVENT_STREAM["QUEUE_SIZE"]
+    )
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        if last_event_id is not None:
+            for frame in read_history(channels, last_event_id):
+                sent.add(frame_id(frame))
+                yield frame
+
+        while time.monotonic() < deadline:
+            try:
+                frame = listener.get(timeout=heartbeat)
+            except queue.Empty:
+                if listener.closed:
+                    return
+                yield ": heartbeat\n\n"
+                continue
+            event_id = frame_id(frame)
+            if event_id in sent:
+                continue
+            sent.add(event_id)
+            yield frame
+    finally:
+        broadcaster.unsubscribe(listener)
+
+
+def parse_last_event_id(request):
+    """
+    Return the id of the last event a client saw, from the `Last-Event-ID` header or the `last_event_id` query parameter, or None.
+    """
+
+    value = request.META.get("HTTP_LAST_EVENT_ID") or request.GET.get("last_event_id")
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def event_stream_response(request, channels):
+    """
+    Return a streaming response with the events of the channels.
+    """
+
+    response = StreamingHttpResponse(
+        stream_events(channels, parse_last_event_id(request)),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    # let events through proxies as they happen
+    response["X-Accel-Buffering"] = "no"
+    return response
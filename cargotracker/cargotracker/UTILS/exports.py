@@ -0,0 +1,93 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.generics import GenericAPIView
+from rest_framework.response import Response
+
+from authentication.permissions import IsSuperUser
+
+
+EXPORT_CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+class Echo:
+    """
+    A file-like object that hands back whatever is written to it, so that the csv writer can be used to produce lines one at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_ndjson(columns, rows):
+    """
+    Yield one JSON document per row.
+    """
+
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, row))) + "\n"
+
+
+def iter_csv(columns, rows):
+    """
+    Yield the header and then one CSV line per row.
+    """
+
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_export(queryset, export_format, chunk_size=None):
+    """
+    Lazily turn a queryset returned by a `for_export()` queryset method into NDJSON or CSV lines.
+    Rows are fetched in chunks from a server-side cursor, so memory stays flat however many rows there are.
+    """
+
+    if export_format not in EXPORT_CONTENT_TYPES:
+        raise TypeError(
+            f"Exports can only be made as {', '.join(EXPORT_CONTENT_TYPES)}."
+        )
+
+    columns = [name for name, _ in queryset.export_columns]
+    rows = queryset.iterator(chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE)
+
+    if export_format == "csv":
+        return iter_csv(columns, rows)
+    return iter_ndjson(columns, rows)
+
+
+class ExportAPIView(GenericAPIView):
+    """
+    Stream the rows of `get_queryset().for_export()` to admins. Use `?output=csv` for CSV, otherwise NDJSON is returned.
+    """
+
+    permission_classes = [IsSuperUser]
+    export_name = None
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.query_params.get("output", "ndjson")
+
+        try:
+            lines = stream_export(self.get_queryset().for_export(), export_format)
+        except TypeError as e:
+            return Response(
+                {"errors": {"output": e.args[0]}}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        response = StreamingHttpResponse(
+            lines, content_type=EXPORT_CONTENT_TYPES[export_format]
+        )
+        response[
+            "Content-Disposition"
+        ] = f'attachment; filename="{self.export_name}.{export_format}"'
+        return response
@@ -0,0 +1,367 @@
+"""
+A small load generator for the CargoTracker API, built on the standard library only.
+
+Virtual users log in through `/api/auth/login/` and keep calling the real endpoints with the traffic mix of their role until the run is over.
+Every request is timed and grouped by endpoint, with the ids in paths replaced by placeholders, so runs against different data can be compared.
+Each virtual user sends its own client IP in `X-Forwarded-For`, as the proxy in front of the server would, so per-IP throttles see them apart.
+"""
+
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+
+LOGIN_PATH = "/api/auth/login/"
+
+ATTACKER_IP = "203.0.113.1"
+
+
+class LoginFailed(Exception):
+    """
+    Raised when a virtual user cannot log in, since none of its requests would mean anything.
+    """
+
+
+def percentile(sorted_values, percent):
+    """
+    Return the nearest-rank percentile of already sorted values.
+    """
+
+    if not sorted_values:
+        return None
+    rank = math.ceil(percent / 100 * len(sorted_values))
+    return sorted_values[max(rank - 1, 0)]
+
+
+def summarize(timings, statuses, duration):
+    """
+    Latency percentiles in milliseconds, throughput and status codes of one group of requests.
+    """
+
+    timings = sorted(timings)
+    errors = sum(
+        count for status, count in statuses.items() if status is None or status >= 400
+    )
+    return {
+        "requests": len(timings),
+        "errors": errors,
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "throughput_rps": round(len(timings) / duration, 3) if duration else None,
+        "latency_ms": {
+            "p50": round(percentile(timings, 50) * 1000, 3) if timings else None,
+            "p95": round(percentile(timings, 95) * 1000, 3) if timings else None,
+            "p99": round(percentile(timings, 99) * 1000, 3) if timings else None,
+            "mean": round(sum(timings) / len(timings) * 1000, 3) if timings else None,
+            "max": round(timings[-1] * 1000, 3) if timings else None,
+        },
+    }
+
+
+class Recorder:
+    """
+    Thread-safe store of the time and status of every request, grouped by endpoint.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def record(self, endpoint, elapsed, status):
+        with self.lock:
+            self.timings[endpoint].append(elapsed)
+            self.statuses[endpoint][status] += 1
+
+    def report(self, duration):
+        """
+        Return the summary of every endpoint and of all of them together.
+        """
+
+        with self.lock:
+            endpoints = {
+                endpoint: summarize(
+                    self.timings[endpoint], self.statuses[endpoint], duration
+                )
+                for endpoint in sorted(self.timings)
+            }
+            total = summarize(
+                [elapsed for timings in self.timings.values() for elapsed in timings],
+                sum(self.statuses.values(), Counter()),
+                duration,
+            )
+        return {"endpoints": endpoints, "total": total}
+
+
+class LoadTestClient:
+    """
+    JSON client of the API that records every request it makes.
+    """
+
+    def __init__(self, base_url, recorder, client_ip=None, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.client_ip = client_ip
+        self.timeout = timeout
+        self.token = None
+
+    def request(self, method, path, data=None, endpoint=None):
+        """
+        Make a request and return its status and decoded payload. The status is None when the server could not be reached.
+        `endpoint` is the path recorded for it, e.g. `/api/cargo/<id>/`, and defaults to the path itself.
+        """
+
+        headers = {"Accept": "application/json"}
+        body = None
+        if data is not None:
+            body = json.dumps(data).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        if self.client_ip:
+            headers["X-Forwarded-For"] = self.client_ip
+        request = urllib.request.Request(
+            self.base_url + path, data=body, headers=headers, method=method
+        )
+
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status, content = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, content = e.code, e.read()
+        except OSError:
+            status, content = None, b""
+        self.recorder.record(
+            f"{method} {endpoint or path}", time.perf_counter() - start, status
+        )
+
+        try:
+            payload = json.loads(content) if content else {}
+        except ValueError:
+            payload = {}
+        return status, payload
+
+    def login(self, email, password):
+        status, payload = self.request(
+            "POST", LOGIN_PATH, {"email": email, "password": password}
+        )
+        if status != 200:
+            raise LoginFailed(f"{email} could not log in, the server answered {status}.")
+        self.token = payload["data"]["access"]
+
+
+class VirtualUser:
+    """
+    A logged in user picking its next request at random, weighted by `actions`.
+    Detail pages are only requested for ids seen in earlier list pages, like a user clicking through them would.
+    """
+
+    actions = {}
+
+    def __init__(self, client, email, population, rng):
+        self.client = client
+        self.email = email
+        self.population = population
+        self.rng = rng
+        self.cargo_ids = []
+        self.tracking_ids = []
+
+    def run(self, deadline, password):
+        self.password = password
+        self.client.login(self.email, password)
+        names, weights = zip(*self.actions.items())
+        while time.monotonic() < deadline:
+            getattr(self, self.rng.choices(names, weights)[0])()
+
+    def login(self):
+        """
+        Log in again, like a new session would. The current token is kept if that fails.
+        """
+
+        try:
+            self.client.login(self.email, self.password)
+        except LoginFailed:
+            pass
+
+    def list_cargo(self):
+        status, payload = self.client.request("GET", "/api/cargo/")
+        if status == 200:
+            self.cargo_ids = [cargo["id"] for cargo in payload.get("data", [])]
+
+    def cargo_detail(self):
+        if not self.cargo_ids:
+            return self.list_cargo()
+        cargo_id = self.rng.choice(self.cargo_ids)
+        self.client.request("GET", f"/api/cargo/{cargo_id}/", endpoint="/api/cargo/<id>/")
+
+    def list_orders(self):
+        status, payload = self.client.request("GET", "/api/orders/")
+        if status == 200:
+            self.tracking_ids = [order["tracking_id"] for order in payload.get("data", [])]
+
+    def order_detail(self):
+        if not self.tracking_ids:
+            return self.list_orders()
+        tracking_id = self.rng.choice(self.tracking_ids)
+        self.client.request(
+            "GET", f"/api/orders/{tracking_id}/", endpoint="/api/orders/<tracking_id>/"
+        )
+
+
+class CustomerUser(VirtualUser):
+    """
+    Customers mostly track the parcels they sent or are about to receive.
+    """
+
+    actions = {
+        "login": 2,
+        "list_cargo": 20,
+        "cargo_detail": 15,
+        "list_orders": 25,
+        "order_detail": 38,
+    }
+
+
+class AgentUser(VirtualUser):
+    """
+    Agents book cargo at their branch and go through what their branch handles.
+    """
+
+    actions = {
+        "list_cargo": 30,
+        "cargo_detail": 15,
+        "list_orders": 25,
+        "order_detail": 10,
+        "book_cargo": 20,
+    }
+
+    def book_cargo(self):
+        city = self.population["agent_cities"][self.email]
+        destinations = [other for other in self.population["cities"] if other != city]
+        sender, recepient = self.rng.sample(self.population["customer"], 2)
+        self.client.request(
+            "POST",
+            "/api/cargo/",
+            {
+                "title": "Load test parcel",
+                "weight": f"{self.rng.randrange(50, 99999) / 100:.2f}",
+                "sender": sender,
+                "recepient": recepient,
+                "booking_station": city,
+                "destination": self.rng.choice(destinations),
+            },
+        )
+
+
+class AdminUser(VirtualUser):
+    """
+    Admins oversee every branch, cargo and order.
+    """
+
+    actions = {"list_branches": 10, "list_cargo": 35, "list_orders": 35, "order_detail": 20}
+
+    def list_branches(self):
+        self.client.request("GET", "/api/branches/")
+
+
+class Attacker(VirtualUser):
+    """
+    Guesses passwords for made-up accounts as fast as it can, like a credential stuffing run from a single host.
+    Its requests are recorded apart from the logins of real users.
+    """
+
+    def run(self, deadline, password):
+        attempt = 0
+        while time.monotonic() < deadline:
+            self.client.request(
+                "POST",
+                LOGIN_PATH,
+                {"email": f"victim{attempt}@example.com", "password": "guess"},
+                endpoint=f"{LOGIN_PATH} (attack)",
+            )
+            attempt += 1
+
+
+ROLES = {"customer": CustomerUser, "agent": AgentUser, "admin": AdminUser}
+
+
+def client_ip(index):
+    return f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}"
+
+
+def run_load_test(
+    base_url, population, mix, concurrency, duration, password, attackers=0, seed=None
+):
+    """
+    Run `concurrency` virtual users for `duration` seconds and return the report of their requests.
+    :args:
+    population - dictionary with the `customer`, `agent` and `admin` emails, the `cities` of all branches and the city of each agent in `agent_cities`
+    mix - dictionary with the share of virtual users of each role
+    attackers - number of extra virtual users flooding the login endpoint with bad passwords from one IP during the whole run
+    """
+
+    roles = [role for role, weight in mix.items() if weight and population.get(role)]
+    if not roles:
+        raise ValueError("There are no users for any role of the mix.")
+
+    rng = random.Random(seed)
+    recorder = Recorder()
+    failures = []
+    users = []
+    roles_used = Counter()
+    for index in range(concurrency):
+        role = rng.choices(roles, [mix[role] for role in roles])[0]
+        emails = population[role]
+        roles_used[role] += 1
+        users.append(
+            ROLES[role](
+                LoadTestClient(base_url, recorder, client_ip(index)),
+                emails[index % len(emails)],
+                population,
+                random.Random(rng.random()),
+            )
+        )
+
+    for _ in range(attackers):
+        users.append(
+            Attacker(
+                LoadTestClient(base_url, recorder, ATTACKER_IP), None, population, rng
+            )
+        )
+
+    def work(user, deadline):
+        try:
+            user.run(deadline, password)
+        except LoginFailed as e:
+            failures.append(str(e))
+
+    started_at = datetime.now(timezone.utc)
+    start = time.monotonic()
+    threads = [
+        threading.Thread(target=work, args=(user, start + duration), daemon=True)
+        for user in users
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    report = recorder.report(elapsed)
+    report["meta"] = {
+        "base_url": base_url,
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "duration_s": round(elapsed, 3),
+        "concurrency": concurrency,
+        "mix": {role: mix[role] for role in roles},
+        "users": dict(roles_used),
+        "attackers": attackers,
+        "login_failures": failures,
+    }
+    return report
@@ -0,0 +1,264 @@
+"""
+Batched email delivery.
+
+Emails are spooled to a Redis list and drained by the huey worker in batches. Each worker thread keeps one long-lived connection to the mail server instead of opening one per email.
+A drained batch is moved to a processing list of its own and only removed once it was sent, so the batches of a worker that died are queued again. Emails that could not be sent go back to the queue, until they failed `MAX_ATTEMPTS` drains.
+"""
+
+import json
+import logging
+import smtplib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from redis.exceptions import RedisError
+
+from .redis_utils import get_redis_connection
+
+
+logger = logging.getLogger(__name__)
+
+# emails are pushed on the left and drained from the right, oldest first
+PENDING_KEY = "mail:pending"
+# batch id -> time it was claimed
+BATCHES_KEY = "mail:batches"
+PROCESSING_KEY = "mail:processing:{batch}"
+FAILED_KEY = "mail:failed"
+METRICS_KEY = "mail:metrics"
+
+_local = threading.local()
+
+
+def enqueue_emails(datatuple):
+    """
+    Spool `(subject, message, sender, recepients)` tuples for delivery.
+    """
+
+    get_redis_connection().lpush(
+        PENDING_KEY,
+        *[
+            json.dumps(
+                {
+                    "subject": subject,
+                    "message": message,
+                    "sender": sender,
+                    "recepients": list(recepients),
+                    "attempts": 0,
+                }
+            )
+            for subject, message, sender, recepients in datatuple
+        ],
+    )
+
+
+def count_pending_emails():
+    return get_redis_connection().llen(PENDING_KEY)
+
+
+def build_message(email):
+    return EmailMessage(
+        subject=email["subject"],
+        body=email["message"],
+        from_email=email["sender"],
+        to=email["recepients"],
+    )
+
+
+def claim_pending_emails(count):
+    """
+    Move up to `count` spooled emails to the processing list of a new batch.
+    Return the batch id and the emails, or None when nothing is pending.
+    """
+
+    batch = uuid.uuid4().hex
+    pipeline = get_redis_connection().pipeline()
+    pipeline.zadd(BATCHES_KEY, {batch: time.time()})
+    for _ in range(count):
+        pipeline.rpoplpush(PENDING_KEY, PROCESSING_KEY.format(batch=batch))
+    claimed = [email for email in pipeline.execute()[1:] if email is not None]
+
+    if not claimed:
+        get_redis_connection().zrem(BATCHES_KEY, batch)
+        return None
+    return batch, [json.loads(email) for email in claimed]
+
+
+def finish_batch(batch, emails, delivered):
+    """
+    Drop the processing list of a batch once it was sent. Emails that were not sent are queued again, or set aside in the failed list after `MAX_ATTEMPTS` drains.
+    """
+
+    max_attempts = settings.EMAIL_DISPATCH["MAX_ATTEMPTS"]
+    pipeline = get_redis_connection().pipeline()
+    for email, sent in zip(emails, delivered):
+        if sent:
+            continue
+        email = dict(email, attempts=email.get("attempts", 0) + 1)
+        if email["attempts"] < max_attempts:
+            pipeline.lpush(PENDING_KEY, json.dumps(email))
+        else:
+            logger.error(
+                "Gave up on the email to %s after %d attempts.",
+                ", ".join(email["recepients"]),
+                email["attempts"],
+            )
+            pipeline.rpush(FAILED_KEY, json.dumps(email))
+    pipeline.delete(PROCESSING_KEY.format(batch=batch))
+    pipeline.zrem(BATCHES_KEY, batch)
+    pipeline.execute()
+
+
+def requeue_stale_batches(timeout=None):
+    """
+    Queue the emails of batches claimed more than `timeout` seconds ago again, e.g. when their worker died while sending them.
+    Return the number of emails queued again.
+    """
+
+    if timeout is None:
+        timeout = settings.EMAIL_DISPATCH["CLAIM_TIMEOUT"]
+    redis = get_redis_connection()
+    requeued = 0
+    for batch in redis.zrangebyscore(BATCHES_KEY, 0, time.time() - timeout):
+        batch = batch.decode()
+        key = PROCESSING_KEY.format(batch=batch)
+        while redis.rpoplpush(key, PENDING_KEY) is not None:
+            requeued += 1
+        redis.zrem(BATCHES_KEY, batch)
+    if requeued:
+        logger.warning("Queued %d emails of stale batches again.", requeued)
+    return requeued
+
+
+class MailDispatcher:
+    """
+    Sends emails over one connection that is opened on first use and kept open between batches.
+    A failed send closes the connection and retries the email on a fresh one, up to `max_retries` times.
+    """
+
+    retry_errors = (smtplib.SMTPException, OSError)
+
+    def __init__(self, max_retries=None, **connection_kwargs):
+        """
+        :args:
+        max_retries - retries per email, defaults to the `EMAIL_DISPATCH` setting
+        connection_kwargs - passed on to `get_connection`, e.g. `backend`, `host` or `port`
+        """
+
+        if max_retries is None:
+            max_retries = settings.EMAIL_DISPATCH["MAX_RETRIES"]
+        self.max_retries = max_retries
+        self.connection_kwargs = connection_kwargs
+        self.connection = None
+
+    def open(self):
+        if self.connection is None:
+            connection = get_connection(fail_silently=False, **self.connection_kwargs)
+            connection.open()
+            self.connection = connection
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except self.retry_errors:
+                pass
+            self.connection = None
+
+    def send_message(self, message):
+        """
+        Send one email, reconnecting between attempts. Return the number of reconnects and whether it was sent.
+        """
+
+        reconnects = 0
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                reconnects += 1
+            try:
+                self.open().send_messages([message])
+                return reconnects, True
+            except self.retry_errors:
+                self.close()
+                if attempt == self.max_retries:
+                    logger.exception(
+                        "Could not send email to %s.", ", ".join(message.to)
+                    )
+        return reconnects, False
+
+    def deliver(self, messages):
+        """
+        Send a batch of emails over the shared connection and record the throughput. Return whether each one was sent.
+        """
+
+        start = time.perf_counter()
+        delivered = []
+        reconnects = 0
+        for message in messages:
+            retried, sent = self.send_message(message)
+            reconnects += retried
+            delivered.append(sent)
+        seconds = time.perf_counter() - start
+
+        sent = sum(delivered)
+        failed = len(delivered) - sent
+        record_metrics(sent, failed, reconnects, seconds)
+        logger.info(
+            "Sent %d emails in %.3fs (%.1f/s), %d failed, %d reconnects.",
+            sent,
+            seconds,
+            sent / seconds if seconds else 0,
+            failed,
+            reconnects,
+        )
+        return delivered
+
+    def send_messages(self, messages):
+        """
+        Send a batch of emails and return how many were sent.
+        """
+
+        return sum(self.deliver(messages))
+
+
+def get_dispatcher():
+    """
+    Return the dispatcher of the current worker thread.
+    """
+
+    if getattr(_local, "dispatcher", None) is None:
+        _local.dispatcher = MailDispatcher()
+    return _local.dispatcher
+
+
+def record_metrics(sent, failed, reconnects, seconds):
+    try:
+        pipeline = get_redis_connection().pipeline()
+        pipeline.hincrby(METRICS_KEY, "batches", 1)
+        pipeline.hincrby(METRICS_KEY, "sent", sent)
+        pipeline.hincrby(METRICS_KEY, "failed", failed)
+        pipeline.hincrby(METRICS_KEY, "reconnects", reconnects)
+        pipeline.hincrbyfloat(METRICS_KEY, "seconds", seconds)
+        pipeline.execute()
+    except RedisError:
+        logger.exception("Could not record the email metrics.")
+
+
+def get_mail_stats():
+    """
+    Return the delivery counters so far, with the average throughput in emails per second.
+    """
+
+    metrics = {
+        key.decode(): float(value)
+        for key, value in get_redis_connection().hgetall(METRICS_KEY).items()
+    }
+    stats = {
+        key: int(metrics.get(key, 0))
+        for key in ("batches", "sent", "failed", "reconnects")
+    }
+    seconds = metrics.get("seconds", 0)
+    stats["emails_per_second"] = stats["sent"] / seconds if seconds else 0
+    return stats
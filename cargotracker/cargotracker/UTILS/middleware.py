@@ -0,0 +1,87 @@
+"""
+Per-request SQL query budgets.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised in `enforce` mode when a request ran more queries than its endpoint's budget.
+    """
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper that counts queries and adds up their time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+def get_query_budget(request):
+    """
+    Return the budget of the endpoint that served this request, or None if it has none.
+    Budgets are keyed by URL name, either as a number of queries or as a dictionary of them per HTTP method.
+    """
+
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return None
+
+    budget = settings.QUERY_BUDGET["BUDGETS"].get(match.view_name)
+    if isinstance(budget, dict):
+        return budget.get(request.method)
+    return budget
+
+
+class QueryBudgetMiddleware:
+    """
+    Count the queries each request runs and how long they take, and report both in the `X-DB-Query-Count` and `X-DB-Time-ms` headers.
+    Requests over their endpoint's budget are logged in `log` mode and raise `QueryBudgetExceeded` in `enforce` mode. Nothing is recorded in `off` mode.
+    Streaming responses only count the queries run before streaming started.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = settings.QUERY_BUDGET["MODE"]
+        if mode == "off":
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+
+        response["X-DB-Query-Count"] = str(recorder.count)
+        response["X-DB-Time-ms"] = f"{recorder.duration * 1000:.3f}"
+
+        budget = get_query_budget(request)
+        if budget is not None and recorder.count > budget:
+            message = (
+                f"{request.method} {request.path} ran {recorder.count} queries, "
+                f"over its budget of {budget}."
+            )
+            if mode == "enforce":
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return response
@@ -0,0 +1,27 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class DataCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the primary key. Pages never need a COUNT(*), so deep pages cost the same as the first one.
+    """
+
+    ordering = "-id"
+    page_size = settings.PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = settings.MAX_PAGE_SIZE
+
+    def get_paginated_response(self, data):
+        """
+        Return the page inside our usual `data` envelope, with opaque cursors to the neighbouring pages.
+        """
+
+        return Response(
+            {
+                "data": data,
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+            }
+        )
@@ -0,0 +1,19 @@
+import redis
+from django.conf import settings
+
+
+_connection = None
+
+
+def get_redis_connection():
+    """
+    Return a client for the Redis instance that huey also uses. The client and its connection pool are shared by the whole process.
+    """
+
+    global _connection
+    if _connection is None:
+        if settings.REDIS_URL:
+            _connection = redis.Redis.from_url(settings.REDIS_URL)
+        else:
+            _connection = redis.Redis()
+    return _connection
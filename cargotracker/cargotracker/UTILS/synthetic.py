@@ -0,0 +1,223 @@
+"""
+Helpers that generate synthetic data in bulk, for benchmarks and load tests.
+"""
+
+import random
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+
+from branches.models import Branch
+from branches.registry import invalidate_branches
+from cargo.models import Cargo
+from orders.models import Order
+
+
+User = get_user_model()
+
+SYNTHETIC_PASSWORD = "syntheticpassword"
+SYNTHETIC_DOMAIN = "synthetic.cargotracker.app"
+BATCH_SIZE = 5000
+
+
+def new_tag():
+    """
+    Return a short random tag that keeps the data of one run apart from the others.
+    """
+
+    return uuid.uuid4().hex[:6]
+
+
+def synthetic_email(role, index, tag):
+    return f"{role}{index}.{tag}@{SYNTHETIC_DOMAIN}"
+
+
+def batches(iterable, size):
+    """
+    Yield lists of at most `size` items.
+    """
+
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def create_users(
+    count, role, tag, is_staff=False, is_superuser=False, batch_size=BATCH_SIZE
+):
+    """
+    Insert `count` users in bulk and return their ids.
+    Every user shares one password hash, since hashing is deliberately slow.
+    """
+
+    password = make_password(SYNTHETIC_PASSWORD)
+    users = (
+        User(
+            email=synthetic_email(role, index, tag),
+            username=synthetic_email(role, index, tag),
+            password=password,
+            is_staff=is_staff,
+            is_superuser=is_superuser,
+        )
+        for index in range(count)
+    )
+    for batch in batches(users, batch_size):
+        User.objects.bulk_create(batch)
+
+    return list(
+        User.objects.filter(
+            email__startswith=role, email__endswith=f".{tag}@{SYNTHETIC_DOMAIN}"
+        )
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+
+def role_emails(role, tag):
+    """
+    Return the emails of the users created for `role` in the run tagged `tag`.
+    """
+
+    return list(
+        User.objects.filter(
+            email__startswith=role, email__endswith=f".{tag}@{SYNTHETIC_DOMAIN}"
+        )
+        .order_by("id")
+        .values_list("email", flat=True)
+    )
+
+
+def create_branches(count, tag):
+    """
+    Insert `count` branches, each with its own agent, and return `(branch_id, agent_id)` pairs.
+    The first branch becomes the main branch if there is none yet.
+    """
+
+    agent_ids = create_users(count, "agent", tag, is_staff=True)
+    has_main_branch = Branch.objects.filter(main_branch=True).exists()
+    Branch.objects.bulk_create(
+        Branch(
+            city=f"City {index} {tag}",
+            branch_agent_id=agent_id,
+            main_branch=(index == 0 and not has_main_branch),
+        )
+        for index, agent_id in enumerate(agent_ids)
+    )
+    # bulk_create skips the signal that keeps the branch registry current
+    invalidate_branches()
+    return list(
+        Branch.objects.filter(branch_agent_id__in=agent_ids)
+        .order_by("id")
+        .values_list("id", "branch_agent_id")
+    )
+
+
+def create_cargo(count, customer_ids, branches, batch_size=BATCH_SIZE):
+    """
+    Book `count` cargo between random customers and branches.
+    """
+
+    def generate():
+        for index in range(count):
+            sender, recepient = random.sample(customer_ids, 2)
+            (station, booking_agent), (destination, clearing_agent) = random.sample(
+                branches, 2
+            )
+            yield Cargo(
+                title=f"Parcel {index}",
+                sender_id=sender,
+                recepient_id=recepient,
+                booking_station_id=station,
+                booking_agent_id=booking_agent,
+                destination_id=destination,
+                clearing_agent_id=clearing_agent,
+                weight=Decimal(random.randrange(50, 99999)) / 100,
+            )
+
+    for batch in batches(generate(), batch_size):
+        Cargo.objects.bulk_create(batch)
+
+
+def create_orders(count=None, batch_size=BATCH_SIZE):
+    """
+    Book orders for cargo that has none yet, oldest cargo first, and return how many were created.
+    """
+
+    created = 0
+    last_id = 0
+    while count is None or created < count:
+        limit = batch_size if count is None else min(batch_size, count - created)
+        unbooked = list(
+            Cargo.objects.filter(order__isnull=True, id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "weight")[:limit]
+        )
+        if not unbooked:
+            break
+
+        orders = []
+        for cargo_id, weight in unbooked:
+            price_per_unit_weight = Decimal(random.randrange(100, 5000)) / 100
+            orders.append(
+                Order(
+                    cargo_id=cargo_id,
+                    price_per_unit_weight=price_per_unit_weight,
+                    price=weight * price_per_unit_weight,
+                    status=random.choice(Order.STATUS_CHOICES)[0],
+                )
+            )
+        Order.objects.bulk_create(orders)
+
+        created += len(orders)
+        last_id = unbooked[-1][0]
+
+    return created
+
+
+def create_outstanding_tokens(
+    count, user_ids, tag, blacklisted=0.0, expired=0.0, batch_size=BATCH_SIZE
+):
+    """
+    Insert `count` outstanding refresh tokens for random users. The `blacklisted` and `expired` shares of them are blacklisted and already expired.
+    The tokens are only rows, they cannot be decoded.
+    """
+
+    now = timezone.now()
+
+    def generate():
+        for index in range(count):
+            is_blacklisted = random.random() < blacklisted
+            is_expired = random.random() < expired
+            yield OutstandingToken(
+                user_id=random.choice(user_ids),
+                jti=f"{tag}-{'b' if is_blacklisted else 'o'}-{index}",
+                token="",
+                created_at=now,
+                expires_at=now + timedelta(days=-1 if is_expired else 1),
+            )
+
+    for batch in batches(generate(), batch_size):
+        OutstandingToken.objects.bulk_create(batch)
+
+    to_blacklist = list(
+        OutstandingToken.objects.filter(jti__startswith=f"{tag}-b-")
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    for batch in batches(to_blacklist, batch_size):
+        BlacklistedToken.objects.bulk_create(
+            BlacklistedToken(token_id=token_id) for token_id in batch
+        )
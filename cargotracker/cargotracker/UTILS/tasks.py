@@ -1,13 +1,13 @@
-from django.core.mail import send_mail
+from django.conf import settings
+from huey import crontab
 from huey.contrib.djhuey import periodic_task, task
 
+from . import mail
 
-@task()
-def send_async_email(
-    subject=None, message=None, sender=None, recepients=[], fail_silently=True
-):
+
+def send_async_email(subject=None, message=None, sender=None, recepients=[]):
     """
-    Send emails asynchronously.
+    Send emails asynchronously. The email is spooled and delivered by the worker with the rest of the pending batch.
     """
     if not subject:
         raise TypeError("Subject cannot be empty")
@@ -18,4 +18,53 @@ def send_async_email(
     if not recepients:
         raise TypeError("Recipients cannot be empty")
 
-    return send_mail(subject, message, sender, recepients)
+    return send_async_mass_email(
+        datatuple=[(subject, message, sender, recepients)]
+    )
+
+
+def send_async_mass_email(datatuple=()):
+    """
+    Send many emails asynchronously. `datatuple` holds a `(subject, message, sender, recepients)` tuple per email.
+    Emails that cannot be sent are queued again by the worker, and logged once they are given up on.
+    """
+    if not datatuple:
+        raise TypeError("There must be at least one email to send")
+
+    mail.enqueue_emails(datatuple)
+    return send_pending_emails()
+
+
+@task()
+def send_pending_emails():
+    """
+    Drain the spooled emails in batches over this worker's mail connection.
+    Whichever drain runs first sends everything pending, the ones queued after it find little or nothing left to do.
+    Emails that failed are queued again behind the rest, and wait for the next drain.
+    """
+
+    sent = 0
+    dispatcher = mail.get_dispatcher()
+    remaining = mail.count_pending_emails()
+    while remaining > 0:
+        claim = mail.claim_pending_emails(
+            min(remaining, settings.EMAIL_DISPATCH["BATCH_SIZE"])
+        )
+        if claim is None:
+            break
+        batch, emails = claim
+        remaining -= len(emails)
+        delivered = dispatcher.deliver([mail.build_message(email) for email in emails])
+        mail.finish_batch(batch, emails, delivered)
+        sent += sum(delivered)
+    return sent
+
+
+@periodic_task(crontab(minute="*"))
+def send_leftover_emails():
+    """
+    Pick up emails whose drain task was lost or whose worker died while sending them, e.g. when a worker was restarted.
+    """
+
+    mail.requeue_stale_batches()
+    return send_pending_emails.call_local()
@@ -0,0 +1,127 @@
+from decimal import Decimal
+from unittest import mock
+
+import fakeredis
+from django.contrib.auth import get_user_model
+from django.db import connection
+from huey.contrib.djhuey import HUEY
+from rest_framework.test import APITestCase
+
+from branches import registry as branch_registry, routing
+from branches.models import Branch
+from branches.registry import registry
+from branches.routing import router
+from cargo.models import Cargo
+
+
+User = get_user_model()
+
+TEST_PASSWORD = "testpassword"
+
+
+def create_user(email, **kwargs):
+    """
+    Create a regular user whose username is their email address.
+    """
+
+    return User.objects.create_user(
+        email=email, username=email, password=TEST_PASSWORD, **kwargs
+    )
+
+
+def create_agent(email):
+    """
+    Create a branch agent.
+    """
+
+    return User.objects.create_branch_agent(
+        email=email, username=email, password=TEST_PASSWORD
+    )
+
+
+def create_branch(city, agent=None, main_branch=False):
+    """
+    Create a branch in a city. An agent is created for it if none is provided.
+    """
+
+    agent = agent or create_agent(f"agent@{city.lower().replace(' ', '')}.com")
+    return Branch.objects.create_branch(
+        city=city, main_branch=main_branch, branch_agent=agent
+    )
+
+
+def create_cargo(sender, recepient, booking_station, destination, **kwargs):
+    """
+    Book cargo at a station. The agents are taken from the stations involved.
+    """
+
+    return Cargo.objects.create_cargo(
+        sender=sender,
+        recepient=recepient,
+        booking_station=booking_station,
+        destination=destination,
+        booking_agent=booking_station.branch_agent,
+        clearing_agent=destination.branch_agent,
+        title=kwargs.pop("title", "Parcel"),
+        weight=kwargs.pop("weight", Decimal("10.00")),
+        **kwargs,
+    )
+
+
+def commit_branch_changes():
+    """
+    Run the commit hooks of changed branches and lanes, which never run in a TestCase, so that they are cached again as if the changes were committed.
+    """
+
+    hooks = (branch_registry.bump_version, routing.bump_version)
+    pending = [func for _, func in connection.run_on_commit if func in hooks]
+    connection.run_on_commit = [
+        (sids, func) for sids, func in connection.run_on_commit if func not in hooks
+    ]
+    for func in pending:
+        func()
+
+
+class CargoTrackerTestCase(APITestCase):
+    """
+    Base test case that runs huey tasks in-process, swaps Redis for fakeredis and provides a small network of branches, agents and users.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        HUEY.immediate = True
+        # patched for the whole class, since test data is created before setUp runs
+        cls.redis_patcher = mock.patch(
+            "cargotracker.UTILS.redis_utils._connection", fakeredis.FakeRedis()
+        )
+        cls.redis = cls.redis_patcher.start()
+        registry.invalidate()
+        router.invalidate()
+        super().setUpClass()
+        commit_branch_changes()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.redis_patcher.stop()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email="admin@cargotracker.com",
+            username="admin@cargotracker.com",
+            password=TEST_PASSWORD,
+        )
+        cls.main_branch = create_branch("Nairobi", main_branch=True)
+        cls.branch = create_branch("Mombasa")
+        cls.other_branch = create_branch("Kisumu")
+        cls.agent = cls.main_branch.branch_agent
+        cls.sender = create_user("sender@example.com")
+        cls.recepient = create_user("recepient@example.com")
+
+    def setUp(self):
+        super().setUp()
+        self.redis.flushall()
+        # the branch registry and the routes outlive the test transactions
+        registry.invalidate()
+        router.invalidate()
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cargo.models import Cargo
+from orders.models import Order
+from cargotracker.UTILS.exports import EXPORT_CONTENT_TYPES, stream_export
+
+
+EXPORTABLE_MODELS = {
+    "cargo": Cargo,
+    "orders": Order,
+}
+
+
+class Command(BaseCommand):
+    """
+    Stream all cargo or orders to a file or to stdout, e.g.
+
+    python manage.py export_data orders --output-format csv --file orders.csv
+    """
+
+    help = "Export all cargo or orders as NDJSON or CSV with constant memory use."
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", choices=EXPORTABLE_MODELS)
+        parser.add_argument(
+            "--output-format", choices=EXPORT_CONTENT_TYPES, default="ndjson"
+        )
+        parser.add_argument("--file", help="Write here instead of to stdout.")
+        parser.add_argument("--chunk-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        model = EXPORTABLE_MODELS[options["model"]]
+        lines = stream_export(
+            model.objects.filter().for_export(),
+            options["output_format"],
+            chunk_size=options["chunk_size"],
+        )
+
+        if not options["file"]:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+
+        try:
+            with open(options["file"], "w", newline="") as export_file:
+                export_file.writelines(lines)
+        except OSError as e:
+            raise CommandError(f"Could not write the export: {e}") from e
@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from branches.models import BranchOrderSummary
+from cargotracker.UTILS import synthetic
+
+
+class Command(BaseCommand):
+    """
+    Fill the database with synthetic customers, agents, branches, cargo and orders, e.g.
+
+    python manage.py generate_data --customers 100000 --branches 50 --cargo 1000000 --orders 800000
+
+    Every user logs in with the synthetic password, and the printed tag is what `loadtest` needs to find them.
+    """
+
+    help = "Generate synthetic data in bulk, for benchmarks and load tests."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customers", type=int, default=1000)
+        parser.add_argument(
+            "--branches",
+            type=int,
+            default=10,
+            help="Number of branches, each with its own agent. The first one becomes the main branch if there is none yet.",
+        )
+        parser.add_argument("--admins", type=int, default=1)
+        parser.add_argument("--cargo", type=int, default=10000)
+        parser.add_argument(
+            "--orders",
+            type=int,
+            default=None,
+            help="Number of orders to book for cargo without one. Defaults to all such cargo.",
+        )
+        parser.add_argument(
+            "--tag", help="Tag of the generated users. A random one is used by default."
+        )
+        parser.add_argument("--batch-size", type=int, default=synthetic.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options["customers"] < 2:
+            raise CommandError("Cargo needs at least 2 customers.")
+        if options["branches"] < 2:
+            raise CommandError("Cargo needs at least 2 branches.")
+
+        tag = options["tag"] or synthetic.new_tag()
+        batch_size = options["batch_size"]
+
+        with transaction.atomic():
+            if synthetic.role_emails("customer", tag):
+                raise CommandError(f"Data tagged {tag} already exists.")
+
+            synthetic.create_users(
+                options["admins"],
+                "admin",
+                tag,
+                is_staff=True,
+                is_superuser=True,
+                batch_size=batch_size,
+            )
+            customers = synthetic.create_users(
+                options["customers"], "customer", tag, batch_size=batch_size
+            )
+            branches = synthetic.create_branches(options["branches"], tag)
+            synthetic.create_cargo(
+                options["cargo"], customers, branches, batch_size=batch_size
+            )
+            orders = synthetic.create_orders(options["orders"], batch_size=batch_size)
+            # the orders are inserted in bulk, past the branch counters
+            BranchOrderSummary.objects.reconcile()
+
+        self.stdout.write(
+            f"Created {options['customers']} customers, {options['branches']} branches "
+            f"with their agents, {options['admins']} admins, {options['cargo']} cargo "
+            f"and {orders} orders tagged {tag}. Every user's password is "
+            f"{synthetic.SYNTHETIC_PASSWORD}."
+        )
@@ -0,0 +1,112 @@
+import argparse
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from branches.models import Branch
+from cargotracker.UTILS import synthetic
+from cargotracker.UTILS.loadtest import run_load_test
+
+
+def parse_mix(value):
+    """
+    Parse a mix like `customer=80,agent=18,admin=2` into a dictionary of weights.
+    """
+
+    try:
+        return dict(
+            (role, int(weight))
+            for role, weight in (pair.split("=") for pair in value.split(","))
+        )
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(
+            f"{value} is not a mix like customer=80,agent=18,admin=2"
+        ) from e
+
+
+class Command(BaseCommand):
+    """
+    Drive a running server with the users of a `generate_data` run and write per-endpoint latency percentiles and throughput to a JSON file, e.g.
+
+    python manage.py generate_data --tag ci
+    python manage.py loadtest --tag ci --base-url http://localhost:8000 --duration 60 --concurrency 20 --output loadtest.json
+
+    Agents book cargo during the run, so point it at a disposable database.
+    Add `--attackers 20` to flood the login endpoint with bad passwords meanwhile, and compare the latency of the real logins with a run without them.
+    Virtual users tell their IPs apart in `X-Forwarded-For`, so the server must trust one proxy (`NUM_PROXIES=1`).
+    """
+
+    help = "Run a load test against the API with synthetic users."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tag", required=True, help="Tag of the synthetic users.")
+        parser.add_argument("--base-url", default="http://localhost:8000")
+        parser.add_argument("--duration", type=float, default=30, help="Seconds to run for.")
+        parser.add_argument(
+            "--concurrency", type=int, default=10, help="Number of virtual users."
+        )
+        parser.add_argument(
+            "--mix",
+            type=parse_mix,
+            default="customer=80,agent=18,admin=2",
+            help="Share of the virtual users of each role.",
+        )
+        parser.add_argument(
+            "--attackers",
+            type=int,
+            default=0,
+            help="Number of extra virtual users guessing passwords from a single IP.",
+        )
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--output", default="loadtest.json")
+
+    def handle(self, *args, **options):
+        tag = options["tag"]
+        agent_cities = dict(
+            Branch.objects.filter(
+                branch_agent__email__in=synthetic.role_emails("agent", tag)
+            ).values_list("branch_agent__email", "city")
+        )
+        population = {
+            "customer": synthetic.role_emails("customer", tag),
+            "agent": sorted(agent_cities),
+            "admin": synthetic.role_emails("admin", tag),
+            "agent_cities": agent_cities,
+            "cities": sorted(agent_cities.values()),
+        }
+        if len(population["customer"]) < 2 or len(population["cities"]) < 2:
+            raise CommandError(
+                f"There is not enough data tagged {tag}, run generate_data first."
+            )
+
+        try:
+            report = run_load_test(
+                options["base_url"],
+                population,
+                options["mix"],
+                options["concurrency"],
+                options["duration"],
+                synthetic.SYNTHETIC_PASSWORD,
+                attackers=options["attackers"],
+                seed=options["seed"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e)) from e
+
+        try:
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2, sort_keys=True)
+                output.write("\n")
+        except OSError as e:
+            raise CommandError(f"Could not write the report: {e}") from e
+
+        for endpoint, summary in report["endpoints"].items():
+            latency = summary["latency_ms"]
+            self.stdout.write(
+                f"{endpoint:<44} {summary['requests']:>7} req {summary['errors']:>5} err "
+                f"{summary['throughput_rps']:>9} req/s  p50 {latency['p50']} "
+                f"p95 {latency['p95']} p99 {latency['p99']} ms"
+            )
+        for failure in report["meta"]["login_failures"]:
+            self.stderr.write(failure)
+        self.stdout.write(f"Wrote the report to {options['output']}.")
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from branches.models import BranchOrderSummary
+
+
+class Command(BaseCommand):
+    """
+    Count the orders of every branch and status again, and replace the counters that drifted, e.g.
+
+    python manage.py reconcile_branch_summaries --dry-run
+    """
+
+    help = "Rebuild the order counters of branches from the orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the counters that drifted.",
+        )
+
+    def handle(self, *args, **options):
+        drift = BranchOrderSummary.objects.reconcile(dry_run=options["dry_run"])
+
+        for (branch_id, status), (counted, stored) in sorted(drift.items()):
+            self.stdout.write(
+                f"Branch {branch_id} {status}: counted {counted[0]} orders of {counted[1]}, "
+                f"stored {stored[0]} orders of {stored[1]}"
+            )
+        if options["dry_run"]:
+            self.stdout.write(f"{len(drift)} counters drifted.")
+        else:
+            self.stdout.write(f"Rebuilt {len(drift)} counters that drifted.")
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orders.cache import invalidate_order_details
+from orders.models import Order, load_eta_estimator
+
+
+class Command(BaseCommand):
+    """
+    Estimate the main station and delivery times of undelivered orders again from the current transit statistics, e.g.
+
+    python manage.py reestimate_orders --status P T --batch-size 1000
+    """
+
+    help = "Estimate the delivery times of undelivered orders again."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--status",
+            nargs="+",
+            default=["P", "T"],
+            choices=["P", "T"],
+            help="Only estimate orders with these statuses.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of orders estimated and updated at a time.",
+        )
+
+    def handle(self, *args, **options):
+        estimator = load_eta_estimator()
+        now = timezone.now()
+        queryset = (
+            Order.objects.filter(status__in=options["status"], cargo__isnull=False)
+            .select_related("cargo")
+            .order_by("id")
+        )
+
+        updated = 0
+        last_id = 0
+        while True:
+            orders = list(queryset.filter(id__gt=last_id)[: options["batch_size"]])
+            if not orders:
+                break
+
+            Order.objects.set_time_estimates(orders, estimator=estimator, now=now)
+            for order in orders:
+                # bulk updates skip auto_now, which ETags are computed from
+                order.updated_at = now
+            Order.objects.bulk_update(
+                orders,
+                ["estimated_delivery_time", "estimated_time_to_main_station", "updated_at"],
+            )
+            invalidate_order_details([order.tracking_id for order in orders])
+
+            updated += len(orders)
+            last_id = orders[-1].id
+
+        self.stdout.write(f"Estimated {updated} orders again.")
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware
+
+from notifications.models import Notification
+
+
+class Command(BaseCommand):
+    """
+    Queue failed notifications to be sent again by the outbox worker, e.g.
+
+    python manage.py replay_notifications --since 2020-01-01T00:00
+    """
+
+    help = "Queue failed notifications to be sent again."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since", help="Only replay notifications created at or after this time."
+        )
+        parser.add_argument(
+            "--ids", nargs="+", type=int, help="Only replay these notifications."
+        )
+
+    def handle(self, *args, **options):
+        queryset = Notification.objects.filter().failed()
+        if options["since"]:
+            since = parse_datetime(options["since"])
+            if since is None:
+                raise CommandError("--since must be a date and time, e.g. 2020-01-01T00:00")
+            if is_naive(since):
+                since = make_aware(since)
+            queryset = queryset.filter(created_at__gte=since)
+        if options["ids"]:
+            queryset = queryset.filter(id__in=options["ids"])
+
+        replayed = Notification.objects.replay(queryset)
+        self.stdout.write(f"Queued {replayed} failed notifications to be sent again.")
@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     # third party
     "rest_framework",
     "django_extensions",
@@ -48,9 +49,11 @@ INSTALLED_APPS = [
     "branches.apps.BranchesConfig",
     "cargo.apps.CargoConfig",
     "orders.apps.OrdersConfig",
+    "notifications.apps.NotificationsConfig",
 ]
 
 MIDDLEWARE = [
+    "cargotracker.UTILS.middleware.QueryBudgetMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -138,12 +141,63 @@ EMAIL_PORT = os.getenv("EMAIL_PORT")
 ADMIN_EMAIL = "noreply@cloudtracker.app"
 EMAIL_USE_SSL = True
 
+# Spooled emails are sent BATCH_SIZE at a time over one connection per worker,
+# each email is retried MAX_RETRIES times on a fresh connection.
+EMAIL_DISPATCH = {
+    "BATCH_SIZE": int(os.getenv("EMAIL_BATCH_SIZE", 100)),
+    "MAX_RETRIES": int(os.getenv("EMAIL_MAX_RETRIES", 3)),
+    # emails still failing after MAX_ATTEMPTS drains are moved to a failed list
+    "MAX_ATTEMPTS": int(os.getenv("EMAIL_MAX_ATTEMPTS", 5)),
+    # batches still processing after CLAIM_TIMEOUT seconds are taken to be lost
+    "CLAIM_TIMEOUT": int(os.getenv("EMAIL_CLAIM_TIMEOUT", 600)),
+}
+
+# Notifications are written to an outbox table and sent by a periodic task,
+# BATCH_SIZE at a time. Emails still failing after MAX_ATTEMPTS runs are marked failed.
+NOTIFICATION_OUTBOX = {
+    "BATCH_SIZE": int(os.getenv("NOTIFICATION_BATCH_SIZE", 500)),
+    "MAX_ATTEMPTS": int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", 5)),
+    # notifications still sending after CLAIM_TIMEOUT seconds are taken to be lost
+    "CLAIM_TIMEOUT": int(os.getenv("NOTIFICATION_CLAIM_TIMEOUT", 600)),
+}
+
 # REST FRAMEWORK
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
-    )
+        "authentication.backends.ClaimsJWTAuthentication",
+    ),
+    # Token buckets in front of password hashing: "20/min" allows bursts of 20
+    # requests and refills at 20 a minute.
+    "DEFAULT_THROTTLE_RATES": {
+        "login_ip": os.getenv("THROTTLE_LOGIN_IP", "20/min"),
+        "login_email": os.getenv("THROTTLE_LOGIN_EMAIL", "10/min"),
+        "register_ip": os.getenv("THROTTLE_REGISTER_IP", "20/hour"),
+        "register_email": os.getenv("THROTTLE_REGISTER_EMAIL", "5/hour"),
+    },
+    # Client IPs are taken from X-Forwarded-For as appended by this many proxies,
+    # e.g. the Heroku router.
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", 1)),
+}
+
+# Cargo and Order lists are paginated. Clients may ask for bigger pages with `?page_size=`, up to MAX_PAGE_SIZE.
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", 50))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 500))
+
+# Largest number of rows accepted by the bulk booking endpoints.
+BULK_BOOKING_MAX_ROWS = int(os.getenv("BULK_BOOKING_MAX_ROWS", 1000))
+
+# Largest number of scans accepted by one request to the scan ingest endpoint.
+SCAN_INGEST_MAX_EVENTS = int(os.getenv("SCAN_INGEST_MAX_EVENTS", 10000))
+
+# Number of rows fetched from the database at a time when streaming exports.
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 2000))
+
+# Tariffs applied when pricing orders, kept as strings so they stay exact decimals.
+# The transit fee is charged on lanes that pass through the main branch.
+TARIFF = {
+    "TAX_RATE": os.getenv("TARIFF_TAX_RATE", "0.18"),
+    "MAIN_BRANCH_TRANSIT_FEE": os.getenv("TARIFF_MAIN_BRANCH_TRANSIT_FEE", "0"),
 }
 
 
@@ -159,9 +213,94 @@ SIMPLE_JWT = {
 }
 
 # Settings for HUEY
+REDIS_URL = os.getenv("REDIS_URL")
+
 HUEY = {
     "name": "cargotracker",
     "immediate": False,
     "utc": True,
-    "url": os.getenv("REDIS_URL")
+    "url": REDIS_URL
+}
+
+# Branches are kept in memory by every worker, which checks for changes
+# at most every CHECK_INTERVAL seconds.
+BRANCH_REGISTRY = {
+    "CHECK_INTERVAL": float(os.getenv("BRANCH_REGISTRY_CHECK_INTERVAL", 5)),
+}
+
+# Transit times are estimated from past deliveries. A lane's estimate counts its prior
+# as PRIOR_WEIGHT deliveries, and DEFAULT_TRANSIT_SECONDS is assumed before any delivery.
+ETA = {
+    "PRIOR_WEIGHT": int(os.getenv("ETA_PRIOR_WEIGHT", 5)),
+    "DEFAULT_TRANSIT_SECONDS": int(os.getenv("ETA_DEFAULT_TRANSIT_SECONDS", 450)),
+}
+
+# Routes between branches are precomputed into a table in Redis that is kept for
+# TABLE_TTL seconds. Workers check for lane changes at most every CHECK_INTERVAL
+# seconds and keep the table rows of up to CACHED_ROWS destinations in memory.
+ROUTING = {
+    "CHECK_INTERVAL": float(os.getenv("ROUTING_CHECK_INTERVAL", 5)),
+    "CACHED_ROWS": int(os.getenv("ROUTING_CACHED_ROWS", 1000)),
+    "TABLE_TTL": int(os.getenv("ROUTING_TABLE_TTL", 86400)),
+}
+
+# Authentication trusts the claims of access tokens, checked against a copy of each
+# user's active flag and roles that is cached in Redis for STATE_TTL seconds.
+CLAIMS_AUTH = {
+    "STATE_TTL": int(os.getenv("CLAIMS_AUTH_STATE_TTL", 60)),
+}
+
+# Expired tokens are purged from the token blacklist tables CHUNK_SIZE rows at a time,
+# and the blacklist is copied to Redis in chunks of the same size.
+TOKEN_BLACKLIST = {
+    "CHUNK_SIZE": int(os.getenv("TOKEN_BLACKLIST_CHUNK_SIZE", 5000)),
+}
+
+# Rendered order details are cached in Redis for TTL seconds.
+ORDER_DETAIL_CACHE = {
+    "ENABLED": os.getenv("ORDER_DETAIL_CACHE_ENABLED", "true").lower() == "true",
+    "TTL": int(os.getenv("ORDER_DETAIL_CACHE_TTL", 60)),
+}
+
+# Order events are streamed with a heartbeat every HEARTBEAT seconds, and streams are
+# closed after MAX_DURATION seconds for clients to reconnect. The last HISTORY_LENGTH
+# events of every channel are kept in Redis for HISTORY_TTL seconds to resume from,
+# and a stream falling QUEUE_SIZE events behind is closed.
+EVENT_STREAM = {
+    "HEARTBEAT": int(os.getenv("EVENT_STREAM_HEARTBEAT", 15)),
+    "MAX_DURATION": int(os.getenv("EVENT_STREAM_MAX_DURATION", 3600)),
+    "HISTORY_LENGTH": int(os.getenv("EVENT_STREAM_HISTORY_LENGTH", 100)),
+    "HISTORY_TTL": int(os.getenv("EVENT_STREAM_HISTORY_TTL", 86400)),
+    "QUEUE_SIZE": int(os.getenv("EVENT_STREAM_QUEUE_SIZE", 1000)),
+}
+
+# Query budgets per URL name, either a number of queries or one per HTTP method.
+# MODE is "off", "log" to warn about requests over budget, or "enforce" to fail them.
+QUERY_BUDGET = {
+    "MODE": os.getenv("QUERY_BUDGET_MODE", "log" if DEBUG else "off"),
+    "BUDGETS": {
+        "auth:login": 2,
+        "auth:logout": 7,
+        "auth:refresh_token": 0,
+        "auth:register-user": 4,
+        "auth:register-agent": 5,
+        "branches:create-branch": {"GET": 1, "POST": 7},
+        "branches:search-branches": 1,
+        "branches:branch-summary": 1,
+        "cargo:create-cargo": {"GET": 3, "POST": 14},
+        "cargo:bulk-create-cargo": 7,
+        # scans and order changes also move the counters of the branches
+        "cargo:ingest-scans": 16,
+        # exports query while streaming, after the response has left the middleware
+        "cargo:export-cargo": 1,
+        "cargo:cargo-detail": {"GET": 3, "PUT": 6, "PATCH": 6},
+        "orders:list-order": {"GET": 2, "POST": 18},
+        "orders:bulk-create-orders": 12,
+        "orders:export-orders": 1,
+        "orders:order-events": 1,
+        "orders:order-detail-events": 1,
+        # status changes move the branch counters, and deliveries record their transit
+        # time, in a transaction
+        "orders:order-detail-view": {"GET": 2, "PUT": 9, "PATCH": 9},
+    },
 }
@@ -0,0 +1,387 @@
+import json
+import smtplib
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail as django_mail
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from authentication.blacklist import load_blacklist
+from branches.models import Branch, BranchOrderSummary
+from branches.routing import router
+from cargo.models import Cargo
+from cargotracker.UTILS import mail, synthetic
+from cargotracker.UTILS.loadtest import Recorder, percentile
+from cargotracker.UTILS.tasks import (
+    send_async_email,
+    send_async_mass_email,
+    send_pending_emails,
+)
+from cargotracker.UTILS.middleware import QueryBudgetExceeded, get_query_budget
+from cargotracker.UTILS.testing import (
+    TEST_PASSWORD,
+    CargoTrackerTestCase,
+    create_agent,
+    create_cargo,
+)
+from orders.models import Order
+
+
+class MailDispatchTestCase(CargoTrackerTestCase):
+    """
+    Emails are spooled, drained in batches and sent over one reused connection.
+    """
+
+    def setUp(self):
+        super().setUp()
+        mail._local.dispatcher = None
+        self.addCleanup(setattr, mail._local, "dispatcher", None)
+        django_mail.outbox = []
+
+    def email(self, index=0):
+        return (f"Subject {index}", "Message", "agent@cargotracker.app", ["a@b.com"])
+
+    @override_settings(EMAIL_DISPATCH={**settings.EMAIL_DISPATCH, "BATCH_SIZE": 2})
+    def test_pending_emails_share_one_connection(self):
+        with mock.patch(
+            "cargotracker.UTILS.mail.get_connection", wraps=mail.get_connection
+        ) as get_connection:
+            send_async_mass_email(datatuple=[self.email(index) for index in range(5)])
+            send_async_email(*self.email(5))
+
+        self.assertEqual(len(django_mail.outbox), 6)
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(self.redis.llen(mail.PENDING_KEY), 0)
+        self.assertEqual(self.redis.zcard(mail.BATCHES_KEY), 0)
+        stats = mail.get_mail_stats()
+        self.assertEqual(stats["sent"], 6)
+        self.assertEqual(stats["batches"], 4)
+
+    @override_settings(
+        EMAIL_DISPATCH={**settings.EMAIL_DISPATCH, "MAX_RETRIES": 0, "MAX_ATTEMPTS": 2}
+    )
+    def test_failed_emails_are_queued_again_until_given_up_on(self):
+        mail.enqueue_emails([self.email(index) for index in range(2)])
+        connection = mock.Mock()
+        connection.send_messages.side_effect = [1, ConnectionResetError(), ConnectionResetError()]
+
+        with mock.patch(
+            "cargotracker.UTILS.mail.get_connection", return_value=connection
+        ), self.assertLogs("cargotracker.UTILS.mail", "ERROR"):
+            self.assertEqual(send_pending_emails.call_local(), 1)
+            self.assertEqual(self.redis.llen(mail.PENDING_KEY), 1)
+            self.assertEqual(send_pending_emails.call_local(), 0)
+
+        self.assertEqual(self.redis.llen(mail.PENDING_KEY), 0)
+        failed = json.loads(self.redis.lindex(mail.FAILED_KEY, 0))
+        self.assertEqual((failed["subject"], failed["attempts"]), ("Subject 1", 2))
+
+    def test_batches_of_dead_workers_are_queued_again(self):
+        mail.enqueue_emails([self.email(index) for index in range(3)])
+        # a worker that died after claiming a batch
+        batch, emails = mail.claim_pending_emails(2)
+        self.assertEqual([email["subject"] for email in emails], ["Subject 0", "Subject 1"])
+
+        self.assertEqual(mail.requeue_stale_batches(timeout=60), 0)
+        with self.assertLogs("cargotracker.UTILS.mail", "WARNING"):
+            self.assertEqual(mail.requeue_stale_batches(timeout=-1), 2)
+
+        self.assertEqual(send_pending_emails.call_local(), 3)
+        self.assertEqual(
+            sorted(message.subject for message in django_mail.outbox),
+            ["Subject 0", "Subject 1", "Subject 2"],
+        )
+        self.assertEqual(self.redis.zcard(mail.BATCHES_KEY), 0)
+
+    def test_failed_sends_reconnect_and_retry(self):
+        broken, working = mock.Mock(), mock.Mock()
+        broken.send_messages.side_effect = smtplib.SMTPServerDisconnected()
+        dispatcher = mail.MailDispatcher(max_retries=2)
+
+        with mock.patch(
+            "cargotracker.UTILS.mail.get_connection", side_effect=[broken, working]
+        ):
+            sent = dispatcher.send_messages([EmailMessage("Subject", "Message")])
+
+        self.assertEqual(sent, 1)
+        broken.close.assert_called_once()
+        working.send_messages.assert_called_once()
+        self.assertEqual(mail.get_mail_stats()["reconnects"], 1)
+
+    def test_emails_that_keep_failing_are_counted_and_skipped(self):
+        connection = mock.Mock()
+        connection.send_messages.side_effect = [
+            ConnectionResetError(),
+            ConnectionResetError(),
+            1,
+        ]
+        dispatcher = mail.MailDispatcher(max_retries=1)
+
+        with mock.patch(
+            "cargotracker.UTILS.mail.get_connection", return_value=connection
+        ), self.assertLogs("cargotracker.UTILS.mail", "ERROR"):
+            sent = dispatcher.send_messages(
+                [EmailMessage("First", "Message"), EmailMessage("Second", "Message")]
+            )
+
+        self.assertEqual(sent, 1)
+        stats = mail.get_mail_stats()
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(stats["sent"], 1)
+
+
+@override_settings(QUERY_BUDGET={**settings.QUERY_BUDGET, "MODE": "enforce"})
+class QueryBudgetTestCase(CargoTrackerTestCase):
+    """
+    Every endpoint stays within its query budget. The middleware raises `QueryBudgetExceeded` otherwise.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.cargo = [
+            create_cargo(cls.sender, cls.recepient, cls.main_branch, cls.branch)
+            for _ in range(10)
+        ]
+        cls.orders = [
+            Order.objects.get_or_create_order(
+                cargo=cargo, price_per_unit_weight=10, past_main_branch=False
+            )[0]
+            for cargo in cls.cargo[:5]
+        ]
+
+    def assertWithinBudget(self, response, status_code=200):
+        self.assertEqual(
+            response.status_code, status_code, getattr(response, "content", None)
+        )
+        budget = get_query_budget(response.wsgi_request)
+        self.assertIsNotNone(budget, f"{response.wsgi_request.path} has no budget")
+        self.assertLessEqual(int(response["X-DB-Query-Count"]), budget)
+        self.assertIn("X-DB-Time-ms", response)
+
+    def test_requests_over_budget_fail_or_are_logged(self):
+        self.client.force_authenticate(self.admin)
+        budgets = {"MODE": "enforce", "BUDGETS": {"cargo:create-cargo": 1}}
+        url = reverse("cargo:create-cargo")
+
+        with override_settings(QUERY_BUDGET=budgets):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(url)
+
+        with override_settings(QUERY_BUDGET={**budgets, "MODE": "log"}):
+            with self.assertLogs("cargotracker.UTILS.middleware", "WARNING"):
+                response = self.client.get(url)
+        self.assertEqual(response["X-DB-Query-Count"], "3")
+
+        with override_settings(QUERY_BUDGET={**budgets, "MODE": "off"}):
+            self.assertNotIn("X-DB-Query-Count", self.client.get(url))
+
+    def login(self, email):
+        return self.client.post(
+            reverse("auth:login"),
+            {"email": email, "password": TEST_PASSWORD},
+            format="json",
+        )
+
+    def test_authentication_endpoints(self):
+        self.assertWithinBudget(
+            self.client.post(
+                reverse("auth:register-user"),
+                {
+                    "email": "new@example.com",
+                    "username": "new@example.com",
+                    "password": TEST_PASSWORD,
+                },
+                format="json",
+            ),
+            201,
+        )
+        tokens = self.login("new@example.com")
+        self.assertWithinBudget(tokens)
+        refresh = tokens.json()["data"]["refresh"]
+        load_blacklist()
+        self.assertWithinBudget(
+            self.client.post(reverse("auth:refresh_token"), {"refresh": refresh})
+        )
+        self.assertWithinBudget(
+            self.client.post(
+                reverse("auth:logout"),
+                {"refresh": refresh},
+                HTTP_AUTHORIZATION=f"Bearer {tokens.json()['data']['access']}",
+            )
+        )
+
+        self.client.force_authenticate(self.admin)
+        self.assertWithinBudget(
+            self.client.post(
+                reverse("auth:register-agent"),
+                {
+                    "email": "newagent@example.com",
+                    "username": "newagent@example.com",
+                    "password": "newpassword",
+                    "is_staff": True,
+                },
+                format="json",
+            ),
+            201,
+        )
+
+    def test_branch_endpoints(self):
+        self.client.force_authenticate(self.admin)
+        self.assertWithinBudget(self.client.get(reverse("branches:create-branch")))
+        self.assertWithinBudget(
+            self.client.get(reverse("branches:search-branches"), {"q": "nai"})
+        )
+        self.assertWithinBudget(
+            self.client.get(
+                reverse("branches:branch-summary", kwargs={"id": self.main_branch.id})
+            )
+        )
+        self.assertWithinBudget(
+            self.client.post(
+                reverse("branches:create-branch"),
+                {"city": "Eldoret", "branch_agent": create_agent("e@x.com").email},
+                format="json",
+            ),
+            201,
+        )
+
+    def test_cargo_endpoints(self):
+        self.client.force_authenticate(self.agent)
+        self.assertWithinBudget(self.client.get(reverse("cargo:create-cargo")))
+        row = {
+            "title": "Parcel",
+            "weight": "10.00",
+            "sender": self.sender.email,
+            "recepient": self.recepient.email,
+            "destination": self.branch.city,
+            "booking_station": self.main_branch.city,
+        }
+        self.assertWithinBudget(
+            self.client.post(reverse("cargo:create-cargo"), row, format="json"), 201
+        )
+        self.assertWithinBudget(
+            self.client.post(
+                reverse("cargo:bulk-create-cargo"), {"cargo": [row] * 5}, format="json"
+            ),
+            201,
+        )
+        url = reverse("cargo:cargo-detail", args=[self.cargo[0].id])
+        self.assertWithinBudget(self.client.get(url))
+        self.assertWithinBudget(
+            self.client.patch(url, {"title": "Renamed"}, format="json")
+        )
+
+        # every scan of a batch delivers its cargo
+        scanned_at = timezone.now().isoformat()
+        scans = [
+            {"cargo": cargo.id, "event": event, "scanned_at": scanned_at}
+            for cargo in self.cargo
+            for event in ("arrived", "delivered")
+        ]
+        self.assertWithinBudget(
+            self.client.post(reverse("cargo:ingest-scans"), {"events": scans}, format="json"),
+            201,
+        )
+
+        self.client.force_authenticate(self.admin)
+        self.assertWithinBudget(self.client.get(reverse("cargo:export-cargo")))
+
+    def test_order_endpoints(self):
+        # lanes are loaded once per worker, not per booking
+        router.get_graph()
+        self.client.force_authenticate(self.agent)
+        self.assertWithinBudget(self.client.get(reverse("orders:list-order")))
+        self.assertWithinBudget(
+            self.client.post(
+                reverse("orders:list-order"),
+                {
+                    "cargo": self.cargo[5].id,
+                    "price_per_unit_weight": "2.5",
+                    "past_main_branch": False,
+                },
+                format="json",
+            ),
+            201,
+        )
+        self.assertWithinBudget(
+            self.client.post(
+                reverse("orders:bulk-create-orders"),
+                {"all_pending": True, "price_per_unit_weight": "2.5"},
+                format="json",
+            ),
+            201,
+        )
+        url = reverse("orders:order-detail-view", args=[self.orders[0].tracking_id])
+        self.assertWithinBudget(self.client.get(url))
+        self.assertWithinBudget(self.client.patch(url, {"status": "T"}, format="json"))
+        self.assertWithinBudget(self.client.patch(url, {"status": "D"}, format="json"))
+        # streams are opened, not read
+        self.assertWithinBudget(self.client.get(reverse("orders:order-events")))
+        self.assertWithinBudget(
+            self.client.get(
+                reverse("orders:order-detail-events", args=[self.orders[0].tracking_id])
+            )
+        )
+
+        self.client.force_authenticate(self.admin)
+        self.assertWithinBudget(self.client.get(reverse("orders:export-orders")))
+
+
+class LoadTestToolsTestCase(CargoTrackerTestCase):
+    """
+    Synthetic data generation and the load test report.
+    """
+
+    def test_generate_data_creates_every_role(self):
+        orders = Order.objects.count()
+        out = StringIO()
+        call_command(
+            "generate_data",
+            "--customers=5",
+            "--branches=3",
+            "--cargo=20",
+            "--orders=15",
+            "--tag=gen",
+            stdout=out,
+        )
+
+        self.assertIn("tagged gen", out.getvalue())
+        self.assertEqual(len(synthetic.role_emails("customer", "gen")), 5)
+        admins = synthetic.role_emails("admin", "gen")
+        self.assertTrue(get_user_model().objects.get(email=admins[0]).is_superuser)
+        self.assertEqual(Branch.objects.filter(city__endswith=" gen").count(), 3)
+        # the test branches already have the main branch
+        self.assertEqual(Branch.objects.filter(main_branch=True).count(), 1)
+        cargo = Cargo.objects.filter(sender__email__in=synthetic.role_emails("customer", "gen"))
+        self.assertEqual(cargo.count(), 20)
+        # orders go to the oldest cargo without one, whoever it belongs to
+        self.assertEqual(Order.objects.count(), orders + 15)
+        self.assertEqual(BranchOrderSummary.objects.reconcile(dry_run=True), {})
+
+    def test_report_has_percentiles_per_endpoint(self):
+        recorder = Recorder()
+        for milliseconds in range(1, 101):
+            recorder.record("GET /api/cargo/", milliseconds / 1000, 200)
+        recorder.record("POST /api/cargo/", 0.5, 400)
+        recorder.record("POST /api/cargo/", 0.25, None)
+
+        report = recorder.report(duration=2)
+
+        cargo_list = report["endpoints"]["GET /api/cargo/"]
+        self.assertEqual(cargo_list["requests"], 100)
+        self.assertEqual(cargo_list["throughput_rps"], 50)
+        self.assertEqual(
+            [cargo_list["latency_ms"][key] for key in ("p50", "p95", "p99")],
+            [50, 95, 99],
+        )
+        self.assertEqual(report["endpoints"]["POST /api/cargo/"]["errors"], 2)
+        self.assertEqual(report["total"]["requests"], 102)
+        self.assertEqual(report["total"]["statuses"], {"200": 100, "400": 1, "None": 1})
+        self.assertEqual(percentile([], 50), None)
@@ -0,0 +1,23 @@
+"""
+Gunicorn settings for the web process.
+
+Order event streams stay open for as long as clients watch them, so requests are served by gevent greenlets instead of tying up one sync worker each.
+"""
+
+import os
+
+
+worker_class = "gevent"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+# open connections per worker, idle event streams included
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+
+def post_fork(server, worker):
+    """
+    Let psycopg2 yield to other greenlets while it waits on the database, rather than blocking the whole worker.
+    """
+
+    from psycogreen.gevent import patch_psycopg
+
+    patch_psycopg()
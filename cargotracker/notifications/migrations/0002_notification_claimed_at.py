@@ -0,0 +1,23 @@
+# Generated by Django 2.2.7 on 2026-10-18 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='status',
+            field=models.CharField(choices=[('P', 'pending'), ('I', 'sending'), ('S', 'sent'), ('F', 'failed')], default='P', max_length=1),
+        ),
+    ]
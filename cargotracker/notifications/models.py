@@ -0,0 +1,195 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import models, transaction
+from django.utils import timezone
+
+from cargotracker.UTILS import mail
+
+
+class NotificationQuerySet(models.QuerySet):
+    """
+    QuerySet for the Notification object.
+    """
+
+    def pending(self):
+        return self.filter(status=Notification.PENDING)
+
+    def failed(self):
+        return self.filter(status=Notification.FAILED)
+
+
+class NotificationManager(models.Manager):
+    """
+    Manager for the notification outbox.
+    """
+
+    def get_queryset(self):
+        return NotificationQuerySet(self.model, using=self.db)
+
+    def enqueue(self, subject=None, message=None, sender=None, recepients=()):
+        """
+        Write an email to the outbox. It is saved in the current transaction and only sent once that commits.
+        """
+
+        return self.enqueue_many([(subject, message, sender, recepients)])[0]
+
+    def enqueue_many(self, datatuple):
+        """
+        Write many `(subject, message, sender, recepients)` emails to the outbox with one insert.
+        """
+
+        notifications = []
+        for subject, message, sender, recepients in datatuple:
+            if not subject:
+                raise TypeError("Subject cannot be empty")
+            if not message:
+                raise TypeError("Message cannot be empty")
+            if not sender:
+                raise TypeError("Sender cannot be empty")
+            if not recepients:
+                raise TypeError("Recipients cannot be empty")
+
+            notifications.append(
+                self.model(
+                    subject=subject,
+                    message=message,
+                    sender=sender,
+                    recepients=",".join(recepients),
+                )
+            )
+
+        return self.model.objects.bulk_create(notifications)
+
+    def claim(self, batch_size, after_id=0):
+        """
+        Mark the next batch of pending notifications after `after_id` as sending and count the attempt, in a short transaction.
+        Locked rows are skipped, so concurrent workers never claim the same email twice.
+        """
+
+        with transaction.atomic():
+            notifications = list(
+                self.get_queryset()
+                .pending()
+                .filter(id__gt=after_id)
+                .select_for_update(skip_locked=True)
+                .order_by("id")[:batch_size]
+            )
+            if notifications:
+                self.filter(id__in=[n.id for n in notifications]).update(
+                    status=self.model.SENDING,
+                    attempts=models.F("attempts") + 1,
+                    claimed_at=timezone.now(),
+                )
+        for notification in notifications:
+            notification.status = self.model.SENDING
+            notification.attempts += 1
+        return notifications
+
+    def send_pending(self, batch_size=None, after_id=0):
+        """
+        Send the next batch of pending notifications after `after_id` over the worker's mail connection.
+        The batch is claimed before it is sent and its results are recorded after, so no transaction stays open while the mail server is waited on.
+        :return: the id of the last notification in the batch, or None if there was nothing to send, and how many were sent
+        """
+
+        batch_size = batch_size or settings.NOTIFICATION_OUTBOX["BATCH_SIZE"]
+        max_attempts = settings.NOTIFICATION_OUTBOX["MAX_ATTEMPTS"]
+
+        notifications = self.claim(batch_size, after_id=after_id)
+        if not notifications:
+            return None, 0
+
+        delivered = mail.get_dispatcher().deliver(
+            [notification.as_email() for notification in notifications]
+        )
+        sent_ids = [n.id for n, ok in zip(notifications, delivered) if ok]
+        failed = [n for n, ok in zip(notifications, delivered) if not ok]
+
+        with transaction.atomic():
+            self.filter(id__in=sent_ids).update(
+                status=self.model.SENT, sent_at=timezone.now()
+            )
+            self.filter(
+                id__in=[n.id for n in failed if n.attempts < max_attempts]
+            ).update(status=self.model.PENDING)
+            self.filter(
+                id__in=[n.id for n in failed if n.attempts >= max_attempts]
+            ).update(status=self.model.FAILED)
+
+        return notifications[-1].id, len(sent_ids)
+
+    def release_stale(self, timeout=None):
+        """
+        Queue notifications again whose worker died while sending them, `timeout` seconds after they were claimed. Those out of attempts are failed.
+        Return how many were released.
+        """
+
+        if timeout is None:
+            timeout = settings.NOTIFICATION_OUTBOX["CLAIM_TIMEOUT"]
+        stale = self.filter(
+            status=self.model.SENDING,
+            claimed_at__lt=timezone.now() - timedelta(seconds=timeout),
+        )
+        max_attempts = settings.NOTIFICATION_OUTBOX["MAX_ATTEMPTS"]
+        with transaction.atomic():
+            failed = stale.filter(attempts__gte=max_attempts).update(
+                status=self.model.FAILED
+            )
+            queued = stale.update(status=self.model.PENDING)
+        return failed + queued
+
+    def replay(self, queryset=None):
+        """
+        Queue failed notifications to be sent again, with one update. Return how many were queued.
+        """
+
+        queryset = self.get_queryset().failed() if queryset is None else queryset
+        return queryset.filter(status=self.model.FAILED).update(
+            status=self.model.PENDING, attempts=0
+        )
+
+
+class Notification(models.Model):
+    """
+    An email in the outbox.
+    """
+
+    PENDING = "P"
+    SENDING = "I"
+    SENT = "S"
+    FAILED = "F"
+    STATUS_CHOICES = [
+        (PENDING, "pending"),
+        (SENDING, "sending"),
+        (SENT, "sent"),
+        (FAILED, "failed"),
+    ]
+
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    sender = models.EmailField()
+    # comma separated email addresses
+    recepients = models.TextField()
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    objects = NotificationManager()
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "id"])]
+
+    def __str__(self):
+        return f"{self.subject} to {self.recepients}"
+
+    def as_email(self):
+        return EmailMessage(
+            subject=self.subject,
+            body=self.message,
+            from_email=self.sender,
+            to=self.recepients.split(","),
+        )
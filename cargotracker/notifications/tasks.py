@@ -0,0 +1,21 @@
+from huey import crontab
+from huey.contrib.djhuey import db_periodic_task
+
+from .models import Notification
+
+
+@db_periodic_task(crontab(minute="*"))
+def drain_notification_outbox():
+    """
+    Send every pending notification a batch at a time. Notifications that fail stay pending for the next run until they run out of attempts.
+    Notifications left sending by a worker that died are queued again first.
+    """
+
+    Notification.objects.release_stale()
+    sent = 0
+    last_id = 0
+    while True:
+        last_id, batch_sent = Notification.objects.send_pending(after_id=last_id)
+        if last_id is None:
+            return sent
+        sent += batch_sent
@@ -0,0 +1,122 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core import mail as django_mail
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import override_settings
+from django.utils import timezone
+
+from cargotracker.UTILS import mail
+from cargotracker.UTILS.testing import CargoTrackerTestCase, create_cargo
+from .models import Notification
+from .tasks import drain_notification_outbox
+
+
+@override_settings(
+    NOTIFICATION_OUTBOX={**settings.NOTIFICATION_OUTBOX, "BATCH_SIZE": 2, "MAX_ATTEMPTS": 2}
+)
+class NotificationOutboxTestCase(CargoTrackerTestCase):
+    """
+    Notifications are written in the caller's transaction and sent in batches by the outbox worker.
+    """
+
+    def setUp(self):
+        super().setUp()
+        Notification.objects.all().delete()
+        mail._local.dispatcher = None
+        self.addCleanup(setattr, mail._local, "dispatcher", None)
+        django_mail.outbox = []
+
+    def enqueue(self, count):
+        return Notification.objects.enqueue_many(
+            [
+                (f"Subject {index}", "Message", "agent@cargotracker.app", ["a@b.com"])
+                for index in range(count)
+            ]
+        )
+
+    def test_notifications_roll_back_with_their_transaction(self):
+        with transaction.atomic():
+            create_cargo(self.sender, self.recepient, self.main_branch, self.branch)
+            self.assertEqual(Notification.objects.filter().pending().count(), 1)
+            transaction.set_rollback(True)
+
+        self.assertFalse(Notification.objects.exists())
+
+    def test_pending_notifications_are_sent_in_batches(self):
+        self.enqueue(5)
+
+        with mock.patch(
+            "cargotracker.UTILS.mail.get_connection", wraps=mail.get_connection
+        ) as get_connection:
+            sent = drain_notification_outbox.call_local()
+
+        self.assertEqual(sent, 5)
+        self.assertEqual(len(django_mail.outbox), 5)
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(mail.get_mail_stats()["batches"], 3)
+        self.assertEqual(Notification.objects.filter(status="S").count(), 5)
+
+    def test_failed_notifications_can_be_replayed(self):
+        self.enqueue(3)
+
+        def fail(messages):
+            return [False] * len(messages)
+
+        with mock.patch.object(mail.MailDispatcher, "deliver", side_effect=fail):
+            drain_notification_outbox.call_local()
+            self.assertEqual(Notification.objects.filter().pending().count(), 3)
+            drain_notification_outbox.call_local()
+
+        self.assertEqual(Notification.objects.filter().failed().count(), 3)
+
+        out = StringIO()
+        call_command("replay_notifications", stdout=out)
+        self.assertIn("Queued 3", out.getvalue())
+
+        self.assertEqual(drain_notification_outbox.call_local(), 3)
+        self.assertEqual(len(django_mail.outbox), 3)
+
+    def test_emails_are_sent_outside_the_claiming_transaction(self):
+        self.enqueue(1)
+        # the test case itself runs in a transaction
+        depth = len(connection.savepoint_ids)
+
+        def deliver(messages):
+            self.assertEqual(len(connection.savepoint_ids), depth)
+            self.assertEqual(Notification.objects.get().status, Notification.SENDING)
+            return [True] * len(messages)
+
+        with mock.patch.object(mail.MailDispatcher, "deliver", side_effect=deliver):
+            self.assertEqual(drain_notification_outbox.call_local(), 1)
+
+        notification = Notification.objects.get()
+        self.assertEqual((notification.status, notification.attempts), (Notification.SENT, 1))
+
+    def test_notifications_of_dead_workers_are_sent_again(self):
+        self.enqueue(3)
+        stale, exhausted, recent = Notification.objects.order_by("id").values_list(
+            "id", flat=True
+        )
+        Notification.objects.filter(id__in=[stale, exhausted]).update(
+            status=Notification.SENDING, claimed_at=timezone.now() - timedelta(hours=1)
+        )
+        Notification.objects.filter(id=exhausted).update(attempts=2)
+        Notification.objects.filter(id=recent).update(
+            status=Notification.SENDING, claimed_at=timezone.now()
+        )
+
+        self.assertEqual(drain_notification_outbox.call_local(), 1)
+
+        self.assertEqual(Notification.objects.get(id=stale).status, Notification.SENT)
+        self.assertEqual(Notification.objects.get(id=exhausted).status, Notification.FAILED)
+        self.assertEqual(Notification.objects.get(id=recent).status, Notification.SENDING)
+
+    def test_notifications_need_recepients(self):
+        with self.assertRaises(TypeError):
+            Notification.objects.enqueue(
+                subject="Subject", message="Message", sender="agent@cargotracker.app"
+            )
@@ -1,6 +1,9 @@
 from django.contrib import admin
 
-from .models import Order
+from .models import LaneSurcharge, LaneTransitStats, Order, WeightBand
 
 
 admin.site.register(Order)
+admin.site.register(WeightBand)
+admin.site.register(LaneSurcharge)
+admin.site.register(LaneTransitStats)
@@ -0,0 +1,140 @@
+"""
+Read-through cache of rendered Order details, kept in Redis.
+
+Every tracking id maps to one Redis hash holding a payload per requesting scope, so invalidating an Order is a single DEL.
+Scopes are per superuser role or per user, so a payload is only ever served to someone who was allowed to load it.
+"""
+
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from redis.exceptions import RedisError
+
+from cargotracker.UTILS.redis_utils import get_redis_connection
+
+
+logger = logging.getLogger(__name__)
+
+DETAIL_KEY = "orders:detail:{tracking_id}"
+HITS_KEY = "orders:detail:hits"
+MISSES_KEY = "orders:detail:misses"
+
+
+def cache_enabled():
+    return settings.ORDER_DETAIL_CACHE["ENABLED"]
+
+
+def cache_scope(user):
+    """
+    Return the part of the cache a user may read from.
+    """
+
+    if user.is_superuser:
+        return "superuser"
+    if user.is_staff:
+        return f"agent:{user.id}"
+    return f"user:{user.id}"
+
+
+def get_order_detail(tracking_id, user):
+    """
+    Return the cached payload for this order and user, or None.
+    """
+
+    if not cache_enabled():
+        return None
+
+    try:
+        connection = get_redis_connection()
+        payload = connection.hget(
+            DETAIL_KEY.format(tracking_id=tracking_id), cache_scope(user)
+        )
+        connection.incr(HITS_KEY if payload is not None else MISSES_KEY)
+        return payload
+    except RedisError:
+        logger.exception("Could not read the order detail cache.")
+        return None
+
+
+def get_order_etag(tracking_id, user):
+    """
+    Return the ETag of the cached payload for this order and user, or None.
+    """
+
+    if not cache_enabled():
+        return None
+
+    try:
+        etag = get_redis_connection().hget(
+            DETAIL_KEY.format(tracking_id=tracking_id), f"{cache_scope(user)}:etag"
+        )
+        return etag.decode() if etag is not None else None
+    except RedisError:
+        logger.exception("Could not read the order detail cache.")
+        return None
+
+
+def set_order_detail(tracking_id, user, payload, etag=None):
+    """
+    Cache a rendered payload, and optionally its ETag, for this order and user.
+    """
+
+    if not cache_enabled():
+        return
+
+    key = DETAIL_KEY.format(tracking_id=tracking_id)
+    scope = cache_scope(user)
+    try:
+        pipeline = get_redis_connection().pipeline()
+        pipeline.hset(key, scope, payload)
+        if etag:
+            pipeline.hset(key, f"{scope}:etag", etag)
+        pipeline.expire(key, settings.ORDER_DETAIL_CACHE["TTL"])
+        pipeline.execute()
+    except RedisError:
+        logger.exception("Could not write to the order detail cache.")
+
+
+def invalidate_order_detail(tracking_id):
+    """
+    Drop every cached payload of this order.
+    """
+
+    try:
+        get_redis_connection().delete(DETAIL_KEY.format(tracking_id=tracking_id))
+    except RedisError:
+        logger.exception("Could not invalidate the order detail cache.")
+
+
+def invalidate_order_details(tracking_ids):
+    """
+    Drop every cached payload of many orders in one round trip.
+    """
+
+    if not tracking_ids:
+        return
+    try:
+        get_redis_connection().delete(
+            *[DETAIL_KEY.format(tracking_id=tracking_id) for tracking_id in tracking_ids]
+        )
+    except RedisError:
+        logger.exception("Could not invalidate the order detail cache.")
+
+
+def invalidate_order_detail_on_commit(tracking_id):
+    """
+    Invalidate once the current transaction commits, so that the old data cannot be cached again in between.
+    """
+
+    if cache_enabled():
+        transaction.on_commit(lambda: invalidate_order_detail(tracking_id))
+
+
+def get_cache_stats():
+    """
+    Return the number of cache hits and misses so far.
+    """
+
+    hits, misses = get_redis_connection().mget(HITS_KEY, MISSES_KEY)
+    return {"hits": int(hits or 0), "misses": int(misses or 0)}
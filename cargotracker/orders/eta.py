@@ -0,0 +1,78 @@
+"""
+Transit time estimates learned from delivered orders.
+
+Every delivery updates running statistics of its lane, of its booking station and of the whole network, so estimating an order reads a few rows and never scans past orders.
+"""
+
+
+def transit_scopes(origin_id, destination_id):
+    """
+    Return the keys of the statistics a delivery between two branches counts towards, from the most to the least specific.
+    """
+
+    return f"lane:{origin_id}:{destination_id}", f"origin:{origin_id}", "network"
+
+
+class EtaEstimator:
+    """
+    Estimate transit times in seconds from the statistics of past deliveries.
+
+    estimate = (deliveries * mean transit time + prior_weight * prior) / (deliveries + prior_weight)
+
+    A lane with few deliveries leans on its prior, and follows its own mean as deliveries come in. The prior of a lane is the transit time of its route when there is one.
+    Otherwise it is the estimate for its booking station, whose prior is the estimate for the network, whose prior is `default`.
+    """
+
+    def __init__(self, stats=None, prior_weight=5, default=450, main_branch_id=None):
+        """
+        :args:
+        stats - dictionary of `{scope: (deliveries, mean transit seconds)}`
+        prior_weight - how many deliveries the prior counts as
+        default - transit seconds assumed before any delivery
+        main_branch_id - id of the main branch, if there is one
+        """
+
+        self.stats = stats or {}
+        self.prior_weight = prior_weight
+        self.default = float(default)
+        self.main_branch_id = main_branch_id
+
+    def blend(self, scope, prior):
+        count, mean = self.stats.get(scope, (0, 0.0))
+        if count + self.prior_weight == 0:
+            return prior
+        return (count * mean + self.prior_weight * prior) / (count + self.prior_weight)
+
+    def estimate(self, origin_id, destination_id, route=None):
+        """
+        Return the expected transit time in seconds from one branch to another. `route` is the Route between them, if any.
+        """
+
+        lane, station, network = transit_scopes(origin_id, destination_id)
+        if route is not None:
+            prior = route.transit_time.total_seconds()
+        else:
+            prior = self.blend(station, self.blend(network, self.default))
+        return self.blend(lane, prior)
+
+    def main_station_share(self, origin_id, destination_id, route=None):
+        """
+        Return the share of the transit time spent before reaching the main branch, or None if the cargo does not go there.
+        Without a route, cargo between two other branches is taken to go through the main branch halfway.
+        """
+
+        if self.main_branch_id is None:
+            return None
+        if route is not None:
+            time_to_main_station = route.time_to(self.main_branch_id)
+            if time_to_main_station is None:
+                return None
+            if not route.transit_time:
+                return 0.0
+            return time_to_main_station / route.transit_time
+
+        if origin_id == self.main_branch_id:
+            return 0.0
+        if destination_id == self.main_branch_id:
+            return 1.0
+        return 0.5
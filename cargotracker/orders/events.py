@@ -0,0 +1,73 @@
+"""
+Status and location changes of Orders, published to event streams once they are committed.
+
+Each change goes to the channel of its tracking id, to the channels of the booking and clearing agents, and to the channel all superusers follow.
+"""
+
+from django.db import transaction
+
+from cargotracker.UTILS.events import publish_many
+
+EVENT_NAME = "order"
+ALL_ORDERS_CHANNEL = "orders"
+
+
+def order_channel(tracking_id):
+    return f"order:{tracking_id}"
+
+
+def agent_channel(agent_id):
+    return f"agent:{agent_id}"
+
+
+def order_event(
+    tracking_id,
+    status,
+    past_main_branch,
+    actual_delivery_time,
+    current_location,
+    booking_agent_id,
+    clearing_agent_id,
+):
+    """
+    Return the `(channels, name, data)` event of an order's state.
+    """
+
+    channels = [order_channel(tracking_id), ALL_ORDERS_CHANNEL]
+    channels.extend(
+        agent_channel(agent_id) for agent_id in {booking_agent_id, clearing_agent_id}
+    )
+    data = {
+        "tracking_id": tracking_id,
+        "status": status,
+        "current_location": current_location,
+        "past_main_branch": past_main_branch,
+        "actual_delivery_time": actual_delivery_time,
+    }
+    return channels, EVENT_NAME, data
+
+
+def event_for_order(order):
+    """
+    Return the event of an Order instance. Its cargo should already be loaded.
+    """
+
+    cargo = order.cargo
+    return order_event(
+        order.tracking_id,
+        order.status,
+        order.past_main_branch,
+        order.actual_delivery_time,
+        cargo.current_location,
+        cargo.booking_agent_id,
+        cargo.clearing_agent_id,
+    )
+
+
+def publish_order_events_on_commit(events):
+    """
+    Publish events once the current transaction commits, so that rolled back changes are never announced.
+    """
+
+    if events:
+        transaction.on_commit(lambda: publish_many(events))
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.7 on 2026-10-18 12:46
+
+from django.db import migrations
+from django.db.models import Count
+import uuid
+
+
+def regenerate_duplicate_tracking_ids(apps, schema_editor):
+    """
+    0002 added `tracking_id` with a default that was evaluated once, so every order that existed then shares one id.
+    Give each of them a fresh id before the unique index is created.
+    """
+
+    Order = apps.get_model("orders", "Order")
+    duplicates = [
+        row["tracking_id"]
+        for row in Order.objects.values("tracking_id")
+        .annotate(occurrences=Count("id"))
+        .filter(occurrences__gt=1)
+    ]
+    for order_id in Order.objects.filter(tracking_id__in=duplicates).values_list(
+        "id", flat=True
+    ):
+        Order.objects.filter(id=order_id).update(tracking_id=uuid.uuid4())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_order_tracking_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            regenerate_duplicate_tracking_ids, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.7 on 2026-10-18 12:46
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_regenerate_duplicate_tracking_ids'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='tracking_id',
+            field=models.UUIDField(blank=True, default=uuid.uuid4, unique=True),
+        ),
+    ]
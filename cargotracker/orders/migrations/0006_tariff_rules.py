@@ -0,0 +1,38 @@
+# Generated by Django 2.2.7 on 2026-10-18 12:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0001_initial'),
+        ('orders', '0005_order_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeightBand',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_weight', models.DecimalField(decimal_places=2, max_digits=5, unique=True)),
+                ('multiplier', models.DecimalField(decimal_places=3, default=1, max_digits=5)),
+            ],
+            options={
+                'ordering': ['min_weight'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LaneSurcharge',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('surcharge', models.DecimalField(decimal_places=3, max_digits=9)),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbound_surcharges', to='branches.Branch')),
+                ('origin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbound_surcharges', to='branches.Branch')),
+            ],
+            options={
+                'unique_together': {('origin', 'destination')},
+            },
+        ),
+    ]
@@ -1,15 +1,20 @@
 from decimal import Decimal
-import random
-from datetime import timedelta, datetime
+from datetime import timedelta
 import uuid
 
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import connection, models, transaction
+from django.db.models.signals import post_save, pre_delete
 from django.conf import settings
-from django.utils.timezone import make_aware
+from django.utils import timezone
 
+from branches.models import Branch, BranchOrderSummary, order_summary_changes
+from branches.routing import router
 from cargo.models import Cargo
-from cargotracker.UTILS.tasks import send_async_email
+from notifications.models import Notification
+from .cache import invalidate_order_detail_on_commit
+from .eta import EtaEstimator, transit_scopes
+from .events import event_for_order, publish_order_events_on_commit
+from .tariffs import TariffEngine
 
 Q = models.Q
 
@@ -19,12 +24,35 @@ class OrderQuerySet(models.QuerySet):
     QuerySet for the Orders object.
     """
 
+    # (column, lookup) pairs making up each row of a bulk export
+    export_columns = (
+        ("id", "id"),
+        ("tracking_id", "tracking_id"),
+        ("status", "status"),
+        ("price", "price"),
+        ("price_per_unit_weight", "price_per_unit_weight"),
+        ("past_main_branch", "past_main_branch"),
+        ("cargo_picked_up", "cargo_picked_up"),
+        ("estimated_time_to_main_station", "estimated_time_to_main_station"),
+        ("estimated_delivery_time", "estimated_delivery_time"),
+        ("actual_delivery_time", "actual_delivery_time"),
+        ("cargo", "cargo__id"),
+        ("title", "cargo__title"),
+        ("sender", "cargo__sender__email"),
+        ("recepient", "cargo__recepient__email"),
+        ("booking_station", "cargo__booking_station__city"),
+        ("destination", "cargo__destination__city"),
+        ("weight", "cargo__weight"),
+    )
+
     def for_user(self, user=None):
         """
         Return all orders for a specific user.
         """
 
-        return self.filter(Q(cargo__recepient=user) | Q(cargo__sender=user))
+        return self.filter(
+            cargo__in=Cargo.objects.filter().ids_involving(user, "sender", "recepient")
+        )
 
     def for_agent(self, agent=None):
         """
@@ -32,9 +60,32 @@ class OrderQuerySet(models.QuerySet):
         """
 
         return self.filter(
-            Q(cargo__booking_agent=agent) | Q(cargo__clearing_agent=agent)
+            cargo__in=Cargo.objects.filter().ids_involving(
+                agent, "booking_agent", "clearing_agent"
+            )
         )
 
+    def with_cargo_details(self):
+        """
+        Join the cargo and every party to it so that Orders can be rendered without further queries.
+        """
+
+        return self.select_related(
+            "cargo__sender",
+            "cargo__recepient",
+            "cargo__booking_agent",
+            "cargo__clearing_agent",
+            "cargo__destination",
+        )
+
+    def for_export(self):
+        """
+        Flat rows for bulk exports. Relations are joined in the same query and no model instances are built.
+        """
+
+        lookups = [lookup for _, lookup in self.export_columns]
+        return self.order_by("id").values_list(*lookups)
+
 
 class OrderManager(models.Manager):
     """
@@ -48,10 +99,7 @@ class OrderManager(models.Manager):
         """
         Check if this cargo already has an order associated with it.
         """
-        qs = self.model.objects.get_queryset().filter(cargo=cargo)
-        if qs.exists():
-            return qs.first()
-        return None
+        return self.model.objects.get_queryset().filter(cargo=cargo).first()
 
     def get_or_create_order(
         self, cargo=None, price_per_unit_weight=0.00, past_main_branch=False, **kwargs
@@ -62,23 +110,92 @@ class OrderManager(models.Manager):
 
         created = False
 
-        if self.check_cargo_order(cargo):
-            return self.check_cargo_order(cargo), created
+        existing_order = self.check_cargo_order(cargo)
+        if existing_order:
+            return existing_order, created
         if not isinstance(cargo, Cargo):
             raise TypeError("Please provide cargo instance.")
         if Decimal(price_per_unit_weight) <= 0:
             raise TypeError("Please provide the price for this order greater than 0.")
 
-        order = self.model.objects.create(
-            cargo=cargo,
-            price_per_unit_weight=price_per_unit_weight,
-            past_main_branch=past_main_branch,
-            **kwargs,
-        )
-        order.save()
+        with transaction.atomic():
+            order = self.model.objects.create(
+                cargo=cargo,
+                price_per_unit_weight=price_per_unit_weight,
+                past_main_branch=past_main_branch,
+                **kwargs,
+            )
+            order.save()
         created = True
         return order, created
 
+    def bulk_book_orders(
+        self, cargo_list, price_per_unit_weight=0.00, past_main_branch=False, **kwargs
+    ):
+        """
+        Book orders for many Cargo in one transaction. Every order is priced by one tariff engine pass, and all of them and their notifications are inserted with one `bulk_create` each.
+        :args:
+        cargo_list - Cargo without orders, with their senders, recepients and booking stations' agents joined
+        price_per_unit_weight - price applied to all the orders
+        :return: list of the booked orders
+        """
+
+        if Decimal(price_per_unit_weight) <= 0:
+            raise TypeError("Please provide the price for this order greater than 0.")
+
+        orders = [
+            self.model(
+                cargo=cargo,
+                price_per_unit_weight=Decimal(price_per_unit_weight),
+                past_main_branch=past_main_branch,
+                **kwargs,
+            )
+            for cargo in cargo_list
+        ]
+        lanes = [(cargo.booking_station_id, cargo.destination_id) for cargo in cargo_list]
+        prices = load_tariff_engine(lanes).price_batch(
+            [cargo.weight for cargo in cargo_list],
+            [order.price_per_unit_weight for order in orders],
+            lanes,
+        )
+        for order, price in zip(orders, prices):
+            order.price = price
+        self.set_time_estimates(orders)
+
+        with transaction.atomic():
+            self.model.objects.bulk_create(orders, batch_size=1000)
+            Notification.objects.enqueue_many(
+                [order_booked_email(order) for order in orders]
+            )
+            BranchOrderSummary.objects.apply(
+                change
+                for order in orders
+                for change in order_summary_changes(
+                    order.cargo.booking_station_id,
+                    order.cargo.destination_id,
+                    order.status,
+                    order.cargo.weight,
+                )
+            )
+            publish_order_events_on_commit([event_for_order(order) for order in orders])
+        return orders
+
+    def set_time_estimates(self, orders, estimator=None, now=None):
+        """
+        Estimate the main station and delivery times of many orders with one estimator, loaded for all their lanes at once when none is given.
+        The times count from the creation of each order, or from `now` for orders without one.
+        """
+
+        lanes = [
+            (order.cargo.booking_station_id, order.cargo.destination_id)
+            for order in orders
+        ]
+        estimator = estimator or load_eta_estimator(lanes)
+        now = now or timezone.now()
+        for order in orders:
+            order._set_time_approximations(estimator, now)
+        return orders
+
 
 class Order(models.Model):
     """
@@ -102,7 +219,11 @@ class Order(models.Model):
     estimated_delivery_time = models.DateTimeField(null=True, blank=True)
     actual_delivery_time = models.DateTimeField(null=True, blank=True)
     cargo_picked_up = models.BooleanField(default=False)
-    tracking_id = models.UUIDField(default=uuid.uuid4, null=False, blank=True)
+    tracking_id = models.UUIDField(
+        default=uuid.uuid4, null=False, blank=True, unique=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     objects = OrderManager()
 
@@ -112,44 +233,98 @@ class Order(models.Model):
         """
         return f"{self.cargo}"
 
-    def calculate_price(self):
+    @classmethod
+    def from_db(cls, db, field_names, values):
         """
-        Calculate the price of the order.
+        Remember the status as loaded, so that saving can tell when an order was delivered.
         """
 
-        cargo_weight = self.cargo.weight
-        tax_rate = Decimal(0.18)
+        instance = super().from_db(db, field_names, values)
+        if "status" in field_names:
+            instance._loaded_status = values[field_names.index("status")]
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Record the delivery time of orders that were just delivered, and learn the transit time of their lane from it.
+        New orders and status changes move the order counters of their branches in the same transaction.
+        """
 
-        untaxed_total = Decimal(cargo_weight) * Decimal(self.price_per_unit_weight)
+        previous_status = None if self._state.adding else getattr(self, "_loaded_status", self.status)
+        delivered = (
+            not self._state.adding and self.status == "D" and previous_status != "D"
+        )
+        if previous_status == self.status:
+            super().save(*args, **kwargs)
+        else:
+            if delivered and self.actual_delivery_time is None:
+                self.actual_delivery_time = timezone.now()
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                if delivered:
+                    self._record_transit_time()
+                self._count_status_change(previous_status)
+        self._loaded_status = self.status
+
+    def _count_status_change(self, previous_status):
+        """
+        Move the order from the counters of its previous status, if any, to those of its current one.
+        Orders without cargo are not counted.
+        """
 
-        total_price = (untaxed_total * tax_rate) + untaxed_total
+        if self.cargo_id is None:
+            return
+        cargo = self.cargo
+        changes = order_summary_changes(
+            cargo.booking_station_id, cargo.destination_id, self.status, cargo.weight
+        )
+        if previous_status is not None:
+            changes += order_summary_changes(
+                cargo.booking_station_id,
+                cargo.destination_id,
+                previous_status,
+                cargo.weight,
+                orders=-1,
+            )
+        BranchOrderSummary.objects.apply(changes)
+
+    def _record_transit_time(self):
+        """
+        Add the time from booking to delivery to the statistics of the lane.
+        """
 
-        return total_price
+        if self.created_at is None or self.cargo_id is None:
+            return
+        transit_time = self.actual_delivery_time - self.created_at
+        if transit_time > timedelta(0):
+            LaneTransitStats.objects.record(
+                self.cargo.booking_station_id, self.cargo.destination_id, transit_time
+            )
 
-    def approximate_delivery_time(self):
+    def calculate_price(self, engine=None):
         """
-        Just return a random range to act as expectation of when the cargo will be delivered.
+        Calculate the price of the order with the tariff engine.
         """
-        # this is set to seconds just of demonstration
-        approx_delivery_time = random.randrange(300, 600)
-        approx_time_to_main_station = approx_delivery_time / 2
 
-        return {
-            "delivery_time": approx_delivery_time,
-            "time_to_station": approx_time_to_main_station,
-        }
+        lane = (self.cargo.booking_station_id, self.cargo.destination_id)
+        engine = engine or load_tariff_engine([lane])
+        return engine.price(self.cargo.weight, self.price_per_unit_weight, lane)
 
-    def _set_time_approximations(self):
+    def _set_time_approximations(self, estimator=None, now=None):
         """
-        Actually set the time approximations.
+        Estimate when the cargo reaches the main station and its destination, from the deliveries on its lane and its route.
         """
-        time_dict = self.approximate_delivery_time()
 
-        self.estimated_delivery_time = make_aware(datetime.now() + timedelta(
-            seconds=time_dict.get("delivery_time"))
-        )
-        self.estimated_time_to_main_station = make_aware(datetime.now() + timedelta(
-            seconds=time_dict.get("time_to_station"))
+        lane = (self.cargo.booking_station_id, self.cargo.destination_id)
+        estimator = estimator or load_eta_estimator([lane])
+        start = self.created_at or now or timezone.now()
+        route = router.route(*lane)
+
+        seconds = estimator.estimate(*lane, route=route)
+        share = estimator.main_station_share(*lane, route=route)
+        self.estimated_delivery_time = start + timedelta(seconds=seconds)
+        self.estimated_time_to_main_station = (
+            None if share is None else start + timedelta(seconds=seconds * share)
         )
 
         return True
@@ -164,29 +339,273 @@ class Order(models.Model):
         return self.price
 
 
-def post_save_order_receiver(sender, instance, created, *args, **kwargs):
+class WeightBand(models.Model):
+    """
+    Price multiplier for cargo that weighs at least `min_weight`, up to the next band.
+    """
+
+    min_weight = models.DecimalField(max_digits=5, decimal_places=2, unique=True)
+    multiplier = models.DecimalField(max_digits=5, decimal_places=3, default=1)
+
+    class Meta:
+        ordering = ["min_weight"]
+
+    def __str__(self):
+        return f"{self.min_weight}+ x{self.multiplier}"
+
+
+class LaneSurchargeManager(models.Manager):
+    """
+    Manager for the lane surcharges.
+    """
+
+    def for_lanes(self, lanes=None, chunk_size=500):
+        """
+        Return `{(origin_id, destination_id): surcharge}` for the given lanes, or for every lane when none are given.
+        """
+
+        rows = self.values_list("origin_id", "destination_id", "surcharge")
+        if lanes is None:
+            return {(origin, destination): surcharge for origin, destination, surcharge in rows}
+
+        lanes = sorted(set(lanes))
+        surcharges = {}
+        for start in range(0, len(lanes), chunk_size):
+            lookup = Q()
+            for origin, destination in lanes[start : start + chunk_size]:
+                lookup |= Q(origin_id=origin, destination_id=destination)
+            surcharges.update(
+                ((origin, destination), surcharge)
+                for origin, destination, surcharge in rows.filter(lookup)
+            )
+        return surcharges
+
+
+class LaneSurcharge(models.Model):
+    """
+    Flat surcharge for cargo booked at `origin` and delivered to `destination`.
+    """
+
+    origin = models.ForeignKey(
+        Branch, on_delete=models.CASCADE, related_name="outbound_surcharges"
+    )
+    destination = models.ForeignKey(
+        Branch, on_delete=models.CASCADE, related_name="inbound_surcharges"
+    )
+    surcharge = models.DecimalField(max_digits=9, decimal_places=3)
+
+    objects = LaneSurchargeManager()
+
+    class Meta:
+        unique_together = [("origin", "destination")]
+
+    def __str__(self):
+        return f"{self.origin} -> {self.destination}: {self.surcharge}"
+
+
+class LaneTransitStatsManager(models.Manager):
+    """
+    Manager for the running transit time statistics.
+    """
+
+    def record(self, origin_id, destination_id, transit_time):
+        """
+        Add one delivery to the statistics of its lane, its booking station and the network.
+        """
+
+        return self.record_many([(origin_id, destination_id, transit_time)])
+
+    def record_many(self, deliveries, chunk_size=2000):
+        """
+        Add many deliveries to the statistics, given as `(origin_id, destination_id, transit_time)` tuples.
+        The count, mean and M2 of the new deliveries of each scope are merged into its row with Chan's update of Welford's statistics, in UPDATEs that only read the row's current values, so concurrent deliveries do not lose each other.
+        The values of up to `chunk_size` scopes are joined to their rows from a VALUES list, so a single delivery costs one UPDATE.
+        """
+
+        samples = {}
+        for origin_id, destination_id, transit_time in deliveries:
+            for scope in transit_scopes(origin_id, destination_id):
+                samples.setdefault(scope, []).append(transit_time.total_seconds())
+        if not samples:
+            return 0
+        self.bulk_create([self.model(scope=scope) for scope in samples], ignore_conflicts=True)
+
+        merged = []
+        for scope in sorted(samples):
+            values = samples[scope]
+            count = len(values)
+            mean = sum(values) / count
+            merged.append((scope, count, mean, sum((value - mean) ** 2 for value in values)))
+
+        # expressions with one CASE per scope cost more to build than to run, so this one is written by hand
+        quote = connection.ops.quote_name
+        table, scope, count, mean, m2 = map(
+            quote, (self.model._meta.db_table, "scope", "count", "mean", "m2")
+        )
+        delta = f"(new.column3 - {mean})"
+        total = f"({count} + new.column2)"
+        updated = 0
+        with connection.cursor() as cursor:
+            for start in range(0, len(merged), chunk_size):
+                chunk = merged[start : start + chunk_size]
+                cursor.execute(
+                    f"UPDATE {table} SET "
+                    f"{count} = {total}, "
+                    f"{mean} = {mean} + {delta} * new.column2 / {total}, "
+                    f"{m2} = {m2} + new.column4 + {delta} * {delta} * {count} * new.column2 / {total} "
+                    f"FROM (VALUES {', '.join(['(%s, %s, %s, %s)'] * len(chunk))}) AS new "
+                    f"WHERE {table}.{scope} = new.column1",
+                    [value for row in chunk for value in row],
+                )
+                updated += cursor.rowcount
+        return updated
+
+    def for_lanes(self, lanes=None, chunk_size=500):
+        """
+        Return `{scope: (deliveries, mean transit seconds)}` for the given lanes, or for every lane when none are given.
+        """
+
+        rows = self.values_list("scope", "count", "mean")
+        if lanes is None:
+            return {scope: (count, mean) for scope, count, mean in rows}
+
+        scopes = sorted({scope for lane in lanes for scope in transit_scopes(*lane)})
+        stats = {}
+        for start in range(0, len(scopes), chunk_size):
+            chunk = rows.filter(scope__in=scopes[start : start + chunk_size])
+            stats.update((scope, (count, mean)) for scope, count, mean in chunk)
+        return stats
+
+
+class LaneTransitStats(models.Model):
+    """
+    Running count, mean and sum of squared deviations of the transit times of delivered orders, per lane, per booking station and for the whole network.
+    """
+
+    scope = models.CharField(max_length=50, unique=True)
+    count = models.PositiveIntegerField(default=0)
+    mean = models.FloatField(default=0)
+    m2 = models.FloatField(default=0)
+
+    objects = LaneTransitStatsManager()
+
+    class Meta:
+        verbose_name_plural = "lane transit stats"
+
+    def __str__(self):
+        return f"{self.scope}: {self.count} deliveries"
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+
+def load_eta_estimator(lanes=None):
+    """
+    Build a transit time estimator from the statistics of the given lanes, or of every lane.
+    """
+
+    return EtaEstimator(
+        stats=LaneTransitStats.objects.for_lanes(lanes),
+        prior_weight=settings.ETA["PRIOR_WEIGHT"],
+        default=settings.ETA["DEFAULT_TRANSIT_SECONDS"],
+        main_branch_id=getattr(Branch.objects.get_main_branch(), "id", None),
+    )
+
+
+def load_tariff_engine(lanes=None):
     """
-    Whenever an order is created, do the following.
+    Build a tariff engine from the current rule tables and settings, with the surcharges of the given lanes, or of every lane.
     """
-    sender_email = instance.cargo.sender.email
-    recepient_email = instance.cargo.recepient.email
 
-    booking_agent = instance.cargo.booking_station.branch_agent.email
+    return TariffEngine(
+        bands=WeightBand.objects.values_list("min_weight", "multiplier"),
+        surcharges=LaneSurcharge.objects.for_lanes(lanes),
+        main_branch_id=getattr(Branch.objects.get_main_branch(), "id", None),
+        transit_fee=settings.TARIFF["MAIN_BRANCH_TRANSIT_FEE"],
+        tax_rate=settings.TARIFF["TAX_RATE"],
+        router=router,
+    )
+
+
+def order_booked_email(order):
+    """
+    Return the `(subject, message, sender, recepients)` of the email letting both parties know the order was booked.
+    """
+
+    sender_email = order.cargo.sender.email
+    recepient_email = order.cargo.recepient.email
+
+    booking_agent = order.cargo.booking_station.branch_agent.email
+
+    subject = "Order Finalized and ready to go."
+    message = f"Your cargo has been booked and is ready for delivery. You will be notified whenever the status changes. It is currently {order.get_status_display().title()}. It cost a total of ${order.price:.3f}. Your booking agent is {booking_agent}"
+
+    return subject, message, booking_agent, [sender_email, recepient_email]
+
+
+def post_save_order_receiver(sender, instance, created, *args, **kwargs):
+    """
+    Whenever an order is created, do the following. Every save is announced on the order's event streams.
+    """
 
     if created:
         instance._set_order_price()
         instance._set_time_approximations()
-        price = instance.price
 
-        subject = "Order Finalized and ready to go."
-        message = f"Your cargo has been booked and is ready for delivery. You will be notified whenever the status changes. It is currently {instance.get_status_display().title()}. It cost a total of ${price:.3f}. Your booking agent is {booking_agent}"
+        subject, message, booking_agent, recepients = order_booked_email(instance)
 
-        send_async_email(
+        Notification.objects.enqueue(
             subject=subject,
             message=message,
             sender=booking_agent,
-            recepients=[sender_email, recepient_email],
+            recepients=recepients,
         )
+    else:
+        invalidate_order_detail_on_commit(instance.tracking_id)
+
+    publish_order_events_on_commit([event_for_order(instance)])
 
 
 post_save.connect(post_save_order_receiver, sender=Order)
+
+
+def pre_delete_order_receiver(sender, instance, *args, **kwargs):
+    """
+    Take deleted orders off the counters of their branches, in the transaction that deletes them.
+    """
+
+    if instance.cargo_id is None:
+        return
+    cargo = instance.cargo
+    BranchOrderSummary.objects.apply(
+        order_summary_changes(
+            cargo.booking_station_id,
+            cargo.destination_id,
+            getattr(instance, "_loaded_status", instance.status),
+            cargo.weight,
+            orders=-1,
+        )
+    )
+
+
+def pre_delete_cargo_receiver(sender, instance, *args, **kwargs):
+    """
+    Take the order of deleted cargo off the counters of its branches, since it is left without cargo.
+    """
+
+    status = (
+        Order.objects.filter(cargo_id=instance.id).values_list("status", flat=True).first()
+    )
+    if status is None:
+        return
+    booking_station_id, destination_id, weight = getattr(
+        instance, "_loaded_counted", instance._counted_fields()
+    )
+    BranchOrderSummary.objects.apply(
+        order_summary_changes(booking_station_id, destination_id, status, weight, orders=-1)
+    )
+
+
+pre_delete.connect(pre_delete_order_receiver, sender=Order)
+pre_delete.connect(pre_delete_cargo_receiver, sender=Cargo)
@@ -1,4 +1,5 @@
 import json
+from decimal import Decimal
 
 from rest_framework.renderers import JSONRenderer
 from rest_framework.utils.serializer_helpers import ReturnList
@@ -12,35 +13,25 @@ class OrderJSONRenderer(JSONRenderer):
     """
     charset = "utf-8"
 
+    status_display = dict(Order.STATUS_CHOICES)
+
     def format_order_detail_view_response(self, data):
         """
-        Return appropriate responses for the Order detail views.
+        Return appropriate responses for the Order detail views. Everything needed is already part of the serialized data, so no queries are made here.
         """
 
-        order_instance = Order.objects.get(id=data.get('id'))
-
-        cargo_instance = order_instance.cargo
-
-        order_price = data.get("price")
+        order_price = Decimal(data.get("price"))
         data['price'] = f"{order_price:.3f}"
-        data['tracking_id'] = str(order_instance.tracking_id)
 
-        cargo_weight = cargo_instance.weight
+        cargo_data = data.get("cargo")
 
+        if cargo_data:
+            cargo_weight = Decimal(cargo_data.get("weight"))
+            cargo_data["weight"] = f"{cargo_weight:.3f}"
 
-        cargo_data = {
-            "sender": cargo_instance.sender.email,
-            "recepient": cargo_instance.recepient.email,
-            "booking_agent": cargo_instance.booking_agent.email,
-            "clearing_agent": cargo_instance.clearing_agent.email,
-            "destination": cargo_instance.destination.city,
-            "weight": f"{cargo_weight:.3f}"
-        }
-
-        status = order_instance.get_status_display().title()
+        status = self.status_display.get(data.get("status"), "").title()
 
         data['status'] = status
-        data['cargo'] = cargo_data
 
         return data
 
@@ -56,8 +47,15 @@ class OrderJSONRenderer(JSONRenderer):
 
 
     def render(self, data, media_type=None, renderer_context=None):
+        response = renderer_context.get("response") if renderer_context else None
+        if response is not None and response.exception:
+            return super().render(data)
 
         if isinstance(data, dict):
+            if isinstance(data.get("data"), list):
+                # paginated lists carry their cursors next to the data
+                payload = self.format_order_list_view(data.get("data"))
+                return json.dumps({**data, "data": payload})
             if "error" in str(data).lower():
                 return super().render(data)
             if data.get("data"):
@@ -71,5 +69,4 @@ class OrderJSONRenderer(JSONRenderer):
             payload = self.format_order_list_view(data)
             return json.dumps({"data": payload})
 
-
         return json.dumps(data)
@@ -1,8 +1,34 @@
+from django.conf import settings
+from django.db import IntegrityError
 from rest_framework import serializers
 
 from .models import Order
 from cargo.serializers import CargoSerializer
 from cargo.models import Cargo
+from branches.models import Branch
+
+
+class OrderCargoSerializer(serializers.ModelSerializer):
+    """
+    Read-only summary of the Cargo belonging to an Order.
+    """
+
+    sender = serializers.EmailField(source="sender.email")
+    recepient = serializers.EmailField(source="recepient.email")
+    booking_agent = serializers.EmailField(source="booking_agent.email")
+    clearing_agent = serializers.EmailField(source="clearing_agent.email")
+    destination = serializers.CharField(source="destination.city")
+
+    class Meta:
+        model = Cargo
+        fields = [
+            "sender",
+            "recepient",
+            "booking_agent",
+            "clearing_agent",
+            "destination",
+            "weight",
+        ]
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -11,6 +37,8 @@ class OrderSerializer(serializers.ModelSerializer):
     """
 
     price = serializers.ReadOnlyField()
+    tracking_id = serializers.UUIDField(read_only=True)
+    cargo = OrderCargoSerializer(read_only=True)
 
     class Meta:
         model = Order
@@ -23,19 +51,25 @@ class OrderSerializer(serializers.ModelSerializer):
             "estimated_time_to_main_station",
             "price",
             "id",
+            "tracking_id",
+            "cargo",
         ]
 
     def validate(self, data):
         """
         Validate data.
         """
-       
+
+        # the cargo of an existing order cannot change
+        if self.instance is not None:
+            return super().validate(data)
+
         # DRF pops out `cargo` because we haven't included it in the fields.
         cargo_id = self.initial_data.get("cargo")
 
         # Users should only handle cargo that they handled
         request = self.context.get("request")
-        cargo = Cargo.objects.filter().cargo_handled_by_agent(agent=request.user).get(id=cargo_id)
+        cargo = Cargo.objects.filter().with_parties().cargo_handled_by_agent(agent=request.user).get(id=cargo_id)
 
         # if an order already exists for this cargo, we throw an error to the user.
 
@@ -70,3 +104,73 @@ class OrderSerializer(serializers.ModelSerializer):
 
         except TypeError as e:
             raise serializers.ValidationError({"errors": {"detail": e.args[0]}}) from e
+
+
+class BulkOrderSerializer(serializers.Serializer):
+    """
+    Handle booking orders for many Cargo at once, either from a list of Cargo ids or for all unbooked Cargo at the agent's branch.
+    """
+
+    cargo = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+        allow_empty=False,
+        max_length=settings.BULK_BOOKING_MAX_ROWS,
+    )
+    all_pending = serializers.BooleanField(default=False)
+    price_per_unit_weight = serializers.DecimalField(max_digits=7, decimal_places=3)
+    past_main_branch = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        """
+        Resolve the Cargo to book with a single query. Every requested Cargo must be handled by the agent and not have an order yet.
+        """
+
+        user = self.context.get("request").user
+
+        if bool(data.get("cargo")) == data.get("all_pending"):
+            raise serializers.ValidationError(
+                {"errors": {"cargo": "Provide either a list of cargo or all_pending, but not both."}}
+            )
+
+        unbooked = Cargo.objects.filter(order__isnull=True).with_parties()
+
+        if data.get("all_pending"):
+            branch = Branch.objects.get_agent_branch(agent=user)
+            if not branch:
+                raise serializers.ValidationError(
+                    {"errors": {"all_pending": "You don't have a branch to book pending cargo at."}}
+                )
+            data["cargo"] = list(unbooked.filter(booking_station=branch).order_by("id"))
+            return data
+
+        if not user.is_superuser:
+            unbooked = unbooked.cargo_handled_by_agent(agent=user)
+        cargo = list(unbooked.filter(id__in=data.get("cargo")).order_by("id"))
+
+        missing = set(data.get("cargo")) - {item.id for item in cargo}
+        if missing:
+            raise serializers.ValidationError(
+                {"errors": {"cargo": f"These cargo do not exist or already have orders: {sorted(missing)}."}}
+            )
+
+        data["cargo"] = cargo
+        return data
+
+    def create(self, validated_data):
+        """
+        Book all the orders in one transaction.
+        """
+
+        try:
+            return Order.objects.bulk_book_orders(
+                validated_data.get("cargo"),
+                price_per_unit_weight=validated_data.get("price_per_unit_weight"),
+                past_main_branch=validated_data.get("past_main_branch"),
+            )
+        except TypeError as e:
+            raise serializers.ValidationError({"errors": {"detail": e.args[0]}}) from e
+        except IntegrityError as e:
+            raise serializers.ValidationError(
+                {"errors": {"cargo": "Some of the cargo was booked in the meantime. Please try again."}}
+            ) from e
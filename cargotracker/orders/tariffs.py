@@ -0,0 +1,159 @@
+"""
+Tariff engine that prices orders from the rule tables.
+
+All rules are resolved up front and prices are computed with fixed-point integers, so pricing thousands of orders is one tight pass without any queries or rounding drift.
+"""
+
+from bisect import bisect_right
+from decimal import Decimal, ROUND_HALF_UP
+
+
+# decimal places of the values the engine works with
+WEIGHT_PLACES = 2
+RATE_PLACES = 3
+MULTIPLIER_PLACES = 3
+FEE_PLACES = 3
+TAX_PLACES = 4
+PRICE_PLACES = 3
+
+
+def to_fixed(value, places):
+    """
+    Return `value` as an integer number of `10 ** -places` units.
+    """
+
+    return int(
+        (Decimal(value).scaleb(places)).to_integral_value(rounding=ROUND_HALF_UP)
+    )
+
+
+def divide_half_up(numerator, denominator):
+    """
+    Integer division rounding halves away from zero, like ROUND_HALF_UP.
+    """
+
+    quotient, remainder = divmod(abs(numerator), denominator)
+    if remainder * 2 >= denominator:
+        quotient += 1
+    return quotient if numerator >= 0 else -quotient
+
+
+class TariffEngine:
+    """
+    Price orders from their cargo weight, price per unit weight and lane.
+
+    price = (weight * price_per_unit_weight * band multiplier + lane surcharge + route cost + transit fee) * (1 + tax rate)
+
+    The band is the heaviest one whose `min_weight` the cargo reaches. The route cost is the cost of the legs the cargo travels on, when a router knows a route.
+    The transit fee applies to routes that stop at the main branch on the way. Without a route, every trip that neither starts nor ends at the main branch is taken to go through it.
+    """
+
+    def __init__(
+        self,
+        bands=(),
+        surcharges=None,
+        main_branch_id=None,
+        transit_fee=0,
+        tax_rate=0,
+        router=None,
+    ):
+        """
+        :args:
+        bands - `(min_weight, multiplier)` pairs
+        surcharges - dictionary of `{(origin_id, destination_id): surcharge}`
+        main_branch_id - id of the main branch, if there is one
+        transit_fee - fee for trips through the main branch
+        tax_rate - tax rate applied to the total, e.g. 0.18
+        router - object whose `route(origin_id, destination_id)` returns the Route between two branches or None
+        """
+
+        bands = sorted(
+            (to_fixed(weight, WEIGHT_PLACES), to_fixed(multiplier, MULTIPLIER_PLACES))
+            for weight, multiplier in bands
+        )
+        self.band_weights = [weight for weight, _ in bands]
+        self.band_multipliers = [multiplier for _, multiplier in bands]
+        self.surcharges = {
+            lane: to_fixed(surcharge, FEE_PLACES)
+            for lane, surcharge in (surcharges or {}).items()
+        }
+        self.main_branch_id = main_branch_id
+        self.transit_fee = to_fixed(transit_fee, FEE_PLACES)
+        self.tax_factor = 10 ** TAX_PLACES + to_fixed(tax_rate, TAX_PLACES)
+        self.router = router
+
+    def resolve_routes(self, lanes):
+        """
+        Return `{lane: (route cost, whether the route stops at the main branch)}` for the lanes a router knows a route for.
+        """
+
+        if self.router is None:
+            return {}
+
+        routes = {}
+        for origin, destination in set(lanes):
+            route = self.router.route(origin, destination)
+            if route is not None:
+                routes[(origin, destination)] = (
+                    to_fixed(route.cost, FEE_PLACES),
+                    self.main_branch_id in route.stops[1:-1],
+                )
+        return routes
+
+    def price_batch(self, weights, prices_per_unit_weight, lanes):
+        """
+        Price many orders in one pass. `weights`, `prices_per_unit_weight` and `lanes` are parallel sequences, with a `(booking_station_id, destination_id)` pair for each lane.
+        Routes are looked up once per distinct lane.
+        Return exact prices rounded to 3 decimal places.
+        """
+
+        one_multiplier = 10 ** MULTIPLIER_PLACES
+        # weight * rate * multiplier has this many places, fees are scaled up to match
+        fee_scale = 10 ** (WEIGHT_PLACES + RATE_PLACES + MULTIPLIER_PLACES - FEE_PLACES)
+        divisor = 10 ** (
+            WEIGHT_PLACES + RATE_PLACES + MULTIPLIER_PLACES + TAX_PLACES - PRICE_PLACES
+        )
+
+        band_weights = self.band_weights
+        band_multipliers = self.band_multipliers
+        surcharges = self.surcharges
+        main_branch_id = self.main_branch_id
+        transit_fee = self.transit_fee
+        tax_factor = self.tax_factor
+        routes = self.resolve_routes(lanes)
+
+        prices = []
+        for weight, rate, (origin, destination) in zip(
+            weights, prices_per_unit_weight, lanes
+        ):
+            weight = to_fixed(weight, WEIGHT_PLACES)
+            band = bisect_right(band_weights, weight) - 1
+            multiplier = band_multipliers[band] if band >= 0 else one_multiplier
+
+            fees = surcharges.get((origin, destination), 0)
+            route = routes.get((origin, destination))
+            if route is not None:
+                route_cost, through_main_branch = route
+                fees += route_cost
+            else:
+                through_main_branch = main_branch_id is not None and main_branch_id not in (
+                    origin,
+                    destination,
+                )
+            if through_main_branch:
+                fees += transit_fee
+
+            subtotal = (
+                weight * to_fixed(rate, RATE_PLACES) * multiplier + fees * fee_scale
+            )
+            price = divide_half_up(subtotal * tax_factor, divisor)
+            prices.append(Decimal(price).scaleb(-PRICE_PLACES))
+
+        return prices
+
+    def price(self, weight, price_per_unit_weight, lane):
+        """
+        Price a single order.
+        """
+
+        return self.price_batch([weight], [price_per_unit_weight], [lane])[0]
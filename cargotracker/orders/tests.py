@@ -1,3 +1,597 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from cargotracker.UTILS.testing import CargoTrackerTestCase, create_cargo, create_user
+from branches.models import Lane
+from branches.registry import registry
+from branches.routing import Route, router
+from cargo.models import Cargo
+from cargotracker.UTILS import events
+from notifications.models import Notification
+from .eta import EtaEstimator
+from .models import LaneSurcharge, LaneTransitStats, Order, WeightBand, load_tariff_engine
+from .tariffs import TariffEngine
+from . import cache as order_cache
+
+
+class OrderTestCase(CargoTrackerTestCase):
+    """
+    Provide a handful of booked orders.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.orders = [
+            Order.objects.get_or_create_order(
+                cargo=create_cargo(
+                    create_user(f"sender{index}@example.com"),
+                    cls.recepient,
+                    cls.main_branch,
+                    cls.branch,
+                    title=f"Parcel {index}",
+                ),
+                price_per_unit_weight=10,
+            )[0]
+            for index in range(10)
+        ]
+
+
+class OrderRenderingTestCase(OrderTestCase):
+    """
+    Orders are rendered from a single joined query, next to the one reading their ETag versions.
+    """
+
+    def test_list_renders_from_a_single_query(self):
+        self.client.force_authenticate(self.admin)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("orders:list-order"))
+
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()["data"]
+        self.assertEqual(len(payload), 10)
+        self.assertEqual(payload[0]["status"], "Pending")
+        self.assertEqual(payload[0]["cargo"]["destination"], self.branch.city)
+        self.assertEqual(payload[0]["cargo"]["weight"], "10.000")
+
+    def test_detail_renders_from_a_single_query(self):
+        order = self.orders[0]
+        self.client.force_authenticate(self.recepient)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse("orders:order-detail-view", args=[order.tracking_id])
+            )
+
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()["data"]
+        self.assertEqual(payload["tracking_id"], str(order.tracking_id))
+        self.assertEqual(payload["price"], "118.000")
+        self.assertEqual(payload["cargo"]["sender"], "sender0@example.com")
+        self.assertEqual(payload["cargo"]["booking_agent"], self.agent.email)
+
+    def test_created_order_is_rendered_with_its_cargo(self):
+        cargo = create_cargo(self.sender, self.recepient, self.main_branch, self.branch)
+        self.client.force_authenticate(self.agent)
+
+        response = self.client.post(
+            reverse("orders:list-order"),
+            {"cargo": cargo.id, "price_per_unit_weight": "2.5", "past_main_branch": False},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        payload = response.json()["data"]
+        self.assertEqual(payload["price"], "29.500")
+        self.assertEqual(payload["cargo"]["recepient"], self.recepient.email)
+
+
+class OrderExportTestCase(OrderTestCase):
+    """
+    Orders can be exported through the management command.
+    """
+
+    def test_export_command_writes_csv(self):
+        out = StringIO()
+
+        call_command("export_data", "orders", "--output-format", "csv", stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 11)
+        self.assertIn(str(self.orders[0].tracking_id), lines[1])
+
+
+class OrderTrackingIDLookupTestCase(OrderTestCase):
+    """
+    Tracking ids are validated in the URL before any query is made.
+    """
+
+    def test_malformed_tracking_id_is_rejected_without_queries(self):
+        self.client.force_authenticate(self.admin)
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/orders/not-a-tracking-id/")
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_tracking_id_is_matched_in_any_spelling(self):
+        order = self.orders[0]
+        self.client.force_authenticate(self.admin)
+
+        response = self.client.get(f"/api/orders/{order.tracking_id.hex.upper()}/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"]["tracking_id"], str(order.tracking_id))
+
+
+class OrderDetailCacheTestCase(OrderTestCase):
+    """
+    Rendered order details are cached per requesting user.
+    """
+
+    def get_detail(self, order):
+        return self.client.get(
+            reverse("orders:order-detail-view", args=[order.tracking_id])
+        )
+
+    def test_second_request_is_served_from_the_cache(self):
+        order = self.orders[0]
+        self.client.force_authenticate(self.recepient)
+        first = self.get_detail(order)
+
+        with self.assertNumQueries(0):
+            second = self.get_detail(order)
+
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(order_cache.get_cache_stats(), {"hits": 1, "misses": 1})
+
+    def test_cached_payload_is_not_served_to_other_users(self):
+        order = self.orders[0]
+        self.client.force_authenticate(self.recepient)
+        self.get_detail(order)
+
+        self.client.force_authenticate(create_user("stranger@example.com"))
+        response = self.get_detail(order)
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_saving_the_order_invalidates_the_cache(self):
+        order = self.orders[0]
+        self.client.force_authenticate(self.recepient)
+        self.get_detail(order)
+
+        with mock.patch("orders.cache.transaction.on_commit", lambda func: func()):
+            order.status = "T"
+            order.save()
+
+        self.assertEqual(self.get_detail(order).json()["data"]["status"], "In Transit")
+
+    def test_saving_the_cargo_invalidates_the_cache(self):
+        order = self.orders[0]
+        self.client.force_authenticate(self.recepient)
+        self.get_detail(order)
+
+        with mock.patch("orders.cache.transaction.on_commit", lambda func: func()):
+            order.cargo.weight = 20
+            order.cargo.save()
+
+        self.assertEqual(self.get_detail(order).json()["data"]["cargo"]["weight"], "20.000")
+
+    @override_settings(ORDER_DETAIL_CACHE={"ENABLED": False, "TTL": 60})
+    def test_cache_can_be_turned_off(self):
+        order = self.orders[0]
+        self.client.force_authenticate(self.recepient)
+        self.get_detail(order)
+
+        with self.assertNumQueries(2):
+            self.get_detail(order)
+
+
+class OrderConditionalGetTestCase(OrderTestCase):
+    """
+    Order endpoints send ETags and answer 304 when nothing changed.
+    """
+
+    def test_cached_order_is_revalidated_without_queries(self):
+        url = reverse("orders:order-detail-view", args=[self.orders[0].tracking_id])
+        self.client.force_authenticate(self.recepient)
+        etag = self.client.get(url)["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_to_the_cargo_change_the_list_etag(self):
+        url = reverse("orders:list-order")
+        self.client.force_authenticate(self.admin)
+        etag = self.client.get(url)["ETag"]
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        cargo = self.orders[3].cargo
+        cargo.title = "Renamed"
+        cargo.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class EtaEstimatorTestCase(OrderTestCase):
+    """
+    Transit times are learned from deliveries and lanes without many fall back to their route, station or the network.
+    """
+
+    def deliver(self, order, hours):
+        Order.objects.filter(id=order.id).update(
+            created_at=timezone.now() - timedelta(hours=hours)
+        )
+        order = Order.objects.get(id=order.id)
+        order.status = "D"
+        order.save()
+        return order
+
+    def test_estimates_lean_on_their_prior_until_deliveries_come_in(self):
+        estimator = EtaEstimator(default=450)
+        self.assertEqual(estimator.estimate(1, 2), 450)
+
+        estimator = EtaEstimator(stats={"network": (5, 1000.0)}, default=450)
+        self.assertEqual(estimator.estimate(1, 2), 725)
+
+        estimator = EtaEstimator(
+            stats={"lane:1:2": (95, 2000.0), "network": (5, 1000.0)}, default=450
+        )
+        self.assertEqual(estimator.estimate(1, 2), (95 * 2000 + 5 * 725) / 100)
+
+        route = Route((1, 2), (timedelta(0), timedelta(hours=1)), Decimal("0"))
+        self.assertEqual(EtaEstimator().estimate(1, 2, route=route), 3600)
+
+    def test_deliveries_update_the_running_statistics(self):
+        order = self.deliver(self.orders[0], 2)
+        self.deliver(self.orders[1], 4)
+        # delivered orders are only counted once
+        order.save()
+
+        self.assertIsNotNone(order.actual_delivery_time)
+        lane = LaneTransitStats.objects.get(
+            scope=f"lane:{self.main_branch.id}:{self.branch.id}"
+        )
+        self.assertEqual(lane.count, 2)
+        self.assertAlmostEqual(lane.mean, 3 * 3600, delta=1)
+        self.assertAlmostEqual(lane.variance, 2 * 3600 ** 2, delta=3600 * 10)
+        self.assertEqual(
+            LaneTransitStats.objects.get(scope=f"origin:{self.main_branch.id}").count, 2
+        )
+        self.assertEqual(LaneTransitStats.objects.get(scope="network").count, 2)
+
+    def test_batches_of_deliveries_merge_into_the_statistics(self):
+        LaneTransitStats.objects.record(1, 2, timedelta(hours=1))
+
+        # one insert and one update for the five scopes
+        with self.assertNumQueries(2):
+            LaneTransitStats.objects.record_many(
+                [
+                    (1, 2, timedelta(hours=2)),
+                    (1, 2, timedelta(hours=3)),
+                    (1, 3, timedelta(hours=4)),
+                ]
+            )
+
+        lane = LaneTransitStats.objects.get(scope="lane:1:2")
+        self.assertEqual(lane.count, 3)
+        self.assertAlmostEqual(lane.mean, 2 * 3600)
+        self.assertAlmostEqual(lane.variance, 3600 ** 2)
+        network = LaneTransitStats.objects.get(scope="network")
+        self.assertEqual(network.count, 4)
+        self.assertAlmostEqual(network.mean, 2.5 * 3600)
+        self.assertEqual(LaneTransitStats.objects.get(scope="lane:1:3").count, 1)
+
+    @override_settings(ETA={"PRIOR_WEIGHT": 0, "DEFAULT_TRANSIT_SECONDS": 450})
+    def test_orders_are_estimated_from_the_statistics(self):
+        self.deliver(self.orders[0], 2)
+        cargo = create_cargo(self.sender, self.recepient, self.main_branch, self.branch)
+
+        order, _ = Order.objects.get_or_create_order(
+            cargo=cargo, price_per_unit_weight=10
+        )
+
+        self.assertAlmostEqual(
+            (order.estimated_delivery_time - order.created_at).total_seconds(),
+            2 * 3600,
+            delta=1,
+        )
+        # booked at the main station
+        self.assertEqual(order.estimated_time_to_main_station, order.created_at)
+
+    @override_settings(ETA={"PRIOR_WEIGHT": 0, "DEFAULT_TRANSIT_SECONDS": 450})
+    def test_undelivered_orders_are_estimated_again_in_bulk(self):
+        self.deliver(self.orders[0], 3)
+        out = StringIO()
+
+        call_command("reestimate_orders", batch_size=5, stdout=out)
+
+        self.assertIn("Estimated 9 orders again.", out.getvalue())
+        order = Order.objects.get(id=self.orders[1].id)
+        self.assertAlmostEqual(
+            (order.estimated_delivery_time - order.created_at).total_seconds(),
+            3 * 3600,
+            delta=1,
+        )
+        self.assertGreater(order.updated_at, self.orders[1].updated_at)
+
+
+@override_settings(
+    EVENT_STREAM={
+        "HEARTBEAT": 0.01,
+        "MAX_DURATION": 60,
+        "HISTORY_LENGTH": 3,
+        "HISTORY_TTL": 60,
+        "QUEUE_SIZE": 2,
+    }
+)
+class OrderEventStreamTestCase(OrderTestCase):
+    """
+    Order changes are published once committed, and streamed with a replay of what a reconnecting client missed.
+    """
+
+    def setUp(self):
+        super().setUp()
+        # the subscription thread is not needed to hand frames to the streams under test
+        patcher = mock.patch.object(events.broadcaster, "start")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.order = self.orders[0]
+        self.channel = f"order:{self.order.tracking_id}"
+
+    def test_saved_orders_are_published_to_their_channels(self):
+        with mock.patch(
+            "orders.events.transaction.on_commit", side_effect=lambda callback: callback()
+        ):
+            self.order.status = "T"
+            self.order.save()
+
+        frames = events.read_history([self.channel], 0)
+        self.assertEqual(len(frames), 1)
+        self.assertIn('"status": "T"', frames[0])
+        self.assertEqual(events.read_history([f"agent:{self.agent.id}"], 0), frames)
+        self.assertEqual(events.read_history(["orders"], 0), frames)
+
+    def test_streams_replay_missed_events_then_follow_live_ones(self):
+        frames = [
+            events.publish([self.channel], "order", {"status": status})[0]
+            for status in ("P", "T", "D", "D")
+        ]
+        self.assertEqual(events.read_history([self.channel], 0), frames[1:])
+
+        stream = events.stream_events([self.channel], events.frame_id(frames[1]))
+        self.assertTrue(next(stream).startswith("retry:"))
+        self.assertEqual([next(stream), next(stream)], frames[2:])
+
+        live = events.format_event(events.frame_id(frames[3]) + 1, "order", {})
+        events.broadcaster.dispatch(self.channel, frames[3])
+        events.broadcaster.dispatch(self.channel, live)
+        self.assertEqual(next(stream), live)
+        self.assertEqual(next(stream), ": heartbeat\n\n")
+
+        stream.close()
+        self.assertEqual(events.broadcaster.listeners, {})
+
+    def test_frames_arriving_out_of_order_are_all_sent(self):
+        stream = events.stream_events([self.channel, "orders"])
+        next(stream)
+        later, earlier = (events.format_event(event_id, "order", {}) for event_id in (11, 10))
+
+        # two workers published at once, and the later id arrived first
+        events.broadcaster.dispatch(self.channel, later)
+        events.broadcaster.dispatch(self.channel, earlier)
+        self.assertEqual([next(stream), next(stream)], [later, earlier])
+
+        # both were published to the other channel as well
+        events.broadcaster.dispatch("orders", later)
+        events.broadcaster.dispatch("orders", earlier)
+        self.assertEqual(next(stream), ": heartbeat\n\n")
+        stream.close()
+
+    def test_streams_falling_behind_are_closed(self):
+        stream = events.stream_events([self.channel])
+        next(stream)
+
+        for event_id in range(1, 4):
+            events.broadcaster.dispatch(
+                self.channel, events.format_event(event_id, "order", {})
+            )
+
+        self.assertEqual(len(list(stream)), 2)
+
+    def test_streams_are_limited_to_visible_orders(self):
+        url = reverse("orders:order-detail-events", args=[self.order.tracking_id])
+
+        self.client.force_authenticate(self.orders[1].cargo.sender)
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT="text/event-stream").status_code, 404)
+        self.assertEqual(self.client.get(reverse("orders:order-events")).status_code, 403)
+
+        self.client.force_authenticate(self.order.cargo.sender)
+        response = self.client.get(url, HTTP_ACCEPT="text/event-stream")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+
+class BulkOrderBookingTestCase(CargoTrackerTestCase):
+    """
+    Agents can book orders for many Cargo in one request.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.cargo = [
+            create_cargo(cls.sender, cls.recepient, cls.main_branch, cls.branch)
+            for _ in range(15)
+        ]
+        create_cargo(cls.sender, cls.recepient, cls.branch, cls.other_branch)
+
+    def book(self, data):
+        self.client.force_authenticate(self.agent)
+        return self.client.post(reverse("orders:bulk-create-orders"), data, format="json")
+
+    def test_all_pending_cargo_at_the_branch_is_booked_at_once(self):
+        registry.get_index()
+        router.get_graph()
+
+        # the cargo, two tariff tables, the transit statistics, the inserts, the branch counters and the savepoint
+        with self.assertNumQueries(10):
+            response = self.book({"all_pending": True, "price_per_unit_weight": "2.5"})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["data"]["created"], 15)
+        self.assertEqual(Order.objects.count(), 15)
+        self.assertEqual(Order.objects.first().price, Decimal("29.500"))
+        self.assertEqual(
+            Notification.objects.filter(
+                subject="Order Finalized and ready to go."
+            ).count(),
+            15,
+        )
+
+    def test_listed_cargo_is_booked(self):
+        response = self.book(
+            {"cargo": [self.cargo[0].id, self.cargo[1].id], "price_per_unit_weight": "2.5"}
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            set(Order.objects.values_list("cargo", flat=True)),
+            {self.cargo[0].id, self.cargo[1].id},
+        )
+
+    def test_booked_or_foreign_cargo_rejects_the_whole_request(self):
+        Order.objects.get_or_create_order(cargo=self.cargo[0], price_per_unit_weight=1)
+        foreign = Cargo.objects.get(booking_station=self.branch)
+
+        response = self.book(
+            {
+                "cargo": [self.cargo[0].id, self.cargo[1].id, foreign.id],
+                "price_per_unit_weight": "2.5",
+            }
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class TariffEngineTestCase(CargoTrackerTestCase):
+    """
+    Orders are priced exactly from the weight bands, lane surcharges, transit fee and tax.
+    """
+
+    def test_prices_are_exact(self):
+        engine = TariffEngine(tax_rate="0.18")
+
+        self.assertEqual(engine.price("10.00", "10", (1, 2)), Decimal("118.000"))
+        self.assertEqual(engine.price("0.01", "0.001", (1, 2)), Decimal("0.000"))
+        self.assertEqual(engine.price("33.33", "3.333", (1, 2)), Decimal("131.085"))
+
+    def test_rules_are_applied(self):
+        engine = TariffEngine(
+            bands=[("0", "1"), ("100", "0.9"), ("500", "0.8")],
+            surcharges={(1, 2): "5"},
+            main_branch_id=1,
+            transit_fee="7.5",
+            tax_rate="0.1",
+        )
+
+        self.assertEqual(engine.price("99.99", "1", (1, 2)), Decimal("115.489"))
+        self.assertEqual(engine.price("100", "1", (2, 1)), Decimal("99.000"))
+        self.assertEqual(engine.price("500", "1", (2, 3)), Decimal("448.250"))
+
+    def test_batch_matches_single_prices(self):
+        engine = TariffEngine(
+            bands=[("50", "0.95")], surcharges={(1, 2): "3"}, tax_rate="0.18"
+        )
+        weights = ["1.5", "50", "75.25", "999.99"]
+        rates = ["2", "2.5", "0.125", "10"]
+        lanes = [(1, 2), (2, 1), (1, 2), (3, 1)]
+
+        self.assertEqual(
+            engine.price_batch(weights, rates, lanes),
+            [engine.price(*order) for order in zip(weights, rates, lanes)],
+        )
+
+    @override_settings(TARIFF={"TAX_RATE": "0.18", "MAIN_BRANCH_TRANSIT_FEE": "2"})
+    def test_orders_are_priced_from_the_rule_tables(self):
+        WeightBand.objects.create(min_weight=5, multiplier="0.5")
+        LaneSurcharge.objects.create(
+            origin=self.branch, destination=self.other_branch, surcharge=10
+        )
+        cargo = create_cargo(self.sender, self.recepient, self.branch, self.other_branch)
+
+        order, _ = Order.objects.get_or_create_order(
+            cargo=cargo, price_per_unit_weight=10
+        )
+
+        # (10 * 10 * 0.5 + 10 + 2) * 1.18
+        order.refresh_from_db()
+        self.assertEqual(order.price, Decimal("73.160"))
+
+    def test_only_the_surcharges_of_the_priced_lanes_are_loaded(self):
+        for origin, destination in (
+            (self.branch, self.other_branch),
+            (self.other_branch, self.branch),
+            (self.main_branch, self.branch),
+        ):
+            LaneSurcharge.objects.create(origin=origin, destination=destination, surcharge=10)
+        lanes = [(self.branch.id, self.other_branch.id), (self.main_branch.id, self.branch.id)]
+
+        self.assertEqual(set(load_tariff_engine(lanes).surcharges), set(lanes))
+        self.assertEqual(len(load_tariff_engine().surcharges), 3)
+
+    @override_settings(TARIFF={"TAX_RATE": "0", "MAIN_BRANCH_TRANSIT_FEE": "2"})
+    def test_orders_are_priced_and_estimated_from_their_route(self):
+        Lane.objects.create(
+            origin=self.branch,
+            destination=self.main_branch,
+            transit_time=timedelta(hours=6),
+            cost=10,
+        )
+        Lane.objects.create(
+            origin=self.main_branch,
+            destination=self.other_branch,
+            transit_time=timedelta(hours=5),
+            cost=8,
+        )
+        cargo = create_cargo(self.sender, self.recepient, self.branch, self.other_branch)
+
+        order, _ = Order.objects.get_or_create_order(
+            cargo=cargo, price_per_unit_weight=10
+        )
+
+        # 10 * 10 + 10 + 8 + 2
+        order.refresh_from_db()
+        self.assertEqual(order.price, Decimal("120.000"))
+        self.assertEqual(
+            order.estimated_delivery_time - order.estimated_time_to_main_station,
+            timedelta(hours=5),
+        )
+
+    def test_transit_fee_follows_the_route(self):
+        hour = timedelta(hours=1)
+        routes = {
+            (2, 3): Route((2, 3), (timedelta(0), hour), Decimal("4")),
+            (2, 4): Route((2, 1, 4), (timedelta(0), hour, 2 * hour), Decimal("6")),
+        }
+        engine = TariffEngine(
+            main_branch_id=1,
+            transit_fee="7.5",
+            router=mock.Mock(route=lambda *lane: routes.get(lane)),
+        )
+
+        self.assertEqual(engine.price("1", "1", (2, 3)), Decimal("5.000"))
+        self.assertEqual(engine.price("1", "1", (2, 4)), Decimal("14.500"))
+        self.assertEqual(engine.price("1", "1", (3, 4)), Decimal("8.500"))
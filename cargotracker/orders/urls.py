@@ -1,10 +1,27 @@
-from django.urls import path
+from django.urls import path, register_converter
 
-from .views import ListCreateOrderAPIView, RetreiveUpdateOrderAPIView
+from .views import (
+    ListCreateOrderAPIView,
+    RetreiveUpdateOrderAPIView,
+    OrderExportAPIView,
+    BulkOrderCreateAPIView,
+    OrderEventStreamAPIView,
+)
+from cargotracker.UTILS.converters import TrackingIDConverter
+
+register_converter(TrackingIDConverter, "tracking_id")
 
 urlpatterns = [
+    path("bulk/", BulkOrderCreateAPIView.as_view(), name="bulk-create-orders"),
+    path("export/", OrderExportAPIView.as_view(), name="export-orders"),
+    path("events/", OrderEventStreamAPIView.as_view(), name="order-events"),
+    path(
+        "<tracking_id:tracking_id>/events/",
+        OrderEventStreamAPIView.as_view(),
+        name="order-detail-events",
+    ),
     path(
-        "<tracking_id>/",
+        "<tracking_id:tracking_id>/",
         RetreiveUpdateOrderAPIView.as_view(),
         name="order-detail-view",
     ),
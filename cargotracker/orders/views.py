@@ -1,18 +1,30 @@
+from django.http import HttpResponse
 from django.shortcuts import render
 from rest_framework import generics, status
 from rest_framework.generics import mixins
+from rest_framework.exceptions import NotFound, PermissionDenied
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
 
-from .serializers import OrderSerializer
+from .serializers import OrderSerializer, BulkOrderSerializer
 from .models import Order
 from .renderers import OrderJSONRenderer
+from .events import ALL_ORDERS_CHANNEL, agent_channel, order_channel
+from . import cache as order_cache
 from cargo.models import Cargo
-from authentication.permissions import IsStaffOrIsAuthenticatedReadOnly
+from authentication.permissions import (
+    IsStaffOrIsAuthenticatedReadOnly,
+    IsStaffOrReadOnly,
+)
+from cargotracker.UTILS.pagination import DataCursorPagination
+from cargotracker.UTILS.exports import ExportAPIView
+from cargotracker.UTILS.conditional import ConditionalGetMixin
+from cargotracker.UTILS.events import EventStreamRenderer, event_stream_response
 
 
-class ListCreateOrderAPIView(generics.ListCreateAPIView):
+class ListCreateOrderAPIView(ConditionalGetMixin, generics.ListCreateAPIView):
     """
     Define the endpoints for creating orders.
     """
@@ -20,6 +32,9 @@ class ListCreateOrderAPIView(generics.ListCreateAPIView):
     permission_classes = (IsStaffOrIsAuthenticatedReadOnly,)
     serializer_class = OrderSerializer
     renderer_classes = (OrderJSONRenderer,)
+    pagination_class = DataCursorPagination
+    etag_fields = ("updated_at", "cargo__updated_at")
+
     def get_queryset(self):
         """
         Return appropriate queryset depending on users making the request.
@@ -27,11 +42,12 @@ class ListCreateOrderAPIView(generics.ListCreateAPIView):
 
         user = self.request.user
 
+        queryset = Order.objects.filter().with_cargo_details()
         if user.is_superuser:
-            return Order.objects.all()
+            return queryset
         elif user.is_staff:
-            return Order.objects.filter().for_agent(agent=user)
-        return Order.objects.filter().for_user(user=user)
+            return queryset.for_agent(agent=user)
+        return queryset.for_user(user=user)
 
     def create(self, request, *args, **kwargs):
         """
@@ -63,7 +79,7 @@ class ListCreateOrderAPIView(generics.ListCreateAPIView):
         return Response(response, status=status.HTTP_201_CREATED)
 
 
-class RetreiveUpdateOrderAPIView(generics.RetrieveUpdateAPIView):
+class RetreiveUpdateOrderAPIView(ConditionalGetMixin, generics.RetrieveUpdateAPIView):
     """
     Contains endpoints for retreiving and updating single Order instances.
     """
@@ -72,6 +88,7 @@ class RetreiveUpdateOrderAPIView(generics.RetrieveUpdateAPIView):
     permission_classes = (IsStaffOrIsAuthenticatedReadOnly,)
     renderer_classes = (OrderJSONRenderer,)
     lookup_field = 'tracking_id'
+    etag_fields = ("updated_at", "cargo__updated_at")
     
     def get_queryset(self):
         """
@@ -80,8 +97,120 @@ class RetreiveUpdateOrderAPIView(generics.RetrieveUpdateAPIView):
 
         user = self.request.user
 
+        queryset = Order.objects.filter().with_cargo_details()
+        if user.is_superuser:
+            return queryset
+        elif user.is_staff:
+            return queryset.for_agent(agent=user)
+        return queryset.for_user(user=user)
+
+    def get_etag(self, request, *args, **kwargs):
+        """
+        Cached payloads are dropped whenever the order changes, so their ETag can be trusted without querying for it.
+        """
+
+        tracking_id = kwargs.get(self.lookup_field)
+        etag = order_cache.get_order_etag(tracking_id, request.user)
+        return etag or super().get_etag(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Serve the rendered order from the cache, rendering and caching it on a miss.
+        """
+
+        tracking_id = kwargs.get(self.lookup_field)
+        payload = order_cache.get_order_detail(tracking_id, request.user)
+
+        if payload is None:
+            response = super().retrieve(request, *args, **kwargs)
+            payload = OrderJSONRenderer().render(response.data)
+            order_cache.set_order_detail(
+                tracking_id, request.user, payload, etag=self.etag
+            )
+
+        return HttpResponse(payload, content_type="application/json; charset=utf-8")
+
+
+class OrderEventStreamAPIView(generics.GenericAPIView):
+    """
+    Push the status and location changes of one order, or of every order an agent or superuser can see, as Server-Sent Events.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = (JSONRenderer, EventStreamRenderer)
+
+    def get_queryset(self):
+        """
+        Return appropriate queryset depending on the user making the request
+        """
+
+        user = self.request.user
+        queryset = Order.objects.filter()
         if user.is_superuser:
-            return Order.objects.all()
+            return queryset
+        elif user.is_staff:
+            return queryset.for_agent(agent=user)
+        return queryset.for_user(user=user)
+
+    def get(self, request, *args, **kwargs):
+        """
+        Stream the events of the order, or of all visible orders. Reconnecting with `Last-Event-ID` replays the recent events missed in between.
+        """
+
+        user = request.user
+        tracking_id = kwargs.get("tracking_id")
+        if tracking_id is not None:
+            if not self.get_queryset().filter(tracking_id=tracking_id).exists():
+                raise NotFound("We could not find that order.")
+            channels = [order_channel(tracking_id)]
+        elif user.is_superuser:
+            channels = [ALL_ORDERS_CHANNEL]
         elif user.is_staff:
-            return Order.objects.filter().for_agent(agent=user)
-        return Order.objects.filter().for_user(user=user)
+            channels = [agent_channel(user.id)]
+        else:
+            raise PermissionDenied("Follow your orders by their tracking id.")
+
+        return event_stream_response(request, channels)
+
+
+class BulkOrderCreateAPIView(generics.CreateAPIView):
+    """
+    Allow agents to book orders for many Cargo at once, e.g. at the end of the day.
+    """
+
+    permission_classes = (IsStaffOrReadOnly,)
+    serializer_class = BulkOrderSerializer
+
+    def create(self, request, *args, **kwargs):
+        """
+        Book the orders and report their tracking ids and prices.
+        """
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        orders = serializer.create(serializer.validated_data)
+
+        payload = {
+            "data": {
+                "orders": [
+                    {
+                        "cargo": order.cargo_id,
+                        "tracking_id": str(order.tracking_id),
+                        "price": f"{order.price:.3f}",
+                    }
+                    for order in orders
+                ],
+                "created": len(orders),
+                "message": f"Succesfully created {len(orders)} orders.",
+            }
+        }
+        return Response(payload, status=status.HTTP_201_CREATED)
+
+
+class OrderExportAPIView(ExportAPIView):
+    """
+    Stream every Order for bulk exports.
+    """
+
+    queryset = Order.objects.all()
+    export_name = "orders"
@@ -0,0 +1,55 @@
+"""This script benchmarks city autocomplete with thousands of branches."""
+
+import random
+import statistics
+import time
+
+from django.db import connection, transaction
+
+from branches.models import Branch
+from cargotracker.UTILS import synthetic
+
+
+def run(*args):
+    """
+    Create branches and time searches for random prefixes of their cities, through the indexes on Postgres or the registry trie elsewhere. Everything is rolled back afterwards.
+
+    python manage.py runscript bench_branch_search --script-args branches=5000 searches=1000
+    """
+
+    options = dict(arg.split("=") for arg in args)
+    searches = int(options.get("searches", 1000))
+
+    with transaction.atomic():
+        synthetic.create_branches(int(options.get("branches", 5000)), synthetic.new_tag())
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE branches_branch")
+
+        cities = list(Branch.objects.values_list("city", flat=True))
+        queries = []
+        for _ in range(searches):
+            city = random.choice(cities).lower()
+            queries.append(city[: random.randint(2, len(city))])
+
+        # the first search loads the registry and builds its trie
+        start = time.perf_counter()
+        Branch.objects.search_by_city(queries[0])
+        first_ms = (time.perf_counter() - start) * 1000
+
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            Branch.objects.search_by_city(query)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+
+        print(f"{len(cities)} branches on {connection.vendor}")
+        print(f"first search {first_ms:.3f} ms")
+        print(
+            f"p50 {statistics.median(timings):.3f} ms, "
+            f"p95 {timings[int(len(timings) * 0.95)]:.3f} ms, "
+            f"p99 {timings[int(len(timings) * 0.99)]:.3f} ms"
+        )
+
+        transaction.set_rollback(True)
@@ -0,0 +1,65 @@
+"""This script benchmarks sending email with a connection per message against the batch dispatcher."""
+
+import tempfile
+import time
+
+from django.core.mail import EmailMessage, get_connection
+
+from cargotracker.UTILS.mail import MailDispatcher
+
+
+BACKENDS = {
+    "smtp": "django.core.mail.backends.smtp.EmailBackend",
+    "file": "django.core.mail.backends.filebased.EmailBackend",
+}
+
+
+def run(*args):
+    """
+    Send the same emails one connection per message, as `send_mail` does, and through one dispatcher connection.
+    Point it at a local SMTP stand-in, e.g. `python -m aiosmtpd -n -l localhost:1025`, or use the file backend.
+
+    python manage.py runscript bench_email --script-args backend=smtp host=localhost port=1025 emails=1000 batch=100
+    """
+
+    options = dict(arg.split("=") for arg in args)
+    count = int(options.get("emails", 1000))
+    batch_size = int(options.get("batch", 100))
+    backend = options.get("backend", "file")
+
+    connection_kwargs = {"backend": BACKENDS.get(backend, backend)}
+    if backend == "file":
+        connection_kwargs["file_path"] = tempfile.mkdtemp(prefix="bench_email")
+    else:
+        connection_kwargs.update(
+            host=options.get("host", "localhost"),
+            port=int(options.get("port", 1025)),
+            use_ssl=False,
+            use_tls=False,
+        )
+
+    messages = [
+        EmailMessage(
+            f"Benchmark {index}",
+            "Your cargo has been booked and is ready for delivery.",
+            "agent@cargotracker.app",
+            [f"customer{index}@cargotracker.app"],
+        )
+        for index in range(count)
+    ]
+
+    start = time.perf_counter()
+    for message in messages:
+        get_connection(fail_silently=False, **connection_kwargs).send_messages([message])
+    per_message = time.perf_counter() - start
+
+    dispatcher = MailDispatcher(**connection_kwargs)
+    start = time.perf_counter()
+    for index in range(0, count, batch_size):
+        dispatcher.send_messages(messages[index : index + batch_size])
+    dispatcher.close()
+    batched = time.perf_counter() - start
+
+    print(f"{'method':<24} {'seconds':>10} {'emails/s':>10}")
+    for name, seconds in (("connection per email", per_message), ("dispatcher", batched)):
+        print(f"{name:<24} {seconds:>10.3f} {count / seconds:>10.0f}")
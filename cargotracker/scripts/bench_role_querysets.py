@@ -0,0 +1,117 @@
+"""This script benchmarks the "my cargo" and "my orders" querysets, OR-ed filters against the UNION of indexed lookups."""
+
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from cargotracker.UTILS import synthetic
+from cargo.models import Cargo
+from orders.models import Order
+
+
+def or_querysets(user, agent):
+    """
+    The querysets as they were before the UNION rewrite.
+    """
+
+    return {
+        "cargo for user": Cargo.objects.filter(Q(sender=user) | Q(recepient=user)),
+        "cargo for agent": Cargo.objects.filter(
+            Q(booking_agent=agent) | Q(clearing_agent=agent)
+        ),
+        "orders for user": Order.objects.filter(
+            Q(cargo__sender=user) | Q(cargo__recepient=user)
+        ),
+        "orders for agent": Order.objects.filter(
+            Q(cargo__booking_agent=agent) | Q(cargo__clearing_agent=agent)
+        ),
+    }
+
+
+def union_querysets(user, agent):
+    return {
+        "cargo for user": Cargo.objects.filter().all_cargo_for_user(user=user),
+        "cargo for agent": Cargo.objects.filter().cargo_handled_by_agent(agent=agent),
+        "orders for user": Order.objects.filter().for_user(user=user),
+        "orders for agent": Order.objects.filter().for_agent(agent=agent),
+    }
+
+
+def first_page(queryset):
+    """
+    The query a cursor paginated list runs for its first page.
+    """
+
+    return queryset.order_by("-id")[: settings.PAGE_SIZE]
+
+
+def time_page(queryset, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        list(first_page(queryset).values_list("id", flat=True))
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def run(*args):
+    """
+    Grow the cargo table step by step and compare the first page of each role queryset at every size, with the query plans.
+    EXPLAIN ANALYZE is used on Postgres. Everything is rolled back afterwards.
+
+    python manage.py runscript bench_role_querysets --script-args sizes=1000000,10000000 customers=100000 branches=50 samples=20 plans=true
+    """
+
+    options = dict(arg.split("=") for arg in args)
+    sizes = [
+        int(size) for size in options.get("sizes", "1000000,10000000").split(",")
+    ]
+    samples = int(options.get("samples", 20))
+    show_plans = options.get("plans", "true") == "true"
+    explain_options = {"analyze": True} if connection.vendor == "postgresql" else {}
+
+    with transaction.atomic():
+        tag = synthetic.new_tag()
+        customers = synthetic.create_users(
+            int(options.get("customers", 100000)), "customer", tag
+        )
+        branches = synthetic.create_branches(int(options.get("branches", 50)), tag)
+        agents = [agent for _, agent in branches]
+
+        for size in sorted(sizes):
+            missing = size - Cargo.objects.count()
+            if missing > 0:
+                synthetic.create_cargo(missing, customers, branches)
+                synthetic.create_orders(missing)
+            with connection.cursor() as cursor:
+                if connection.vendor == "postgresql":
+                    cursor.execute("ANALYZE")
+
+            print(f"\n{size} cargo")
+            print(f"{'queryset':<18} {'OR ms':>10} {'UNION ms':>10}")
+            users = random.sample(customers, samples)
+            sampled_agents = [random.choice(agents) for _ in range(samples)]
+            for name in union_querysets(None, None):
+                or_ms, union_ms = [], []
+                for user, agent in zip(users, sampled_agents):
+                    or_ms.append(time_page(or_querysets(user, agent)[name], 3))
+                    union_ms.append(time_page(union_querysets(user, agent)[name], 3))
+                print(
+                    f"{name:<18} {statistics.median(or_ms):>10.3f} "
+                    f"{statistics.median(union_ms):>10.3f}"
+                )
+
+            if show_plans:
+                for label, querysets in (
+                    ("OR", or_querysets(users[0], sampled_agents[0])),
+                    ("UNION", union_querysets(users[0], sampled_agents[0])),
+                ):
+                    for name, queryset in querysets.items():
+                        print(f"\n-- {label}: {name}")
+                        print(first_page(queryset).explain(**explain_options))
+
+        transaction.set_rollback(True)
@@ -0,0 +1,120 @@
+"""This script benchmarks the routing table of a hub and spoke network with thousands of branches."""
+
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.db import transaction
+
+from branches.models import Lane
+from branches.routing import (
+    TABLE_KEY,
+    build_routing_table,
+    invalidate_routes,
+    load_graph,
+    router,
+)
+from cargotracker.UTILS import synthetic
+from cargotracker.UTILS.redis_utils import get_redis_connection
+
+
+def create_network(branch_ids, cross_lanes):
+    """
+    Connect the first branch to regional hubs, and every other branch to one of the hubs, both ways. Add `cross_lanes` lanes between random branches.
+    """
+
+    main, *others = branch_ids
+    hubs = others[: max(int(len(others) ** 0.5), 1)]
+    pairs = {}
+    for hub in hubs:
+        pairs[(main, hub)] = pairs[(hub, main)] = random.randint(4, 12)
+    for index, branch in enumerate(others[len(hubs) :]):
+        hub = hubs[index % len(hubs)]
+        pairs[(hub, branch)] = pairs[(branch, hub)] = random.randint(1, 6)
+    while cross_lanes:
+        pair = tuple(random.sample(others, 2))
+        if pair not in pairs:
+            pairs[pair] = random.randint(2, 24)
+            cross_lanes -= 1
+
+    Lane.objects.bulk_create(
+        (
+            Lane(
+                origin_id=origin,
+                destination_id=destination,
+                transit_time=timedelta(hours=hours),
+                cost=hours * 2,
+            )
+            for (origin, destination), hours in pairs.items()
+        )
+    )
+    # bulk_create skips the signal that keeps the routes current
+    invalidate_routes()
+    return len(pairs)
+
+
+def time_lookups(pairs):
+    timings = []
+    for origin, destination in pairs:
+        start = time.perf_counter()
+        router.route(origin, destination)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return (
+        f"p50 {statistics.median(timings):.3f} ms, "
+        f"p99 {timings[int(len(timings) * 0.99)]:.3f} ms"
+    )
+
+
+def run(*args):
+    """
+    Create branches and lanes, build the routing table and time route lookups from memory, from Redis and computed on demand.
+    Needs Redis. Everything is rolled back afterwards and the routing table is dropped.
+
+    python manage.py runscript bench_routing --script-args branches=2000 cross_lanes=1000 lookups=2000
+    """
+
+    options = dict(arg.split("=") for arg in args)
+    lookups = int(options.get("lookups", 2000))
+
+    with transaction.atomic():
+        branches = synthetic.create_branches(
+            int(options.get("branches", 2000)), synthetic.new_tag()
+        )
+        branch_ids = [branch_id for branch_id, _ in branches]
+        lane_count = create_network(branch_ids, int(options.get("cross_lanes", 1000)))
+        pairs = [tuple(random.sample(branch_ids, 2)) for _ in range(lookups)]
+
+        start = time.perf_counter()
+        graph = load_graph(None)
+        print(f"{len(graph.ids)} branches, {lane_count} lanes")
+        print(f"lanes loaded in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        start = time.perf_counter()
+        graph.next_hops(0)
+        print(f"one row computed in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+        start = time.perf_counter()
+        rows = build_routing_table()
+        version = router.current_version()
+        size = sum(
+            len(row) for row in get_redis_connection().hvals(TABLE_KEY.format(version=version))
+        )
+        print(
+            f"table of {rows} rows built in {time.perf_counter() - start:.1f} s, "
+            f"{size / 2 ** 20:.1f} MiB"
+        )
+
+        router.invalidate()
+        print(f"lookups reading rows from Redis: {time_lookups(pairs)}")
+        print(f"lookups with rows in memory: {time_lookups(pairs)}")
+
+        get_redis_connection().delete(TABLE_KEY.format(version=version))
+        router.invalidate()
+        print(f"lookups computing rows: {time_lookups(pairs)}")
+
+        transaction.set_rollback(True)
+
+    invalidate_routes()
+    get_redis_connection().delete(TABLE_KEY.format(version=version))
@@ -0,0 +1,89 @@
+"""This script benchmarks the scan ingest endpoint with batches of thousands of scans."""
+
+import random
+import time
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from authentication.models import User
+from cargo.models import Cargo
+from orders.models import Order
+from cargotracker.UTILS import synthetic
+
+
+def generate_batch(cargo_ids, cities, size, now):
+    """
+    Return `size` scans of random cargo at random branches, a fifth of them deliveries.
+    """
+
+    return [
+        {
+            "cargo": random.choice(cargo_ids),
+            "event": random.choice(("arrived", "departed", "arrived", "departed", "delivered")),
+            "scanned_at": (now - timedelta(seconds=random.randrange(86400))).isoformat(),
+            "branch": random.choice(cities),
+        }
+        for _ in range(size)
+    ]
+
+
+def run(*args):
+    """
+    Create cargo with orders and post batches of scans for them as a superuser, then report the scans recorded per second.
+    Everything is rolled back afterwards.
+
+    python manage.py runscript bench_scan_ingest --script-args cargo=20000 batches=5 batch_size=10000
+    """
+
+    options = dict(arg.split("=") for arg in args)
+    batch_count = int(options.get("batches", 5))
+    batch_size = int(options.get("batch_size", 10000))
+
+    with transaction.atomic():
+        tag = synthetic.new_tag()
+        customer_ids = synthetic.create_users(20, "customer", tag)
+        branches = synthetic.create_branches(int(options.get("branches", 50)), tag)
+        # sqlite cannot insert thousands of rows in one statement
+        synthetic.create_cargo(
+            int(options.get("cargo", 20000)), customer_ids, branches, batch_size=500
+        )
+        synthetic.create_orders()
+        now = timezone.now()
+        # booked before any of the scans
+        Order.objects.update(created_at=now - timedelta(days=2))
+        admin_id = synthetic.create_users(1, "admin", tag, is_staff=True, is_superuser=True)[0]
+
+        cargo_ids = list(Cargo.objects.values_list("id", flat=True))
+        cities = list(
+            Cargo.objects.values_list("destination__city", flat=True).distinct()
+        )
+        payloads = [
+            {"events": generate_batch(cargo_ids, cities, batch_size, now)}
+            for _ in range(batch_count)
+        ]
+
+        client = APIClient()
+        client.force_authenticate(User.objects.get(id=admin_id))
+        url = reverse("cargo:ingest-scans")
+
+        recorded = 0
+        timings = []
+        for payload in payloads:
+            start = time.perf_counter()
+            response = client.post(url, payload, format="json")
+            timings.append(time.perf_counter() - start)
+            recorded += response.json()["data"]["recorded"]
+
+        elapsed = sum(timings)
+        print(f"{len(cargo_ids)} cargo, {len(cities)} branches on {connection.vendor}")
+        print(
+            f"{recorded} scans in {batch_count} requests of {batch_size}, "
+            f"{elapsed:.2f} s, {recorded / elapsed:.0f} scans/s, "
+            f"slowest request {max(timings) * 1000:.0f} ms"
+        )
+
+        transaction.set_rollback(True)
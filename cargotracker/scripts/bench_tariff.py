@@ -0,0 +1,74 @@
+"""This script benchmarks pricing orders one by one against the batch tariff engine."""
+
+import random
+import time
+from decimal import Decimal
+
+from django.db import transaction
+
+from cargotracker.UTILS import synthetic
+from orders.models import LaneSurcharge, WeightBand, load_tariff_engine
+
+
+def legacy_price(weight, price_per_unit_weight):
+    """
+    The original per-order formula, with its float tax rate.
+    """
+
+    untaxed_total = Decimal(weight) * Decimal(price_per_unit_weight)
+    return (untaxed_total * Decimal(0.18)) + untaxed_total
+
+
+def run(*args):
+    """
+    Price the same synthetic orders with the legacy formula, with one engine per order (as single bookings do) and with one batch. Everything is rolled back afterwards.
+
+    python manage.py runscript bench_tariff --script-args orders=100000 single=1000
+    """
+
+    options = dict(arg.split("=") for arg in args)
+    count = int(options.get("orders", 100000))
+    single = min(count, int(options.get("single", 1000)))
+
+    with transaction.atomic():
+        branches = [
+            branch for branch, _ in synthetic.create_branches(20, synthetic.new_tag())
+        ]
+        WeightBand.objects.bulk_create(
+            WeightBand(min_weight=weight, multiplier=Decimal(100 - index) / 100)
+            for index, weight in enumerate(range(0, 1000, 50))
+        )
+        LaneSurcharge.objects.bulk_create(
+            LaneSurcharge(origin_id=origin, destination_id=destination, surcharge=5)
+            for origin in branches
+            for destination in branches
+            if origin != destination
+        )
+
+        weights = [Decimal(random.randrange(50, 99999)) / 100 for _ in range(count)]
+        rates = [Decimal(random.randrange(100, 5000)) / 100 for _ in range(count)]
+        lanes = [tuple(random.sample(branches, 2)) for _ in range(count)]
+
+        start = time.perf_counter()
+        for weight, rate in zip(weights, rates):
+            legacy_price(weight, rate)
+        legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for weight, rate, lane in zip(weights[:single], rates[:single], lanes[:single]):
+            load_tariff_engine([lane]).price(weight, rate, lane)
+        per_order = (time.perf_counter() - start) * count / single
+
+        start = time.perf_counter()
+        load_tariff_engine(lanes).price_batch(weights, rates, lanes)
+        batch = time.perf_counter() - start
+
+        print(f"{'method':<28} {'seconds':>10} {'orders/s':>12}")
+        for name, seconds in (
+            ("legacy formula, no rules", legacy),
+            ("engine per order (est.)", per_order),
+            ("engine batch", batch),
+        ):
+            print(f"{name:<28} {seconds:>10.3f} {count / seconds:>12.0f}")
+
+        transaction.set_rollback(True)
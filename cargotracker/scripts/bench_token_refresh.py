@@ -0,0 +1,94 @@
+"""This script benchmarks token refresh as the token tables grow, with the blacklist checked in the database or in Redis."""
+
+import statistics
+import time
+
+from django.db import transaction
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from authentication.blacklist import (
+    load_blacklist,
+    purge_expired_tokens,
+    reset_blacklist,
+)
+from authentication.serializers import CachedTokenRefreshSerializer
+from cargotracker.UTILS import synthetic
+
+
+def time_refreshes(serializer_class, tokens):
+    """
+    Return the latency of each refresh in milliseconds.
+    """
+
+    timings = []
+    for token in tokens:
+        start = time.perf_counter()
+        serializer_class(data={"refresh": token}).is_valid(raise_exception=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summary(timings):
+    timings = sorted(timings)
+    return statistics.median(timings), timings[int(len(timings) * 0.95)]
+
+
+def run(*args):
+    """
+    Grow the outstanding token table step by step and time refreshes at every size, then time the purge of expired tokens.
+    Needs Redis. Everything is rolled back afterwards and the Redis copy of the blacklist is dropped, to be loaded again by the periodic task.
+
+    python manage.py runscript bench_token_refresh --script-args sizes=1000000,5000000 users=1000 blacklisted=0.3 expired=0.5 refreshes=500
+    """
+
+    options = dict(arg.split("=") for arg in args)
+    sizes = [
+        int(size) for size in options.get("sizes", "1000000,5000000").split(",")
+    ]
+    refreshes = int(options.get("refreshes", 500))
+
+    with transaction.atomic():
+        tag = synthetic.new_tag()
+        user_ids = synthetic.create_users(
+            int(options.get("users", 1000)), "customer", tag
+        )
+        users = list(synthetic.User.objects.filter(id__in=user_ids[:refreshes]))
+        tokens = [
+            str(RefreshToken.for_user(users[index % len(users)]))
+            for index in range(refreshes)
+        ]
+
+        print(
+            f"{'tokens':>10} {'db p50':>9} {'db p95':>9} "
+            f"{'redis p50':>10} {'redis p95':>10} {'load s':>8}"
+        )
+        for size in sorted(sizes):
+            missing = size - OutstandingToken.objects.count()
+            if missing > 0:
+                synthetic.create_outstanding_tokens(
+                    missing,
+                    user_ids,
+                    f"{tag}{size}",
+                    blacklisted=float(options.get("blacklisted", 0.3)),
+                    expired=float(options.get("expired", 0.5)),
+                )
+
+            reset_blacklist()
+            database = summary(time_refreshes(TokenRefreshSerializer, tokens))
+            start = time.perf_counter()
+            load_blacklist()
+            load_seconds = time.perf_counter() - start
+            redis = summary(time_refreshes(CachedTokenRefreshSerializer, tokens))
+            print(
+                f"{size:>10} {database[0]:>9.3f} {database[1]:>9.3f} "
+                f"{redis[0]:>10.3f} {redis[1]:>10.3f} {load_seconds:>8.2f}"
+            )
+
+        start = time.perf_counter()
+        purged = purge_expired_tokens()
+        print(f"\nPurged {purged} expired tokens in {time.perf_counter() - start:.2f}s")
+
+        reset_blacklist()
+        transaction.set_rollback(True)
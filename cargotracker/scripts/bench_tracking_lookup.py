@@ -0,0 +1,57 @@
+"""This script benchmarks order lookups by tracking id as the orders table grows."""
+
+import random
+import statistics
+import time
+
+from django.db import transaction
+
+from cargotracker.UTILS import synthetic
+from orders.models import Order
+
+
+def time_lookups(queryset, tracking_ids):
+    """
+    Return the latency of each lookup in milliseconds.
+    """
+
+    timings = []
+    for tracking_id in tracking_ids:
+        start = time.perf_counter()
+        queryset.get(tracking_id=tracking_id)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def run(*args):
+    """
+    Grow the orders table step by step and time detail lookups at every size. Everything is rolled back afterwards.
+
+    python manage.py runscript bench_tracking_lookup --script-args sizes=1000,10000,100000 lookups=500
+    """
+
+    options = dict(arg.split("=") for arg in args)
+    sizes = [int(size) for size in options.get("sizes", "1000,10000,100000").split(",")]
+    lookups = int(options.get("lookups", 500))
+
+    with transaction.atomic():
+        tag = synthetic.new_tag()
+        customers = synthetic.create_users(100, "customer", tag)
+        branches = synthetic.create_branches(10, tag)
+        queryset = Order.objects.filter().with_cargo_details()
+
+        print(f"{'orders':>10} {'p50 ms':>8} {'p95 ms':>8}")
+        for size in sorted(sizes):
+            missing = size - Order.objects.count()
+            if missing > 0:
+                synthetic.create_cargo(missing, customers, branches)
+                synthetic.create_orders(missing)
+
+            tracking_ids = random.sample(
+                list(Order.objects.values_list("tracking_id", flat=True)), lookups
+            )
+            timings = time_lookups(queryset, tracking_ids)
+            p95 = statistics.quantiles(timings, n=20)[-1]
+            print(f"{size:>10} {statistics.median(timings):>8.3f} {p95:>8.3f}")
+
+        transaction.set_rollback(True)